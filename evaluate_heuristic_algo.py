@@ -24,16 +24,16 @@ def evluate(args):
 
     if args.scenario == "Number":
         if args.goal == "LO":
-            evaluate_different_number(graph_paths_test_for_number, lambda_t=1.0, lambda_e=0.0, logpath=logpath)
+            evaluate_different_number(graph_paths_test_for_number, lambda_t=1.0, lambda_e=0.0, logpath=logpath, workers=args.workers)
         elif args.goal == "EE":
-            evaluate_different_number(graph_paths_test_for_number, lambda_t=0.5, lambda_e=0.5, logpath=logpath)
+            evaluate_different_number(graph_paths_test_for_number, lambda_t=0.5, lambda_e=0.5, logpath=logpath, workers=args.workers)
     elif args.scenario == "Trans":
         if args.goal == "LO":
             evaluate_different_trans(graph_paths_test_for_trans, lambda_t=1.0,
-                                     lambda_e=0.0, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],logpath=logpath)
+                                     lambda_e=0.0, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],logpath=logpath, workers=args.workers)
         elif args.goal == "EE":
             evaluate_different_trans(graph_paths_test_for_trans, lambda_t=0.5,
-                                     lambda_e=0.5, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],logpath=logpath)
+                                     lambda_e=0.5, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],logpath=logpath, workers=args.workers)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -41,6 +41,7 @@ if __name__ == "__main__":
     parser.add_argument("--scenario", type=str, default="Trans", choices=["Number", "Trans"])
     parser.add_argument("--goal", type=str, default="LO", choices=["EE", "LO"])
     parser.add_argument("--logpath", type=str, default="./log")
+    parser.add_argument("--workers", type=int, default=1)
     args = parser.parse_args()
 
     evluate(args)
\ No newline at end of file
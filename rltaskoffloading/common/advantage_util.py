@@ -0,0 +1,83 @@
+import numpy as np
+
+# the triangular discount matrices are only used up to this length, longer sequences are scanned.
+MAX_MATRIX_LENGTH = 512
+
+_discount_matrices = {}
+
+
+def discount_matrix(length, discount):
+    """
+    Lower triangular (length, length) matrix with discount ** (k - t) at [k, t] for k >= t, so that
+    x @ discount_matrix(T, discount) is the reverse discounted cumulative sum of every row of x.
+    """
+    key = (length, discount)
+    matrix = _discount_matrices.get(key)
+    if matrix is None:
+        index = np.arange(length)
+        power = index[:, np.newaxis] - index[np.newaxis, :]
+        matrix = np.tril(discount ** np.maximum(power, 0).astype(np.float64))
+        matrix.setflags(write=False)
+        _discount_matrices[key] = matrix
+    return matrix
+
+
+def discount_cumsum(x, discount):
+    """
+    Reverse discounted cumulative sum along the last axis,
+    y[..., t] = x[..., t] + discount * x[..., t + 1] + discount ** 2 * x[..., t + 2] + ...
+    """
+    x = np.asarray(x, dtype=np.float64)
+    length = x.shape[-1]
+    if length <= MAX_MATRIX_LENGTH:
+        return x @ discount_matrix(length, discount)
+
+    y = np.empty_like(x)
+    running_sum = np.zeros(x.shape[:-1])
+    for t in reversed(range(length)):
+        running_sum = x[..., t] + discount * running_sum
+        y[..., t] = running_sum
+    return y
+
+
+def gae_advantages(rewards, values, gamma, lam, masks=None):
+    """
+    Generalized advantage estimation of a whole (episodes, T) rollout in one pass.
+
+    rewards, values: (episodes, T) rewards and value predictions, one episode per row.
+    masks: optional (episodes, T) 1 for the real steps of each episode and 0 for the padding
+        after it. Every episode ends in its last real step, the value after it is taken as 0.
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if masks is not None:
+        masks = np.asarray(masks, dtype=np.float64)
+        values = values * masks
+
+    next_values = np.zeros_like(values)
+    next_values[:, :-1] = values[:, 1:]
+    deltas = rewards + gamma * next_values - values
+    if masks is not None:
+        deltas *= masks
+
+    return discount_cumsum(deltas, gamma * lam)
+
+
+def value_targets(advantages, values, masks=None):
+    """
+    The value targets of the PPO runner, the advantage of a step plus the value of the next step,
+    returns[:, t] = values[:, t + 1] + advantages[:, t], with 0 after the last step of each episode.
+
+    masks: optional (episodes, T) as in gae_advantages, the targets are 0 in the padding.
+    """
+    advantages = np.asarray(advantages, dtype=np.float64)
+    next_values = np.zeros_like(advantages)
+    next_values[:, :-1] = values[:, 1:]
+    if masks is not None:
+        masks = np.asarray(masks, dtype=np.float64)
+        next_values[:, :-1] *= masks[:, 1:]
+
+    returns = next_values + advantages
+    if masks is not None:
+        returns *= masks
+    return returns
@@ -1,3 +1,4 @@
+import argparse
 import gym
 import numpy as np
 import os
@@ -170,6 +171,17 @@ def boolean_flag(parser, name, default=False, help=None):
     parser.add_argument("--no-" + name, action="store_false", dest=dest)
 
 
+def str2bool(value):
+    """argparse type for a boolean given as a word, e.g. --dependency False. type=bool would
+    take any non empty string, "False" too, as True.
+    """
+    if value.lower() in ('true', 't', 'yes', 'y', '1'):
+        return True
+    if value.lower() in ('false', 'f', 'no', 'n', '0'):
+        return False
+    raise argparse.ArgumentTypeError("Boolean value expected, got {}".format(value))
+
+
 def get_wrapper_by_name(env, classname):
     """Given an a gym environment possibly wrapped multiple times, returns a wrapper
     of class named classname or raises ValueError if no such wrapper was applied
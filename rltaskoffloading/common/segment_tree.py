@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class SumSegmentTree(object):
+    def __init__(self, capacity):
+        """Sum segment tree over capacity priorities, stored as an array.
+
+        Unlike a per element tree every operation takes a whole batch of indices, the updates are
+        propagated level by level and the prefix sums are searched for the whole batch at once, so
+        a minibatch costs O(log(capacity)) numpy operations rather than python loops.
+
+        Parameters
+        ---------
+        capacity: int
+            Number of leaves, rounded up to a power of two. The leaves past capacity stay 0 and are
+            never found by find_prefixsum_idx.
+        """
+        self._capacity = 1
+        while self._capacity < capacity:
+            self._capacity *= 2
+        self._depth = int(np.log2(self._capacity))
+        self._value = np.zeros(2 * self._capacity, dtype=np.float64)
+
+    def __getitem__(self, idx):
+        return self._value[self._capacity + np.asarray(idx)]
+
+    def __setitem__(self, idx, val):
+        """Set the leaves idx to val and update their ancestors. Of repeated indices the last value is kept."""
+        nodes = self._capacity + np.asarray(idx, dtype=np.int64).ravel()
+        self._value[nodes] = np.broadcast_to(val, np.shape(idx)).ravel()
+        for _ in range(self._depth):
+            nodes = np.unique(nodes // 2)
+            self._value[nodes] = self._value[2 * nodes] + self._value[2 * nodes + 1]
+
+    def sum(self):
+        return self._value[1]
+
+    def find_prefixsum_idx(self, prefixsum):
+        """Find for every prefixsum the highest index i with sum(arr[:i]) <= prefixsum.
+
+        Parameters
+        ----------
+        prefixsum: np.array
+            upperbounds on the sum of the array prefixes, in [0, sum())
+
+        Returns
+        -------
+        idx: np.array
+            the leaf index of every prefixsum
+        """
+        prefixsum = np.array(prefixsum, dtype=np.float64)
+        nodes = np.ones(len(prefixsum), dtype=np.int64)
+        for _ in range(self._depth):
+            left = self._value[2 * nodes]
+            go_right = prefixsum >= left
+            prefixsum -= left * go_right
+            nodes = 2 * nodes + go_right
+        return nodes - self._capacity
@@ -0,0 +1,102 @@
+import numpy as np
+
+from rltaskoffloading.environment.offloading_env import OffloadingEnvironment
+
+"""
+Length bucketed batches of the task graphs of an OffloadingEnvironment.
+
+Padding a batch of 10 task graphs to the 50 tasks of the largest graph wastes most of the decoder
+steps. The sampler groups the graphs of similar task numbers into buckets and forms the batches of
+every bucket by a budget of padded task steps rather than a fixed number of graphs, so a batch of
+small graphs holds more graphs than a batch of large ones.
+"""
+
+
+class LengthBucketedBatchSampler(object):
+    def __init__(self, env, token_budget, bucket_boundaries=None, seed=0):
+        """ Batches of the graphs of env with at most token_budget padded task steps each.
+
+        bucket_boundaries are the increasing largest task numbers of the buckets, every graph goes
+        into the first bucket it fits. By default every task number has its own bucket. A graph
+        larger than token_budget still gets a batch of its own.
+
+        After every resample() the batches are in the attributes of the environment the Runner reads,
+        task_graphs, encoder_batchs, encoder_lengths, decoder_full_lengths, reward_masks,
+        max_running_time_batchs and min_running_time_batchs, and graph_indices holds the indices of
+        the graphs of every batch in the flat order of env.task_graphs.
+        """
+        self.token_budget = token_budget
+        self.rng = np.random.RandomState(seed)
+
+        self.graphs = []
+        self.encodings = []
+        self.max_running_times = []
+        self.min_running_times = []
+        for task_graph_batch, encoder_batch, encoder_length, max_running_time_batch, min_running_time_batch in \
+                zip(env.task_graphs, env.encoder_batchs, env.encoder_lengths,
+                    env.max_running_time_batchs, env.min_running_time_batchs):
+            # the encoder batches are batch major, as for the Runner.
+            for task_graph, encoding, length in zip(task_graph_batch, np.asarray(encoder_batch), encoder_length):
+                self.graphs.append(task_graph)
+                self.encodings.append(encoding[:length])
+            self.max_running_times += list(max_running_time_batch)
+            self.min_running_times += list(min_running_time_batch)
+        self.lengths = np.array([len(encoding) for encoding in self.encodings])
+
+        if bucket_boundaries is None:
+            bucket_boundaries = np.unique(self.lengths)
+        bucket_index = np.searchsorted(np.asarray(bucket_boundaries), self.lengths)
+        self.buckets = [np.flatnonzero(bucket_index == i) for i in np.unique(bucket_index)]
+
+        self.graph_indices = []
+        self.resample()
+
+    def sample_graph_indices(self):
+        """ The graph indices of the batches of one update, shuffled within and across the buckets. """
+        batchs = []
+        for bucket in self.buckets:
+            batch = []
+            max_length = 0
+            for graph_index in self.rng.permutation(bucket):
+                length = self.lengths[graph_index]
+                if batch and (len(batch) + 1) * max(max_length, length) > self.token_budget:
+                    batchs.append(np.array(batch))
+                    batch = []
+                    max_length = 0
+                batch.append(graph_index)
+                max_length = max(max_length, length)
+            if batch:
+                batchs.append(np.array(batch))
+
+        order = self.rng.permutation(len(batchs))
+        return [batchs[i] for i in order]
+
+    def resample(self):
+        self.graph_indices = self.sample_graph_indices()
+
+        self.task_graphs = []
+        self.encoder_batchs = []
+        self.encoder_lengths = []
+        self.decoder_full_lengths = []
+        self.reward_masks = []
+        self.max_running_time_batchs = []
+        self.min_running_time_batchs = []
+        for graph_indices in self.graph_indices:
+            lengths = self.lengths[graph_indices]
+            encoder_batch = np.zeros((len(graph_indices), max(lengths), self.encodings[0].shape[-1]),
+                                     dtype=self.encodings[0].dtype)
+            for row, graph_index in zip(encoder_batch, graph_indices):
+                row[:self.lengths[graph_index]] = self.encodings[graph_index]
+
+            self.task_graphs.append([self.graphs[i] for i in graph_indices])
+            self.encoder_batchs.append(encoder_batch)
+            self.encoder_lengths.append(lengths)
+            self.decoder_full_lengths.append(lengths)
+            self.reward_masks.append(OffloadingEnvironment.sequence_mask(lengths, max(lengths)))
+            self.max_running_time_batchs.append([self.max_running_times[i] for i in graph_indices])
+            self.min_running_time_batchs.append([self.min_running_times[i] for i in graph_indices])
+
+    def padding_efficiency(self):
+        """ The fraction of the task steps of the current batches which are not padding. """
+        padded_steps = sum(len(graph_indices) * max(self.lengths[graph_indices]) for graph_indices in self.graph_indices)
+        return np.sum(self.lengths) / float(padded_steps)
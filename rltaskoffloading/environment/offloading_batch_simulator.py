@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def stack_task_graph_batch(task_graph_batch):
+    """ Stack the array form of a batch of task graphs.
+
+    Graphs with less tasks than the largest one are padded with tasks of no cost and no
+    predecessors, scheduled after all their real tasks at the unused task ids. A padded task never
+    changes the makespan nor the energy consumption of the plan, whatever its action.
+
+    Returns the prioritize sequences (batch, n), the padded predecessor ids (batch, n, max_pre),
+    the processing data sizes (batch, n) and the transmission data sizes (batch, n).
+    """
+    batch_size = len(task_graph_batch)
+    task_number = max(task_graph.task_number for task_graph in task_graph_batch)
+    max_pre_task_number = max(task_graph.pre_task_index.shape[1] for task_graph in task_graph_batch)
+
+    sequence_batch = np.tile(np.arange(task_number, dtype=np.int64), (batch_size, 1))
+    pre_task_index_batch = np.full((batch_size, task_number, max_pre_task_number), -1, dtype=np.int64)
+    processing_data_size_batch = np.zeros((batch_size, task_number), dtype=np.float64)
+    transmission_data_size_batch = np.zeros((batch_size, task_number), dtype=np.float64)
+
+    for b, task_graph in enumerate(task_graph_batch):
+        pre_task_index = task_graph.pre_task_index
+        graph_task_number = task_graph.task_number
+        sequence_batch[b, :graph_task_number] = task_graph.prioritize_sequence
+        pre_task_index_batch[b, :graph_task_number, :pre_task_index.shape[1]] = pre_task_index
+        processing_data_size_batch[b, :graph_task_number] = task_graph.processing_data_sizes
+        transmission_data_size_batch[b, :graph_task_number] = task_graph.transmission_data_sizes
+
+    return sequence_batch, pre_task_index_batch, processing_data_size_batch, transmission_data_size_batch
+
+
+def stack_padded(arrays, length):
+    """ Stack 1-D arrays of at most length values, padded with zeros. """
+    stacked = np.zeros((len(arrays), length), dtype=np.float64)
+    for b, array in enumerate(arrays):
+        stacked[b, :len(array)] = array
+    return stacked
+
+
+def simulate_plan_batch(action_batch, sequence_batch, pre_task_index_batch,
+                        local_cost_batch, up_cost_batch, mec_cost_batch, dl_cost_batch,
+                        local_energy_batch, mec_energy_batch):
+    """ Simulate a batch of offloading plans in lockstep.
+
+    This is the vectorized form of OffloadingEnvironment.get_scheduling_cost_step_by_step and
+    returns exactly the same values for every plan in the batch. The plans of graphs padded by
+    stack_task_graph_batch get 0 latency and energy in their padded steps.
+
+    Parameters
+    ----------
+    action_batch: (batch, n) actions in scheduling order, 0 is local and 1 is MEC.
+    sequence_batch: (batch, n) task ids in scheduling order.
+    pre_task_index_batch: (batch, n, max_pre) predecessor ids of each task id padded with -1.
+    local_cost_batch, up_cost_batch, mec_cost_batch, dl_cost_batch: (batch, n) per task id running
+        time locally, on the up link, on the MEC server and on the down link.
+    local_energy_batch, mec_energy_batch: (batch, n) per task id energy consumption when it runs
+        locally and when it is offloaded.
+
+    Returns
+    -------
+    latency: (batch, n) per step makespan increase.
+    energy: (batch, n) per step energy consumption.
+    finish_time: (batch,) makespan of each plan.
+    total_energy: (batch,) energy consumption of each plan.
+    """
+    action_batch = np.asarray(action_batch)
+    sequence_batch = np.asarray(sequence_batch)
+    batch_size, task_number = sequence_batch.shape
+    rows = np.arange(batch_size)
+
+    # the finish time arrays are kept flat with one extra column per plan, padded predecessors
+    # point at that column which always keeps the finish time 0.
+    width = task_number + 1
+    has_pre_task = (pre_task_index_batch >= 0).any(axis=-1)
+    pre_task_index_batch = np.where(pre_task_index_batch < 0, task_number, pre_task_index_batch) + \
+                           (rows * width)[:, np.newaxis, np.newaxis]
+    task_index_batch = sequence_batch + (rows * width)[:, np.newaxis]
+    cost_index_batch = sequence_batch + (rows * task_number)[:, np.newaxis]
+
+    local_cost_batch = np.ravel(local_cost_batch)
+    up_cost_batch = np.ravel(up_cost_batch)
+    mec_cost_batch = np.ravel(mec_cost_batch)
+    dl_cost_batch = np.ravel(dl_cost_batch)
+    local_energy_batch = np.ravel(local_energy_batch)
+    mec_energy_batch = np.ravel(mec_energy_batch)
+
+    FT_locally = np.zeros(batch_size * width)
+    FT_ws = np.zeros(batch_size * width)
+    FT_cloud = np.zeros(batch_size * width)
+    FT_wr = np.zeros(batch_size * width)
+
+    local_avaliable_time = np.zeros(batch_size)
+    ws_avaliable_time = np.zeros(batch_size)
+    cloud_avaliable_time = np.zeros(batch_size)
+    current_FT = np.zeros(batch_size)
+    total_energy = np.zeros(batch_size)
+
+    return_latency = np.empty((batch_size, task_number))
+    return_energy = np.empty((batch_size, task_number))
+
+    for step in range(task_number):
+        task_index = task_index_batch[:, step]
+        cost_index = cost_index_batch[:, step]
+        is_local = action_batch[:, step] == 0
+        is_mec = ~is_local
+        pre_task_index = pre_task_index_batch[rows, sequence_batch[:, step]]
+        pre_FT_locally = FT_locally.take(pre_task_index)
+
+        # locally scheduling
+        local_start_time = np.maximum(local_avaliable_time,
+                                      np.maximum(pre_FT_locally, FT_wr.take(pre_task_index)).max(axis=1))
+        local_finish_time = local_start_time + local_cost_batch.take(cost_index)
+
+        # mec scheduling
+        ws_start_time = np.maximum(ws_avaliable_time,
+                                   np.maximum(pre_FT_locally, FT_ws.take(pre_task_index)).max(axis=1))
+        ws_finish_time = ws_start_time + up_cost_batch.take(cost_index)
+        cloud_start_time = np.maximum(cloud_avaliable_time,
+                                      np.maximum(ws_finish_time, FT_cloud.take(pre_task_index).max(axis=1)))
+        cloud_finish_time = cloud_start_time + mec_cost_batch.take(cost_index)
+        wr_finish_time = cloud_finish_time + dl_cost_batch.take(cost_index)
+
+        # only one of the local and the remote finish times of a task is set, the other stays 0.
+        FT_locally.put(task_index, np.where(is_local, local_finish_time, 0.0))
+        FT_ws.put(task_index, np.where(is_mec, ws_finish_time, 0.0))
+        FT_cloud.put(task_index, np.where(is_mec, cloud_finish_time, 0.0))
+        FT_wr.put(task_index, np.where(is_mec, wr_finish_time, 0.0))
+
+        local_avaliable_time = np.where(is_local, local_finish_time, local_avaliable_time)
+        cloud_avaliable_time = np.where(is_mec, cloud_finish_time, cloud_avaliable_time)
+        # the sending channel is only occupied by offloaded tasks with predecessors, as in the scalar path.
+        ws_avaliable_time = np.where(is_mec & has_pre_task[rows, sequence_batch[:, step]],
+                                     ws_finish_time, ws_avaliable_time)
+
+        task_finish_time = np.where(is_local, local_finish_time, wr_finish_time)
+        energy_consumption = np.where(is_local, local_energy_batch.take(cost_index), mec_energy_batch.take(cost_index))
+
+        total_energy += energy_consumption
+        next_FT = np.maximum(task_finish_time, current_FT)
+        return_latency[:, step] = next_FT - current_FT
+        return_energy[:, step] = energy_consumption
+        current_FT = next_FT
+
+    return return_latency, return_energy, current_FT, total_energy
+
+
+def simulate_task_graph_batch(action_batch, task_graph_batch, cost_tables):
+    """ simulate_plan_batch of the plans of a batch of task graphs with their OffloadingCostTable.
+
+    The graphs can have different task numbers, see stack_task_graph_batch.
+    """
+    sequence_batch, pre_task_index_batch, _, _ = stack_task_graph_batch(task_graph_batch)
+    task_number = sequence_batch.shape[1]
+
+    return simulate_plan_batch(action_batch, sequence_batch, pre_task_index_batch,
+                               local_cost_batch=stack_padded([table.local_cost for table in cost_tables], task_number),
+                               up_cost_batch=stack_padded([table.up_cost for table in cost_tables], task_number),
+                               mec_cost_batch=stack_padded([table.mec_cost for table in cost_tables], task_number),
+                               dl_cost_batch=stack_padded([table.dl_cost for table in cost_tables], task_number),
+                               local_energy_batch=stack_padded([table.local_energy for table in cost_tables], task_number),
+                               mec_energy_batch=stack_padded([table.mec_energy for table in cost_tables], task_number))
@@ -2,6 +2,10 @@ import numpy as np
 import os
 
 from rltaskoffloading.environment.offloading_task_graph import OffloadingTaskGraph
+from rltaskoffloading.environment.offloading_graph_cache import load_graph_dataset
+from rltaskoffloading.environment.offloading_batch_simulator import simulate_task_graph_batch
+from rltaskoffloading.environment.offloading_optimal_solver import OptimalPlanSolver, QoEObjective, \
+    makespan_objective, energy_objective, solve_optimal_plans_batch
 """
 System bandwidth B 20MHz
 UE Bandwidth W 1 MHz
@@ -71,14 +75,57 @@ class Resources(object):
 
         return computation_time
 
+    def signature(self):
+        # the parameters the running costs depend on, the cost tables are kept per signature.
+        return self.mec_process_capble, self.mobile_process_capable, self.bandwith_up, self.bandwith_dl
+
+
+class OffloadingCostTable(object):
+    """ Per task running time on the local processor, the sending channel, the MEC server and the
+    receiving channel, and the local and offloading energy consumption of one task graph.
+
+    The latency and energy consumption of running the whole graph locally are filled in by
+    OffloadingEnvironment.get_all_local_cost_batch on first use.
+    """
+    __slots__ = ('local_cost', 'up_cost', 'mec_cost', 'dl_cost', 'local_energy', 'mec_energy',
+                 'all_local_time', 'all_local_energy')
+
+    def __init__(self, task_graph, resource_cluster, rho, f_l, zeta, ptx, prx):
+        self.local_cost = resource_cluster.locally_execution_cost(task_graph.processing_data_sizes)
+        self.up_cost = resource_cluster.up_transmission_cost(task_graph.processing_data_sizes)
+        self.mec_cost = resource_cluster.mec_execution_cost(task_graph.processing_data_sizes)
+        self.dl_cost = resource_cluster.dl_transmission_cost(task_graph.transmission_data_sizes)
+        self.local_energy = self.local_cost * rho * (f_l ** zeta)
+        self.mec_energy = self.up_cost * ptx + self.dl_cost * prx
+        self.all_local_time = None
+        self.all_local_energy = None
+
+        for array in (self.local_cost, self.up_cost, self.mec_cost, self.dl_cost, self.local_energy, self.mec_energy):
+            array.setflags(write=False)
+
 
 class OffloadingEnvironment(object):
-    def __init__(self, resource_cluster, batch_size, graph_number, graph_file_paths, time_major, lambda_t=1.0, lambda_e=0.0, encode_dependencies=True):
+    def __init__(self, resource_cluster, batch_size, graph_number, graph_file_paths, time_major, lambda_t=1.0, lambda_e=0.0, encode_dependencies=True,
+                 shard_index=0, shard_number=1, mix_graph_sizes=False):
+        # with shard_number > 1, e.g. one shard per MPI rank, every batch only keeps the shard_index-th
+        # of shard_number disjoint parts of its graphs, and the other graphs are not loaded.
+        if batch_size < shard_number:
+            raise ValueError("Cannot split batches of {} graphs into {} shards".format(batch_size, shard_number))
+        self.batch_size = batch_size
+        self.shard_index = shard_index
+        self.shard_number = shard_number
+
+        # with mix_graph_sizes the graphs of all the graph_file_paths are shuffled together into
+        # batches of different task numbers, padded to the largest graph of each batch. Otherwise
+        # every batch holds graphs of one dataset.
+        self.mix_graph_sizes = mix_graph_sizes
+
         self.resource_cluster = resource_cluster
         self.task_graphs = []
         self.encoder_batchs = []
         self.encoder_lengths = []
         self.decoder_full_lengths = []
+        self.reward_masks = []
         self.max_running_time_batchs = []
         self.min_running_time_batchs = []
         self.optimal_solution = -1
@@ -93,11 +140,29 @@ class OffloadingEnvironment(object):
         self.optimal_qoe_latency = -1
         self.encode_dependencies = encode_dependencies
 
+        # these 3 parameters are used to calculate the processing energy consumption
+        self.rho = 1.25 * 10 ** -26
+        self.f_l = 0.8 * 10 ** 9
+        self.zeta = 3
 
-        for graph_file_path in graph_file_paths:
-            encoder_batchs, encoder_lengths, task_graph_batchs, decoder_full_lengths, max_running_time_batchs, min_running_time_batchs = \
-                self.generate_point_batch_for_random_graphs(batch_size, graph_number, graph_file_path, time_major)
+        # these 2 parameters are used to calculate the transmission energy consumption
+        self.ptx = 1.258
+        self.prx = 1.181
+
+        # per graph cost tables of the current resource cluster, see get_cost_table.
+        self.cost_tables = {}
+        self.cost_table_signature = None
+
+        if mix_graph_sizes:
+            point_batchs = [self.generate_point_batch_for_mixed_graphs(batch_size, graph_number, graph_file_paths,
+                                                                       time_major)]
+        else:
+            point_batchs = [self.generate_point_batch_for_random_graphs(batch_size, graph_number, graph_file_path,
+                                                                        time_major)
+                            for graph_file_path in graph_file_paths]
 
+        for encoder_batchs, encoder_lengths, task_graph_batchs, decoder_full_lengths, max_running_time_batchs, min_running_time_batchs \
+                in point_batchs:
             self.encoder_batchs += encoder_batchs
             self.encoder_lengths += encoder_lengths
             self.task_graphs += task_graph_batchs
@@ -105,45 +170,68 @@ class OffloadingEnvironment(object):
             self.max_running_time_batchs += max_running_time_batchs
             self.min_running_time_batchs += min_running_time_batchs
 
-        self.input_dim = np.array(encoder_batchs[0]).shape[-1]
-        self.start_symbol = 0
-
-        # these 3 parameters are used to calculate the processing energy consumption
-        self.rho = 1.25 * 10 ** -26
-        self.f_l = 0.8 * 10 ** 9
-        self.zeta = 3
+        # batch major masks of the real steps of every batch, the rewards of the padded steps are 0.
+        for decoder_full_length in self.decoder_full_lengths:
+            self.reward_masks.append(self.sequence_mask(decoder_full_length, max(decoder_full_length)))
 
-        # these 2 parameters are used to calculate the transmission energy consumption
-        self.ptx = 1.258
-        self.prx = 1.181
+        self.input_dim = np.array(self.encoder_batchs[0]).shape[-1]
+        self.start_symbol = 0
 
         # control the trade off between latency and energy consumption
         self.lambda_t = lambda_t
         self.lambda_e = lambda_e
 
+        # the all local baseline normalizes every reward, simulate it once per graph up front.
+        for task_graph_batch in self.task_graphs:
+            self.get_all_local_cost_batch(task_graph_batch)
+
         self.all_locally_execute, self.all_locally_energy = self.get_all_locally_execute_time()
         self.all_mec_execute, self.all_mec_energy = self.get_all_mec_execute_time()
 
-    def calculate_optimal_solution(self):
-        def exhaustion_plans(n):
-            plan_batch = []
-
-            for i in range(2**n):
-                plan_str = bin(i)
-                plan = []
-
-                for x in plan_str[2:]:
-                    plan.append(int(x))
-
-                while len(plan) < n:
-                    plan.insert(0, 0)
-                plan_batch.append(plan)
-            return plan_batch
-
-        n = self.task_graphs[0][0].task_number
-        plan_batch = exhaustion_plans(n)
+    def get_cost_table(self, task_graph):
+        """ The OffloadingCostTable of a task graph, computed once per resource cluster configuration.
+
+        The tables are dropped when the signature of the resource cluster changes, e.g. the bandwidth.
+        """
+        signature = self.resource_cluster.signature()
+        if signature != self.cost_table_signature:
+            self.cost_tables = {}
+            self.cost_table_signature = signature
+
+        # the task graph is kept with its table, so its id is not reused while the entry lives.
+        # the ids of a copied environment refer to the original graphs, hence the identity check.
+        entry = self.cost_tables.get(id(task_graph))
+        if entry is None or entry[0] is not task_graph:
+            entry = (task_graph, OffloadingCostTable(task_graph, self.resource_cluster,
+                                                     rho=self.rho, f_l=self.f_l, zeta=self.zeta,
+                                                     ptx=self.ptx, prx=self.prx))
+            self.cost_tables[id(task_graph)] = entry
+        return entry[1]
+
+    def solve_optimal_plans(self, objectives_batches, solver="exhaustion", workers=None):
+        """ Optimal plans of all the task graphs.
+
+        objectives_batches[b][g] is the list of (objective, weights) pairs of self.task_graphs[b][g].
+        solver is "exhaustion" to evaluate all the 2^n plans or "branch_and_bound" for the exact pruned
+        search, see OptimalPlanSolver, and workers > 1 spreads the graphs over a process pool.
+        Returns (plan, value, makespan, energy) per objective with the nesting of objectives_batches.
+        """
+        plan_solvers = [OptimalPlanSolver(task_graph, self.get_cost_table(task_graph))
+                        for task_graph_batch in self.task_graphs for task_graph in task_graph_batch]
+        objectives_list = [objectives for objectives_batch in objectives_batches for objectives in objectives_batch]
+        results = solve_optimal_plans_batch(plan_solvers, objectives_list, solver=solver, workers=workers)
+
+        results_batches = []
+        for task_graph_batch in self.task_graphs:
+            results_batches.append(results[:len(task_graph_batch)])
+            results = results[len(task_graph_batch):]
+        return results_batches
 
-        print("exhausted plan size: ", len(plan_batch))
+    def calculate_optimal_solution(self, solver="exhaustion", workers=None):
+        # solver is "exhaustion" to evaluate all the 2^n plans, or "branch_and_bound" for the exact pruned search.
+        # workers > 1 solves the task graphs in that many processes.
+        if solver == "exhaustion":
+            print("exhausted plan size: ", 2 ** self.task_graphs[0][0].task_number)
 
         task_graph_optimal_costs = []
         task_graph_optimal_energys = []
@@ -152,29 +240,17 @@ class OffloadingEnvironment(object):
         task_graph_optimal_makespan_energy= []
         optimal_plan_e = []
 
+        objectives = [(makespan_objective, (1.0, 0.0)), (energy_objective, (0.0, 1.0))]
+        results_batches = self.solve_optimal_plans([[objectives] * len(task_graph_batch)
+                                                    for task_graph_batch in self.task_graphs], solver, workers)
 
-        for task_graph_batch in self.task_graphs:
+        for results_batch in results_batches:
             task_graph_batch_cost = []
             task_graph_batch_energy = []
-            for task_graph in task_graph_batch:
-                plans_costs = []
-                plans_energy = []
-
-                for plan in plan_batch:
-                    plan_sequence = []
-                    for action, task_id in zip(plan, task_graph.prioritize_sequence):
-                        plan_sequence.append((task_id, action))
-
-                    cost, energy, task_finish_time, energy_cost = self.get_scheduling_cost_step_by_step(plan_sequence, task_graph)
-                    plans_costs.append(task_finish_time)
-                    plans_energy.append(energy_cost)
-
-                graph_min_cost = min(plans_costs)
-                graph_min_energy = min(plans_energy)
-
-                optimal_plan.append(plan_batch[np.argmin(plans_costs)])
-                optimal_plan_e.append(plan_batch[np.argmin(plans_energy)])
-                optimal_makespan_plan_energy_cost.append(plans_energy[np.argmin(plans_costs)])
+            for (plan, graph_min_cost, _, plan_energy), (plan_e, graph_min_energy, _, _) in results_batch:
+                optimal_plan.append(plan)
+                optimal_plan_e.append(plan_e)
+                optimal_makespan_plan_energy_cost.append(plan_energy)
 
                 task_graph_batch_cost.append(graph_min_cost)
                 task_graph_batch_energy.append(graph_min_energy)
@@ -194,26 +270,11 @@ class OffloadingEnvironment(object):
         print("energy consumption for optimal plan:", task_graph_optimal_makespan_energy)
         return task_graph_optimal_costs
 
-    def calculate_optimal_qoe(self):
-        def exhaustion_plans(n):
-            plan_batch = []
-
-            for i in range(2**n):
-                plan_str = bin(i)
-                plan = []
-
-                for x in plan_str[2:]:
-                    plan.append(int(x))
-
-                while len(plan) < n:
-                    plan.insert(0, 0)
-                plan_batch.append(plan)
-            return plan_batch
-
-        n = self.task_graphs[0][0].task_number
-        plan_batch = exhaustion_plans(n)
-
-        print("exhausted plan size: ", len(plan_batch))
+    def calculate_optimal_qoe(self, solver="exhaustion", workers=None):
+        # solver is "exhaustion" to evaluate all the 2^n plans, or "branch_and_bound" for the exact pruned search.
+        # workers > 1 solves the task graphs in that many processes.
+        if solver == "exhaustion":
+            print("exhausted plan size: ", 2 ** self.task_graphs[0][0].task_number)
 
         task_graph_optimal_costs = []
         task_graph_optimal_energys = []
@@ -230,42 +291,31 @@ class OffloadingEnvironment(object):
         optimal_qoe_energy = []
         optimal_qoe_latency = []
 
-
+        objectives_batches = []
         for task_graph_batch in self.task_graphs:
-            task_graph_batch_cost = []
-            task_graph_batch_energy = []
-            task_graph_batch_qoe = []
-
+            objectives_batch = []
             for task_graph in task_graph_batch:
-                plans_costs = []
-                plans_energy = []
-                plans_qoe = []
-
                 all_local_time, all_local_energy = self.get_all_local_cost_for_one_graph(task_graph)
+                qoe_objective = QoEObjective(self.lambda_t, self.lambda_e, all_local_time, all_local_energy)
+                objectives_batch.append([(makespan_objective, (1.0, 0.0)), (energy_objective, (0.0, 1.0)),
+                                         (qoe_objective, qoe_objective.weights)])
+            objectives_batches.append(objectives_batch)
+        results_batches = self.solve_optimal_plans(objectives_batches, solver, workers)
 
-                for plan in plan_batch:
-                    plan_sequence = []
-                    for action, task_id in zip(plan, task_graph.prioritize_sequence):
-                        plan_sequence.append((task_id, action))
-
-                    cost, energy, task_finish_time, energy_cost = self.get_scheduling_cost_step_by_step(plan_sequence, task_graph)
-                    plans_costs.append(task_finish_time)
-                    plans_energy.append(energy_cost)
-
-                    qoe = (self.lambda_t * (task_finish_time - all_local_time) / all_local_time) + (self.lambda_e * (energy_cost - all_local_energy) / all_local_energy)
-                    plans_qoe.append(qoe)
-
-                graph_min_cost = min(plans_costs)
-                graph_min_energy = min(plans_energy)
-                graph_min_qoe = min(plans_qoe)
+        for results_batch in results_batches:
+            task_graph_batch_cost = []
+            task_graph_batch_energy = []
+            task_graph_batch_qoe = []
 
-                optimal_plan.append(plan_batch[np.argmin(plans_costs)])
-                optimal_plan_e.append(plan_batch[np.argmin(plans_energy)])
-                optimal_makespan_plan_energy_cost.append(plans_energy[np.argmin(plans_costs)])
+            for (plan, graph_min_cost, _, plan_energy), (plan_e, graph_min_energy, _, _), \
+                    (plan_qoe, graph_min_qoe, qoe_latency, qoe_energy) in results_batch:
+                optimal_plan.append(plan)
+                optimal_plan_e.append(plan_e)
+                optimal_makespan_plan_energy_cost.append(plan_energy)
 
-                optimal_plan_qoe.append(plan_batch[np.argmin(plans_qoe)])
-                optimal_qoe_energy.append(plans_energy[np.argmin(plans_qoe)])
-                optimal_qoe_latency.append(plans_costs[np.argmin(plans_qoe)])
+                optimal_plan_qoe.append(plan_qoe)
+                optimal_qoe_energy.append(qoe_energy)
+                optimal_qoe_latency.append(qoe_latency)
 
                 task_graph_batch_cost.append(graph_min_cost)
                 task_graph_batch_energy.append(graph_min_energy)
@@ -358,6 +408,7 @@ class OffloadingEnvironment(object):
             plan_batchs = []
             finish_time_plan = []
             for task_graph in task_graph_batch:
+                cost_table = self.get_cost_table(task_graph)
                 cloud_avaliable_time = 0.0
                 ws_avaliable_time = 0.0
                 local_avaliable_time = 0.0
@@ -378,41 +429,37 @@ class OffloadingEnvironment(object):
                     task_index = np.arange(task_graph.task_number)
 
                 for i in task_index:
-                    task = task_graph.task_list[i]
-
                     # calculate the local finish time
-                    if len(task_graph.pre_task_sets[i]) != 0:
+                    if len(task_graph.pre_tasks(i)) != 0:
                         start_time = max(local_avaliable_time,
-                                         max([max(FT_locally[j], FT_wr[j]) for j in task_graph.pre_task_sets[i]]))
+                                         max([max(FT_locally[j], FT_wr[j]) for j in task_graph.pre_tasks(i)]))
                     else:
                         start_time = local_avaliable_time
 
-                    local_running_time = self.resource_cluster.locally_execution_cost(task.processing_data_size)
+                    local_running_time = cost_table.local_cost[i]
                     FT_locally[i] = start_time + local_running_time
 
                     # calculate the remote finish time
-                    if len(task_graph.pre_task_sets[i]) != 0:
+                    if len(task_graph.pre_tasks(i)) != 0:
                         ws_start_time = max(ws_avaliable_time,
-                                            max([max(FT_locally[j], FT_ws[j]) for j in task_graph.pre_task_sets[i]]))
-                        FT_ws[i] = ws_start_time + self.resource_cluster.up_transmission_cost(task.processing_data_size)
+                                            max([max(FT_locally[j], FT_ws[j]) for j in task_graph.pre_tasks(i)]))
+                        FT_ws[i] = ws_start_time + cost_table.up_cost[i]
                         cloud_start_time = max(cloud_avaliable_time,
-                                               max([max(FT_ws[i], FT_cloud[j]) for j in task_graph.pre_task_sets[i]]))
-                        cloud_finish_time = cloud_start_time + self.resource_cluster.mec_execution_cost(
-                            task.processing_data_size)
+                                               max([max(FT_ws[i], FT_cloud[j]) for j in task_graph.pre_tasks(i)]))
+                        cloud_finish_time = cloud_start_time + cost_table.mec_cost[i]
                         FT_cloud[i] = cloud_finish_time
                         # print("task {}, Cloud finish time {}".format(i, FT_cloud[i]))
                         wr_start_time = FT_cloud[i]
-                        wr_finish_time = wr_start_time + self.resource_cluster.dl_transmission_cost(task.transmission_data_size)
+                        wr_finish_time = wr_start_time + cost_table.dl_cost[i]
                         FT_wr[i] = wr_finish_time
                     else:
                         ws_start_time = ws_avaliable_time
-                        ws_finish_time = ws_start_time + self.resource_cluster.up_transmission_cost(task.processing_data_size)
+                        ws_finish_time = ws_start_time + cost_table.up_cost[i]
                         FT_ws[i] = ws_finish_time
 
                         cloud_start_time = max(cloud_avaliable_time, FT_ws[i])
-                        FT_cloud[i] = cloud_start_time + self.resource_cluster.mec_execution_cost(
-                            task.processing_data_size)
-                        FT_wr[i] = FT_cloud[i] + self.resource_cluster.dl_transmission_cost(task.transmission_data_size)
+                        FT_cloud[i] = cloud_start_time + cost_table.mec_cost[i]
+                        FT_wr[i] = FT_cloud[i] + cost_table.dl_cost[i]
 
                     if FT_locally[i] < FT_wr[i]:
                         action = 0
@@ -448,12 +495,8 @@ class OffloadingEnvironment(object):
     def get_all_locally_execute_time(self):
         running_cost = []
         energy_cost = []
-        for task_graph_batch, encode_batch in zip(self.task_graphs, self.encoder_batchs):
-            batch_size = encode_batch.shape[0]
-            sequence_length = encode_batch.shape[1]
-
-            scheduling_action = np.zeros(shape=(batch_size, sequence_length), dtype=np.int32)
-            running_cost_batch, energy_consumption_batch = self.get_running_cost(scheduling_action, task_graph_batch)
+        for task_graph_batch in self.task_graphs:
+            running_cost_batch, energy_consumption_batch = self.get_all_local_cost_batch(task_graph_batch)
             running_cost.append(np.mean(running_cost_batch))
             energy_cost.append(np.mean(energy_consumption_batch))
 
@@ -494,80 +537,121 @@ class OffloadingEnvironment(object):
     def get_all_locally_execute_time_batch(self):
         running_cost = []
         energy_cost = []
-        for task_graph_batch, encode_batch in zip(self.task_graphs, self.encoder_batchs):
-            batch_size = encode_batch.shape[0]
-            sequence_length = encode_batch.shape[1]
-
-            scheduling_action = np.zeros(shape=(batch_size, sequence_length), dtype=np.int32)
-            running_cost_batch, energy_consumption_batch = self.get_running_cost(scheduling_action, task_graph_batch)
-            running_cost.append(running_cost_batch)
-            energy_cost.append(energy_consumption_batch)
+        for task_graph_batch in self.task_graphs:
+            running_cost_batch, energy_consumption_batch = self.get_all_local_cost_batch(task_graph_batch)
+            running_cost.append(running_cost_batch.tolist())
+            energy_cost.append(energy_consumption_batch.tolist())
 
         return running_cost, energy_cost
 
-    def get_all_local_cost_for_one_graph(self, task_graph):
-        scheduling_action = [0] * task_graph.task_number
-        plan_sequence = []
+    def get_all_local_cost_batch(self, task_graph_batch):
+        """ The latency and energy consumption of running every graph of a batch locally, as arrays.
 
-        for action, task_id in zip(scheduling_action,
-                                   task_graph.prioritize_sequence):
-            plan_sequence.append((task_id, action))
+        They only depend on the graph and the resource cluster, so they are simulated once and kept
+        in the cost table of each graph.
+        """
+        cost_tables = [self.get_cost_table(task_graph) for task_graph in task_graph_batch]
+        if any(cost_table.all_local_time is None for cost_table in cost_tables):
+            task_number = max(task_graph.task_number for task_graph in task_graph_batch)
+            all_local_action = np.zeros((len(task_graph_batch), task_number), dtype=np.int32)
+            _, _, all_local_time, all_local_energy = self.get_scheduling_cost_batch(all_local_action, task_graph_batch)
+            for cost_table, time, energy in zip(cost_tables, all_local_time, all_local_energy):
+                cost_table.all_local_time = time
+                cost_table.all_local_energy = energy
 
-        _, _, task_finish_time, total_energy = self.get_scheduling_cost_step_by_step(plan_sequence, task_graph)
-        return task_finish_time, total_energy
+        return np.array([cost_table.all_local_time for cost_table in cost_tables]), \
+               np.array([cost_table.all_local_energy for cost_table in cost_tables])
+
+    def get_all_local_cost_for_one_graph(self, task_graph):
+        all_local_time, all_local_energy = self.get_all_local_cost_batch([task_graph])
+        return all_local_time[0], all_local_energy[0]
 
     def generate_point_batch_for_random_graphs(self, batch_size, graph_number, graph_file_path, time_major):
-        encoder_list = []
-        task_graph_list = []
+        # the graphs of this shard in every batch.
+        graph_batchs = []
+        for i in range(int(graph_number / batch_size)):
+            shard = np.array_split(np.arange(i * batch_size, (i + 1) * batch_size), self.shard_number)[self.shard_index]
+            graph_batchs.append([(graph_file_path, graph_index) for graph_index in shard])
+
+        return self.generate_point_batch_for_graphs(graph_batchs, graph_number, time_major)
 
+    def generate_point_batch_for_mixed_graphs(self, batch_size, graph_number, graph_file_paths, time_major):
+        # the graphs of all the datasets are shuffled together, in the same order on every shard.
+        graphs = [(graph_file_path, graph_index) for graph_file_path in graph_file_paths
+                  for graph_index in range(int(graph_number / batch_size) * batch_size)]
+        order = np.random.RandomState(0).permutation(len(graphs))
+
+        graph_batchs = []
+        for i in range(len(graphs) // batch_size):
+            shard = np.array_split(order[i * batch_size:(i + 1) * batch_size], self.shard_number)[self.shard_index]
+            graph_batchs.append([graphs[j] for j in shard])
+
+        return self.generate_point_batch_for_graphs(graph_batchs, graph_number, time_major)
+
+    def generate_point_batch_for_graphs(self, graph_batchs, graph_number, time_major):
+        """ The encoded batches of graph_batchs, lists of (graph file path, graph index).
+
+        The graphs of a batch can have different task numbers, their encodings are padded with zeros
+        to the largest graph of the batch and the encoder and decoder lengths are the real task numbers.
+        """
         encoder_batchs = []
         encoder_lengths = []
         task_graph_batchs = []
         decoder_full_lengths = []
 
-        max_running_time_vector = []
-        min_running_time_vector = []
-
         max_running_time_batchs = []
         min_running_time_batchs = []
 
-        for i in range(graph_number):
-            task_graph = OffloadingTaskGraph(graph_file_path + str(i) + '.gv', is_matrix=False)
-            task_graph_list.append(task_graph)
-
-            max_time, min_time = self.calculate_max_min_runningcost(task_graph.max_data_size,
-                                                                    task_graph.min_data_size)
-            max_running_time_vector.append(max_time)
-            min_running_time_vector.append(min_time)
+        # use the binary cache of the dataset if it is up to date, see offloading_graph_cache.
+        cached_task_graphs = {}
 
-            # the scheduling sequence will also store in self.'prioritize_sequence'
-            scheduling_sequence = task_graph.prioritize_tasks(self.resource_cluster)
+        for graph_batch in graph_batchs:
+            encoder_list = []
+            task_graph_batch = []
+            max_running_time_vector = []
+            min_running_time_vector = []
 
-            task_encode = np.array(task_graph.encode_point_sequence_with_ranking_and_cost(scheduling_sequence,
-                                                                                          self.resource_cluster,
-                                                                                          encode_dependencies=self.encode_dependencies))
-            encoder_list.append(task_encode)
+            for graph_file_path, i in graph_batch:
+                if graph_file_path not in cached_task_graphs:
+                    cached_task_graphs[graph_file_path] = load_graph_dataset(graph_file_path, graph_number)
 
-        for i in range(int(graph_number / batch_size)):
-            start_batch_index = i * batch_size
-            end_batch_index = (i + 1) * batch_size
-
-            task_encode_batch = encoder_list[start_batch_index:end_batch_index]
+                # only the compact array view of the graph is kept.
+                if cached_task_graphs[graph_file_path] is not None:
+                    task_graph = cached_task_graphs[graph_file_path][i]
+                else:
+                    task_graph = OffloadingTaskGraph(graph_file_path + str(i) + '.gv', is_matrix=False).graph_view
+                task_graph_batch.append(task_graph)
+
+                max_time, min_time = self.calculate_max_min_runningcost(task_graph.max_data_size,
+                                                                        task_graph.min_data_size)
+                max_running_time_vector.append(max_time)
+                min_running_time_vector.append(min_time)
+
+                # the scheduling sequence will also store in self.'prioritize_sequence'
+                cost_table = self.get_cost_table(task_graph)
+                scheduling_sequence = task_graph.prioritize_tasks(self.resource_cluster, cost_table=cost_table)
+
+                task_encode = task_graph.encode_point_sequence_with_ranking_and_cost(scheduling_sequence,
+                                                                                     self.resource_cluster,
+                                                                                     encode_dependencies=self.encode_dependencies,
+                                                                                     cost_table=cost_table)
+                encoder_list.append(np.asarray(task_encode))
+
+            sequence_length = np.asarray([len(task_encode) for task_encode in encoder_list])
+            task_encode_batch = np.zeros((len(encoder_list), max(sequence_length), encoder_list[0].shape[-1]),
+                                         dtype=encoder_list[0].dtype)
+            for task_encode_row, task_encode in zip(task_encode_batch, encoder_list):
+                task_encode_row[:len(task_encode)] = task_encode
             if time_major:
-                task_encode_batch = np.array(task_encode_batch).swapaxes(0, 1)
-                sequence_length = np.asarray([task_encode_batch.shape[0]] * task_encode_batch.shape[1])
-            else:
-                task_encode_batch = np.array(task_encode_batch)
-                sequence_length = np.asarray([task_encode_batch.shape[1]] * task_encode_batch.shape[0])
+                task_encode_batch = task_encode_batch.swapaxes(0, 1)
 
             decoder_full_lengths.append(sequence_length)
             encoder_lengths.append(sequence_length)
             encoder_batchs.append(task_encode_batch)
 
-            task_graph_batch = task_graph_list[start_batch_index:end_batch_index]
             task_graph_batchs.append(task_graph_batch)
-            max_running_time_batchs.append(max_running_time_vector[start_batch_index:end_batch_index])
-            min_running_time_batchs.append(min_running_time_vector[start_batch_index:end_batch_index])
+            max_running_time_batchs.append(max_running_time_vector)
+            min_running_time_batchs.append(min_running_time_vector)
 
         return encoder_batchs, encoder_lengths, task_graph_batchs, decoder_full_lengths, max_running_time_batchs, min_running_time_batchs
 
@@ -586,6 +670,7 @@ class OffloadingEnvironment(object):
         return task_finish_time
 
     def get_scheduling_cost_step_by_step(self, plan, task_graph):
+        cost_table = self.get_cost_table(task_graph)
         cloud_avaliable_time = 0.0
         ws_avaliable_time =0.0
         local_avaliable_time = 0.0
@@ -613,69 +698,68 @@ class OffloadingEnvironment(object):
 
         for item in plan:
             i = item[0]
-            task = task_graph.task_list[i]
             x = item[1]
 
             # locally scheduling
             if x == 0:
-                if len(task_graph.pre_task_sets[i]) != 0:
+                if len(task_graph.pre_tasks(i)) != 0:
                     start_time = max(local_avaliable_time,
-                                     max([max(FT_locally[j], FT_wr[j]) for j in task_graph.pre_task_sets[i]]))
+                                     max([max(FT_locally[j], FT_wr[j]) for j in task_graph.pre_tasks(i)]))
                 else:
                     start_time = local_avaliable_time
 
-                T_l[i] = self.resource_cluster.locally_execution_cost(task.processing_data_size)
+                T_l[i] = cost_table.local_cost[i]
                 FT_locally[i] = start_time + T_l[i]
                 local_avaliable_time = FT_locally[i]
 
                 task_finish_time = FT_locally[i]
 
                 # calculate the energy consumption
-                energy_consumption = T_l[i] * self.rho * (self.f_l ** self.zeta)
+                energy_consumption = cost_table.local_energy[i]
             # mcc scheduling
             else:
-                if len(task_graph.pre_task_sets[i]) != 0:
+                if len(task_graph.pre_tasks(i)) != 0:
                     ws_start_time = max(ws_avaliable_time,
-                                        max([max(FT_locally[j], FT_ws[j])  for j in task_graph.pre_task_sets[i]]))
+                                        max([max(FT_locally[j], FT_ws[j])  for j in task_graph.pre_tasks(i)]))
 
-                    T_ul[i] = self.resource_cluster.up_transmission_cost(task.processing_data_size)
+                    T_ul[i] = cost_table.up_cost[i]
                     ws_finish_time = ws_start_time + T_ul[i]
                     FT_ws[i] = ws_finish_time
                     ws_avaliable_time = ws_finish_time
 
                     cloud_start_time = max( cloud_avaliable_time,
-                                            max([max(FT_ws[i], FT_cloud[j]) for j in task_graph.pre_task_sets[i]]))
-                    cloud_finish_time = cloud_start_time + self.resource_cluster.mec_execution_cost(task.processing_data_size)
+                                            max([max(FT_ws[i], FT_cloud[j]) for j in task_graph.pre_tasks(i)]))
+                    cloud_finish_time = cloud_start_time + cost_table.mec_cost[i]
                     FT_cloud[i] = cloud_finish_time
                     # print("task {}, Cloud finish time {}".format(i, FT_cloud[i]))
                     cloud_avaliable_time = cloud_finish_time
 
                     wr_start_time = FT_cloud[i]
-                    T_dl[i] = self.resource_cluster.dl_transmission_cost(task.transmission_data_size)
+                    T_dl[i] = cost_table.dl_cost[i]
                     wr_finish_time = wr_start_time + T_dl[i]
                     FT_wr[i] = wr_finish_time
 
                     # calculate the energy consumption
-                    energy_consumption = T_ul[i] * self.ptx + T_dl[i] * self.prx
+                    energy_consumption = cost_table.mec_energy[i]
 
                 else:
                     ws_start_time = ws_avaliable_time
-                    T_ul[i] = self.resource_cluster.up_transmission_cost(task.processing_data_size)
+                    T_ul[i] = cost_table.up_cost[i]
                     ws_finish_time = ws_start_time + T_ul[i]
                     FT_ws[i] = ws_finish_time
 
                     cloud_start_time = max(cloud_avaliable_time, FT_ws[i])
-                    cloud_finish_time = cloud_start_time + self.resource_cluster.mec_execution_cost(task.processing_data_size)
+                    cloud_finish_time = cloud_start_time + cost_table.mec_cost[i]
                     FT_cloud[i] = cloud_finish_time
                     cloud_avaliable_time = cloud_finish_time
 
                     wr_start_time = FT_cloud[i]
-                    T_dl[i] = self.resource_cluster.dl_transmission_cost(task.transmission_data_size)
+                    T_dl[i] = cost_table.dl_cost[i]
                     wr_finish_time = wr_start_time + T_dl[i]
                     FT_wr[i] = wr_finish_time
 
                     # calculate the energy consumption
-                    energy_consumption = T_ul[i] * self.ptx + T_dl[i] * self.prx
+                    energy_consumption = cost_table.mec_energy[i]
 
                 task_finish_time = wr_finish_time
 
@@ -697,7 +781,7 @@ class OffloadingEnvironment(object):
     def score_func_qoe(self, cost, all_local_cost, number_of_task):
         try:
             cost = np.array(cost)
-            avg_all_local_cost = all_local_cost / float(number_of_task)
+            avg_all_local_cost = all_local_cost / np.asarray(number_of_task, dtype=np.float64)
             score = -(cost - avg_all_local_cost) / all_local_cost
         except:
             print("exception all local cost: ", all_local_cost)
@@ -753,38 +837,46 @@ class OffloadingEnvironment(object):
         target_batch = np.array(target_batch)
         return target_batch
 
+    def get_scheduling_cost_batch(self, action_sequence_batch, task_graph_batch):
+        # batched form of get_scheduling_cost_step_by_step, the actions follow the prioritize sequence.
+        # graphs with different task numbers are padded to the largest one, see stack_task_graph_batch.
+        cost_tables = [self.get_cost_table(task_graph) for task_graph in task_graph_batch]
+        return simulate_task_graph_batch(action_sequence_batch, task_graph_batch, cost_tables)
+
     def step(self, action_sequence_batch, task_graph_batch, max_running_time_batch, min_running_time_batch):
-        plan_batch = []
-        for action_sequence, task_graph in zip(action_sequence_batch, task_graph_batch):
-            plan_sequence = []
+        action_sequence_batch = np.asarray(action_sequence_batch)
+        task_number = np.array([task_graph.task_number for task_graph in task_graph_batch])
+        reward_mask = self.sequence_mask(task_number, action_sequence_batch.shape[1])
 
-            for action, task_id in zip(action_sequence, task_graph.prioritize_sequence):
-                plan_sequence.append((task_id, action))
+        latency, energy, _, _ = self.get_scheduling_cost_batch(action_sequence_batch, task_graph_batch)
+        all_local_time, all_local_energy = self.get_all_local_cost_batch(task_graph_batch)
 
-            plan_batch.append(plan_sequence)
+        latency = self.score_func_qoe(latency, all_local_cost=all_local_time[:, np.newaxis],
+                                      number_of_task=task_number[:, np.newaxis])
+        energy = self.score_func_qoe(energy, all_local_cost=all_local_energy[:, np.newaxis],
+                                     number_of_task=task_number[:, np.newaxis])
 
-        return self.get_reward_batch_step_by_step(plan_batch,
-                                                  task_graph_batch,
-                                                  max_running_time_batch,
-                                                  min_running_time_batch)
+        # the padded steps after the last task of a graph have no reward.
+        return (self.lambda_t * latency + self.lambda_e * energy) * reward_mask
 
-    def get_running_cost(self, action_sequence_batch, task_graph_batch):
-        cost_batch = []
-        energy_batch = []
-        for action_sequence, task_graph in zip(action_sequence_batch,
-                                               task_graph_batch):
-            plan_sequence = []
+    @staticmethod
+    def sequence_mask(lengths, max_length):
+        """ (batch, max_length) float32 mask, 1 for the first lengths[b] steps of row b and 0 after. """
+        return (np.arange(max_length)[np.newaxis, :] < np.asarray(lengths)[:, np.newaxis]).astype(np.float32)
 
-            for action, task_id in zip(action_sequence,
-                                       task_graph.prioritize_sequence):
-                plan_sequence.append((task_id, action))
+    def get_running_cost(self, action_sequence_batch, task_graph_batch):
+        _, _, cost_batch, energy_batch = self.get_scheduling_cost_batch(action_sequence_batch, task_graph_batch)
 
-            _, _, task_finish_time, total_energy = self.get_scheduling_cost_step_by_step(plan_sequence, task_graph)
+        return cost_batch.tolist(), energy_batch.tolist()
 
-            cost_batch.append(task_finish_time)
-            energy_batch.append(total_energy)
+    def get_qoe_batch(self, action_sequence_batch, task_graph_batch):
+        """ The latency, energy consumption and QoE of a batch of plans, as arrays. """
+        _, _, latency_batch, energy_batch = self.get_scheduling_cost_batch(action_sequence_batch, task_graph_batch)
+        all_local_time, all_local_energy = self.get_all_local_cost_batch(task_graph_batch)
+        qoe_batch = -(self.lambda_t * ((latency_batch - all_local_time) / all_local_time) +
+                      self.lambda_e * ((energy_batch - all_local_energy) / all_local_energy))
 
-        return cost_batch, energy_batch
+        return latency_batch, energy_batch, qoe_batch
 
     def get_running_cost_by_plan_batch(self, plan_batch, task_graph_batch):
         cost_batch = []
@@ -6,24 +6,11 @@ import time
 import logging
 
 def calculate_qoe(latency_batch, energy_batch, env):
-    all_local_time, all_local_energy = env.get_all_locally_execute_time_batch()
-    all_local_time = np.squeeze(all_local_time)
-    all_local_energy = np.squeeze(all_local_energy)
-    latency_batch = np.squeeze(latency_batch)
-    energy_batch = np.squeeze(energy_batch)
-    qoe_batch = []
+    # the all local baseline of every graph is cached by the environment.
+    return env.calculate_qoe(latency_batch, energy_batch)
 
-    for latency, energy, single_all_local_latency, single_all_local_energy in zip(latency_batch, energy_batch, all_local_time, all_local_energy):
-        qoe = env.lambda_t * ((latency - single_all_local_latency) / single_all_local_latency) + \
-              env.lambda_e * ((energy - single_all_local_energy) / single_all_local_energy)
 
-        qoe = -qoe
-        qoe_batch.append(qoe)
-
-    return qoe_batch
-
-
-def evaluate_different_number(graph_file_pahts, lambda_t=1.0, lambda_e=0.0, logpath="./log.txt"):
+def evaluate_different_number(graph_file_pahts, lambda_t=1.0, lambda_e=0.0, logpath="./log.txt", workers=None):
 
     logging.basicConfig(filename=logpath,level=logging.DEBUG, filemode='w')
     ch = logging.StreamHandler()
@@ -45,8 +32,8 @@ def evaluate_different_number(graph_file_pahts, lambda_t=1.0, lambda_e=0.0, logp
                                time_major=False,
                                lambda_t=lambda_t,
                                lambda_e=lambda_e)
-        if env.task_graphs[0][0].task_number < 20:
-            env.calculate_optimal_qoe()
+        if env.task_graphs[0][0].task_number < 30:
+            env.calculate_optimal_qoe(solver="branch_and_bound", workers=workers)
 
         # Calculate the heft algorithms latency, energy and qoe
         plans, finish_time_batchs = env.greedy_solution(heft=True)
@@ -116,7 +103,8 @@ def evaluate_different_number(graph_file_pahts, lambda_t=1.0, lambda_e=0.0, logp
 
 
 def evaluate_different_trans(graph_file_paths, lambda_t=1.0,
-                             lambda_e=0.0, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0], logpath="./log.txt"):
+                             lambda_e=0.0, bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0], logpath="./log.txt",
+                             workers=None):
     logging.basicConfig(filename=logpath, level=logging.DEBUG, filemode='w')
     ch = logging.StreamHandler()
     logger = logging.getLogger()
@@ -136,7 +124,7 @@ def evaluate_different_trans(graph_file_paths, lambda_t=1.0,
                                     lambda_t=lambda_t,
                                     lambda_e=lambda_e)
 
-        env.calculate_optimal_qoe()
+        env.calculate_optimal_qoe(solver="branch_and_bound", workers=workers)
 
         # Calculate the heft algorithms latency, energy and qoe
         plans, finish_time_batchs = env.greedy_solution(heft=True)
@@ -0,0 +1,131 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+
+from rltaskoffloading.environment.offloading_task_graph import OffloadingTaskGraph, OffloadingTaskGraphView
+
+"""
+Binary cache of a graph dataset, so the .gv files are only parsed once.
+
+A dataset is the files graph_file_path + str(i) + '.gv' for i = 0, 1, ..., e.g.
+'./rltaskoffloading/offloading_data/offload_random10/random.10.', and its cache is the directory
+graph_file_path + 'cache'. The cache holds the per task sizes and depths and the edge list of every
+graph, concatenated, together with the modification times of the source files, one .npy file per
+array. The arrays are memory mapped when loaded, so only the pages of the graphs read are loaded.
+"""
+
+CACHE_ARRAYS = ('task_numbers', 'processing_data_sizes', 'transmission_data_sizes', 'depths',
+                'edge_numbers', 'edges', 'source_mtimes')
+
+
+def graph_dataset_cache_path(graph_file_path):
+    return graph_file_path + 'cache'
+
+
+def save_graph_dataset(graph_file_path, graph_number=None):
+    """ Parse the .gv files of a dataset (all of them if graph_number is None) and write its cache. """
+    graph_files = []
+    while graph_number is None or len(graph_files) < graph_number:
+        graph_file = graph_file_path + str(len(graph_files)) + '.gv'
+        if not os.path.exists(graph_file):
+            break
+        graph_files.append(graph_file)
+
+    if graph_number is not None and len(graph_files) < graph_number:
+        raise IOError("Only {} graphs are found for {}".format(len(graph_files), graph_file_path))
+
+    source_mtimes = [os.path.getmtime(graph_file) for graph_file in graph_files]
+    task_graphs = [OffloadingTaskGraph(graph_file) for graph_file in graph_files]
+
+    # the edges are kept with their repeats and in file order, the view resolves them as the parser does.
+    edge_sets = [np.array([[edge[0], edge[4], edge[3]] for edge in task_graph.edge_set],
+                          dtype=np.int64).reshape(-1, 3) for task_graph in task_graphs]
+
+    arrays = dict(task_numbers=np.array([task_graph.task_number for task_graph in task_graphs], dtype=np.int64),
+                  processing_data_sizes=np.concatenate([task_graph.processing_data_sizes
+                                                        for task_graph in task_graphs]),
+                  transmission_data_sizes=np.concatenate([task_graph.transmission_data_sizes
+                                                          for task_graph in task_graphs]),
+                  depths=np.concatenate([task_graph.graph_view.depths for task_graph in task_graphs]),
+                  edge_numbers=np.array([len(edge_set) for edge_set in edge_sets], dtype=np.int64),
+                  edges=np.concatenate(edge_sets),
+                  source_mtimes=np.array(source_mtimes, dtype=np.float64))
+
+    # the cache is written next to the old one and swapped in, it is never read half written.
+    cache_path = graph_dataset_cache_path(graph_file_path)
+    temp_path = cache_path + '.tmp'
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    for name in CACHE_ARRAYS:
+        np.save(os.path.join(temp_path, name + '.npy'), arrays[name])
+
+    old_path = cache_path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(cache_path):
+        os.rename(cache_path, old_path)
+    os.rename(temp_path, cache_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return cache_path
+
+
+def load_graph_dataset(graph_file_path, graph_number):
+    """ The first graph_number graphs of a dataset as OffloadingTaskGraphView from its cache, built lazily.
+
+    Returns None if there is no cache, it holds less than graph_number graphs or any of the source
+    .gv files is missing or was modified after the cache was written.
+    """
+    cache_path = graph_dataset_cache_path(graph_file_path)
+    if not all(os.path.exists(os.path.join(cache_path, name + '.npy')) for name in CACHE_ARRAYS):
+        return None
+
+    data = {name: np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r') for name in CACHE_ARRAYS}
+    source_mtimes = data['source_mtimes']
+    if len(source_mtimes) < graph_number:
+        return None
+
+    for i in range(graph_number):
+        graph_file = graph_file_path + str(i) + '.gv'
+        if not os.path.exists(graph_file) or os.path.getmtime(graph_file) > source_mtimes[i]:
+            return None
+
+    return CachedGraphDataset(data, graph_number)
+
+
+class CachedGraphDataset(object):
+    """ The graphs of a loaded cache, graph i is built from the memory mapped arrays when it is first read. """
+
+    def __init__(self, data, graph_number):
+        self._task_offsets = np.concatenate([[0], np.cumsum(data['task_numbers'][:graph_number])])
+        self._edge_offsets = np.concatenate([[0], np.cumsum(data['edge_numbers'][:graph_number])])
+        self._processing_data_sizes = data['processing_data_sizes']
+        self._transmission_data_sizes = data['transmission_data_sizes']
+        self._depths = data['depths']
+        self._edges = data['edges']
+        self._task_graphs = [None] * graph_number
+
+    def __len__(self):
+        return len(self._task_graphs)
+
+    def __getitem__(self, i):
+        task_graph = self._task_graphs[i]
+        if task_graph is None:
+            i = range(len(self))[i]
+            tasks = slice(self._task_offsets[i], self._task_offsets[i + 1])
+            graph_edges = self._edges[self._edge_offsets[i]:self._edge_offsets[i + 1]]
+            task_graph = OffloadingTaskGraphView(self._processing_data_sizes[tasks],
+                                                 self._transmission_data_sizes[tasks],
+                                                 self._depths[tasks], graph_edges[:, 0], graph_edges[:, 1],
+                                                 graph_edges[:, 2])
+            self._task_graphs[i] = task_graph
+        return task_graph
+
+if __name__ == "__main__":
+    # convert all the datasets under offloading_data.
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'offloading_data')
+    for first_graph_file in sorted(glob.glob(os.path.join(data_path, '*', '*.0.gv'))):
+        graph_file_path = first_graph_file[:-len('0.gv')]
+        print("converting {}".format(graph_file_path))
+        save_graph_dataset(graph_file_path)
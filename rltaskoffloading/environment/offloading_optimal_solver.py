@@ -0,0 +1,294 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def makespan_objective(latency, energy):
+    return latency
+
+
+def energy_objective(latency, energy):
+    return energy
+
+
+class QoEObjective(object):
+    def __init__(self, lambda_t, lambda_e, all_local_time, all_local_energy):
+        """ The qoe cost of a plan relative to executing all the tasks locally, lower is better. """
+        self.lambda_t = lambda_t
+        self.lambda_e = lambda_e
+        self.all_local_time = all_local_time
+        self.all_local_energy = all_local_energy
+
+    @property
+    def weights(self):
+        return self.lambda_t / self.all_local_time, self.lambda_e / self.all_local_energy
+
+    def __call__(self, latency, energy):
+        return (self.lambda_t * (latency - self.all_local_time) / self.all_local_time) + \
+               (self.lambda_e * (energy - self.all_local_energy) / self.all_local_energy)
+
+
+def solve_optimal_plans(plan_solver, objectives, solver="exhaustion"):
+    """ Optimal plans of one OptimalPlanSolver for a list of (objective, weights) pairs.
+
+    solver is "exhaustion" to evaluate all the 2^n plans or "branch_and_bound" for the exact pruned
+    search. Returns (plan, value, makespan, energy) per objective.
+    """
+    if solver == "exhaustion":
+        return plan_solver.exhaust([objective for objective, weights in objectives])
+    elif solver == "branch_and_bound":
+        return [plan_solver.branch_and_bound(objective, weights) for objective, weights in objectives]
+    raise ValueError("Unknown optimal solver: {}".format(solver))
+
+
+def solve_optimal_plans_batch(plan_solvers, objectives_batch, solver="exhaustion", workers=None):
+    """ solve_optimal_plans for every graph, spread over a process pool if workers > 1.
+
+    The solvers only hold plain lists of the task costs and the objectives are module level functions
+    or QoEObjective, so they are cheap to pickle. The results keep the order of plan_solvers.
+    """
+    if solver not in ("exhaustion", "branch_and_bound"):
+        raise ValueError("Unknown optimal solver: {}".format(solver))
+
+    if workers is None or workers <= 1 or len(plan_solvers) <= 1:
+        return [solve_optimal_plans(plan_solver, objectives, solver)
+                for plan_solver, objectives in zip(plan_solvers, objectives_batch)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(solve_optimal_plans, plan_solvers, objectives_batch,
+                                 [solver] * len(plan_solvers)))
+
+
+class OptimalPlanSolver(object):
+    def __init__(self, task_graph, cost_table):
+        """ Exact solver for the optimal offloading plan of one task graph.
+
+        The plans follow the prioritize sequence of the task graph, so a plan prefix fully determines
+        the channel and processor available times. Both searches walk the binary plan tree depth first
+        and share the simulator state of every prefix among its sub-trees, so a plan costs O(1) task
+        steps amortized instead of O(n).
+
+        The simulation is the same as OffloadingEnvironment.get_scheduling_cost_step_by_step, and
+        equally good plans are resolved in the order of the exhaustive plans (plan i is the binary
+        digits of i, local first), so the optimal values and plans are exactly the ones of simulating
+        every plan on its own.
+        """
+        self.task_number = task_graph.task_number
+        self.sequence = [int(i) for i in task_graph.prioritize_sequence]
+        self.pre_tasks = [task_graph.pre_tasks(i).tolist() for i in range(self.task_number)]
+
+        self.T_l = cost_table.local_cost.tolist()
+        self.T_ul = cost_table.up_cost.tolist()
+        self.T_mec = cost_table.mec_cost.tolist()
+        self.T_dl = cost_table.dl_cost.tolist()
+
+        self.local_energy = cost_table.local_energy.tolist()
+        self.mec_energy = cost_table.mec_energy.tolist()
+        self.min_energy = [min(local_energy, mec_energy) for local_energy, mec_energy in
+                           zip(self.local_energy, self.mec_energy)]
+
+        self.mu_grid = [mu / 20.0 for mu in range(21)]
+
+    def schedule_task(self, i, action, F, W, C, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time):
+        """ Schedule task i after a plan prefix, same as one step of get_scheduling_cost_step_by_step.
+
+        F, W and C hold for every scheduled task the finish time seen by a local successor, by the
+        sending channel of an offloaded successor and by the MEC server of an offloaded successor.
+        Returns the finish time of the task, its (F, W, C) and the three new available times.
+        """
+        pre_tasks = self.pre_tasks[i]
+        if action == 0:
+            pre_F = max([F[j] for j in pre_tasks], default=0.0)
+            local_finish_time = max(local_avaliable_time, pre_F) + self.T_l[i]
+            return local_finish_time, (local_finish_time, local_finish_time, 0.0), \
+                   (local_finish_time, ws_avaliable_time, cloud_avaliable_time)
+
+        pre_W = max([W[j] for j in pre_tasks], default=0.0)
+        pre_C = max([C[j] for j in pre_tasks], default=0.0)
+        ws_finish_time = max(ws_avaliable_time, pre_W) + self.T_ul[i]
+        cloud_finish_time = max(cloud_avaliable_time, max(ws_finish_time, pre_C)) + self.T_mec[i]
+        wr_finish_time = cloud_finish_time + self.T_dl[i]
+        # the sending channel is only occupied by offloaded tasks with predecessors, as in the scalar path.
+        if len(pre_tasks) != 0:
+            ws_avaliable_time = ws_finish_time
+        return wr_finish_time, (wr_finish_time, ws_finish_time, cloud_finish_time), \
+               (local_avaliable_time, ws_avaliable_time, cloud_finish_time)
+
+    def resource_bound_suffix(self, weights):
+        """ For every mu and plan position, the sum of the cheaper resource cost of the remaining tasks.
+
+        The local processor and the sending channel are both serial, so the makespan is at least any
+        convex combination mu * (local busy time) + (1 - mu) * (sending busy time), which splits the
+        bound of latency_weight * makespan + energy_weight * energy into an independent choice per task.
+        """
+        latency_weight, energy_weight = weights
+        suffix = []
+        for mu in self.mu_grid:
+            mu_suffix = [0.0] * (self.task_number + 1)
+            for position in range(self.task_number - 1, -1, -1):
+                i = self.sequence[position]
+                T_ul = self.T_ul[i] if len(self.pre_tasks[i]) != 0 else 0.0
+                local_cost = latency_weight * mu * self.T_l[i] + energy_weight * self.local_energy[i]
+                mec_cost = latency_weight * (1.0 - mu) * T_ul + energy_weight * self.mec_energy[i]
+                mu_suffix[position] = mu_suffix[position + 1] + min(local_cost, mec_cost)
+            suffix.append((mu, mu_suffix))
+        return suffix
+
+    def exhaust(self, objectives):
+        """ Evaluate every plan and return (plan, value, makespan, energy) of the best plan per objective. """
+        n = self.task_number
+        sequence = self.sequence
+        local_energy, mec_energy = self.local_energy, self.mec_energy
+        schedule_task = self.schedule_task
+
+        F = [0.0] * n
+        W = [0.0] * n
+        C = [0.0] * n
+        plan = [0] * n
+        best = [[float('inf'), None, 0.0, 0.0] for _ in objectives]
+
+        def search(k, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time, current_FT, total_energy):
+            if k == n:
+                for objective, objective_best in zip(objectives, best):
+                    value = objective(current_FT, total_energy)
+                    if value < objective_best[0] or objective_best[1] is None:
+                        objective_best[:] = [value, plan[:], current_FT, total_energy]
+                return
+
+            i = sequence[k]
+            for action, energy in ((0, local_energy[i]), (1, mec_energy[i])):
+                finish_time, (F[i], W[i], C[i]), avaliable_times = schedule_task(
+                    i, action, F, W, C, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time)
+                plan[k] = action
+                search(k + 1, *avaliable_times, max(finish_time, current_FT), total_energy + energy)
+            F[i] = W[i] = C[i] = 0.0
+
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, n + 100))
+        try:
+            search(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+        return [(optimal_plan, value, latency, energy) for value, optimal_plan, latency, energy in best]
+
+    def branch_and_bound(self, objective, weights=None):
+        """ Search the plan minimizing objective(makespan, energy), pruning a sub-tree when the lower
+        bound of its objective can not improve the best plan found so far.
+
+        The objective has to be non-decreasing in both the makespan and the energy consumption.
+        If the objective is linear, weights=(latency_weight, energy_weight) enables the tighter
+        resource bound. Returns the optimal plan in scheduling order, its objective value,
+        makespan and energy.
+        """
+        n = self.task_number
+        sequence = self.sequence
+        pre_tasks = self.pre_tasks
+        T_l, T_ul, T_mec, T_dl = self.T_l, self.T_ul, self.T_mec, self.T_dl
+        local_energy, mec_energy, min_energy = self.local_energy, self.mec_energy, self.min_energy
+        schedule_task = self.schedule_task
+
+        F = [0.0] * n
+        W = [0.0] * n
+        C = [0.0] * n
+        plan = [0] * n
+
+        # best value, plan, makespan and energy, seeded by the greedy plan. Equally good plans are
+        # resolved by the plan order, which is the order of the exhaustive plans.
+        greedy_plan, greedy_latency, greedy_energy = self.greedy_plan(objective)
+        best = [objective(greedy_latency, greedy_energy), greedy_plan, greedy_latency, greedy_energy]
+
+        if weights is not None:
+            latency_weight, energy_weight = weights
+            resource_suffix = self.resource_bound_suffix(weights)
+            objective_offset = objective(0.0, 0.0)
+
+        def pruned(bound, k):
+            return bound > best[0] or (bound == best[0] and plan[:k] > best[1][:k])
+
+        def path_bound(k, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time, current_FT, total_energy):
+            # each remaining task finishes no earlier than the faster of its local and its remote schedule
+            # started from the current available times, the energy is the cheaper of the two.
+            bound_F = F[:]
+            bound_W = W[:]
+            bound_C = C[:]
+            for position in range(k, n):
+                i = sequence[position]
+                pre_F = max([bound_F[j] for j in pre_tasks[i]], default=0.0)
+                pre_W = max([bound_W[j] for j in pre_tasks[i]], default=0.0)
+                pre_C = max([bound_C[j] for j in pre_tasks[i]], default=0.0)
+
+                local_finish_time = max(local_avaliable_time, pre_F) + T_l[i]
+                ws_finish_time = max(ws_avaliable_time, pre_W) + T_ul[i]
+                wr_finish_time = max(cloud_avaliable_time, max(ws_finish_time, pre_C)) + T_mec[i] + T_dl[i]
+
+                bound_F[i] = min(local_finish_time, wr_finish_time)
+                bound_W[i] = min(local_finish_time, ws_finish_time)
+                bound_C[i] = 0.0
+                current_FT = max(bound_F[i], current_FT)
+                total_energy += min_energy[i]
+
+            return objective(current_FT, total_energy)
+
+        def resource_bound(k, local_avaliable_time, ws_avaliable_time, total_energy):
+            bound = max(latency_weight * (mu * local_avaliable_time + (1.0 - mu) * ws_avaliable_time) + suffix[k]
+                        for mu, suffix in resource_suffix)
+            bound += energy_weight * total_energy + objective_offset
+            # it is not computed in the same order as the simulator, keep a margin for the rounding errors.
+            return bound - 1e-9 * (abs(bound) + 1.0)
+
+        def search(k, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time, current_FT, total_energy):
+            if k == n:
+                value = objective(current_FT, total_energy)
+                if value < best[0] or (value == best[0] and plan < best[1]):
+                    best[:] = [value, plan[:], current_FT, total_energy]
+                return
+
+            if weights is not None and \
+                    pruned(resource_bound(k, local_avaliable_time, ws_avaliable_time, total_energy), k):
+                return
+            if pruned(path_bound(k, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time,
+                                 current_FT, total_energy), k):
+                return
+
+            i = sequence[k]
+            for action, energy in ((0, local_energy[i]), (1, mec_energy[i])):
+                finish_time, (F[i], W[i], C[i]), avaliable_times = schedule_task(
+                    i, action, F, W, C, local_avaliable_time, ws_avaliable_time, cloud_avaliable_time)
+                plan[k] = action
+                search(k + 1, *avaliable_times, max(finish_time, current_FT), total_energy + energy)
+            F[i] = W[i] = C[i] = 0.0
+            plan[k] = 0
+
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, n + 100))
+        try:
+            search(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+        value, optimal_plan, latency, energy = best
+        return optimal_plan, value, latency, energy
+
+    def greedy_plan(self, objective):
+        """ The plan choosing the action with the better partial objective per task, with its makespan and energy. """
+        n = self.task_number
+        F = [0.0] * n
+        W = [0.0] * n
+        C = [0.0] * n
+        avaliable_times = (0.0, 0.0, 0.0)
+        current_FT = total_energy = 0.0
+        plan = []
+
+        for i in self.sequence:
+            local = self.schedule_task(i, 0, F, W, C, *avaliable_times)
+            mec = self.schedule_task(i, 1, F, W, C, *avaliable_times)
+            local_value = objective(max(local[0], current_FT), total_energy + self.local_energy[i])
+            mec_value = objective(max(mec[0], current_FT), total_energy + self.mec_energy[i])
+
+            action, (finish_time, (F[i], W[i], C[i]), avaliable_times) = \
+                (0, local) if local_value <= mec_value else (1, mec)
+            current_FT = max(finish_time, current_FT)
+            total_energy += self.mec_energy[i] if action else self.local_energy[i]
+            plan.append(action)
+
+        return plan, current_FT, total_energy
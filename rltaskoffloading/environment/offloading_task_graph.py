@@ -1,3 +1,6 @@
+import re
+from collections import OrderedDict
+
 import numpy as np
 from graphviz import Digraph
 import json
@@ -22,33 +25,106 @@ class OffloadingTask(object):
 
 
 class OffloadingDotParser(object):
+    # the subset of DOT written by daggen: one node or edge statement per line.
+    NODE_PATTERN = re.compile(r'^\s*(\d+)\s*\[(.*)\]\s*;?\s*$')
+    EDGE_PATTERN = re.compile(r'^\s*(\d+)\s*->\s*(\d+)\s*\[(.*)\]\s*;?\s*$')
+    ATTRIBUTE_PATTERN = re.compile(r'\s*(\w+)\s*=\s*"(\d+(?:\.\d+)?)"\s*(?:,|$)')
+    SKIP_PATTERN = re.compile(r'^\s*(//.*|digraph\s+\w*\s*\{|\})?\s*$')
+
     def __init__(self, file_name, is_matrix):
         self.succ_task_for_ids = {}
         self.pre_task_for_ids = {}
         self.is_matrix = is_matrix
 
-        self.dot_ob = pydotplus.graphviz.graph_from_dot_file(file_name)
-        self._parse_task()
-        self._parse_dependecies()
+        # file_name is a path or a file object of the dot source, e.g. a graph sent to the server.
+        if isinstance(file_name, str):
+            with open(file_name) as dot_file:
+                dot_data = dot_file.read()
+        else:
+            dot_data = file_name.read()
+
+        # files the line parser does not recognize are parsed by pydotplus.
+        if not self._parse_daggen_lines(dot_data.splitlines()):
+            self.dot_ob = pydotplus.graphviz.graph_from_dot_data(dot_data)
+            if self.dot_ob is None:
+                raise ValueError("the task graph is not a dot graph")
+            self._parse_task()
+            self._parse_dependecies()
         self._calculate_depth_and_transimission_datasize()
 
+    def _parse_attributes(self, attribute_string):
+        attributes = {}
+        position = 0
+        while position < len(attribute_string):
+            match = self.ATTRIBUTE_PATTERN.match(attribute_string, position)
+            if match is None:
+                return None
+            attributes[match.group(1)] = match.group(2)
+            position = match.end()
+        return attributes
+
+    def _parse_daggen_lines(self, lines):
+        """ Parse the tasks and the dependencies line by line, returns False if a line is not recognized. """
+        jobs = []
+        edges = OrderedDict()
+
+        for line in lines:
+            match = self.EDGE_PATTERN.match(line)
+            if match is not None:
+                attributes = self._parse_attributes(match.group(3))
+                if attributes is None or not attributes.get('size', '').isdigit():
+                    return False
+                # pydotplus groups the repeated edges of a pair, keep its order.
+                edges.setdefault((match.group(1), match.group(2)), []).append(int(attributes['size']))
+                continue
+
+            match = self.NODE_PATTERN.match(line)
+            if match is not None:
+                attributes = self._parse_attributes(match.group(2))
+                if attributes is None or not attributes.get('size', '').isdigit() or \
+                        not attributes.get('expect_size', '').isdigit():
+                    return False
+                jobs.append((match.group(1), int(attributes['size']), int(attributes['expect_size'])))
+                continue
+
+            if self.SKIP_PATTERN.match(line) is None:
+                return False
+
+        # the task ids have to be 1, ..., n, and every edge has to join two of them.
+        job_ids = [job_id for job_id, _, _ in jobs]
+        if sorted(int(job_id) for job_id in job_ids) != list(range(1, len(jobs) + 1)) or \
+                any(job_id != str(int(job_id)) for job_id in job_ids) or \
+                any(source not in job_ids or destination not in job_ids for source, destination in edges):
+            return False
+
+        self._add_tasks(jobs)
+        self._add_dependencies([(source, destination, data_size) for (source, destination), data_sizes in edges.items()
+                                for data_size in data_sizes])
+        return True
 
     def _parse_task(self):
-        jobs = self.dot_ob.get_node_list()
-        self.task_list = [0] * len(jobs)
+        jobs = []
+        for job in self.dot_ob.get_node_list():
+            jobs.append((job.get_name(), int(eval(job.obj_dict['attributes']['size'])),
+                         int(eval(job.obj_dict['attributes']['expect_size']))))
+        self._add_tasks(jobs)
 
-        for job in jobs:
-            job_id = job.get_name()
-            data_size = int(eval(job.obj_dict['attributes']['size']))
-            communication_data_size = int(eval(job.obj_dict['attributes']['expect_size']))
+    def _add_tasks(self, jobs):
+        self.task_list = [0] * len(jobs)
 
+        for job_id, data_size, communication_data_size in jobs:
             task = OffloadingTask(job_id, data_size, 0, "compute")
             task.transmission_data_size = communication_data_size
             id = int(job_id) - 1
             self.task_list[id] = task
 
     def _parse_dependecies(self):
-        edge_list = self.dot_ob.get_edge_list()
+        edges = []
+        for edge in self.dot_ob.get_edge_list():
+            edges.append((edge.get_source(), edge.get_destination(), int(eval(edge.obj_dict['attributes']['size']))))
+        self._add_dependencies(edges)
+
+    def _add_dependencies(self, edges):
         dependencies = []
 
         task_number = len(self.task_list)
@@ -60,10 +136,9 @@ class OffloadingDotParser(object):
             self.succ_task_for_ids[i] = []
             dependency_matrix[i][i] = self.task_list[i].processing_data_size
 
-        for edge in edge_list:
-            source_id = int(edge.get_source()) - 1
-            destination_id = int(edge.get_destination()) - 1
-            data_size = int(eval(edge.obj_dict['attributes']['size']))
+        for source, destination, data_size in edges:
+            source_id = int(source) - 1
+            destination_id = int(destination) - 1
 
             self.pre_task_for_ids[destination_id].append(source_id)
             self.succ_task_for_ids[source_id].append(destination_id)
@@ -106,6 +181,153 @@ class OffloadingDotParser(object):
         return self.dependencies
 
 
+class OffloadingTaskGraphView(object):
+    """ Compact array form of a task graph.
+
+    The predecessors and successors are kept in CSR form: the predecessors of task i are
+    pre_task_indices[pre_task_offsets[i]:pre_task_offsets[i + 1]] in ascending order, with the data
+    size of each edge at the same position of pre_task_data_sizes, and the same for the successors.
+    The arrays are read only, only prioritize_sequence is set by prioritize_tasks. The batch simulator,
+    the optimal solver and the encoders take this view in place of an OffloadingTaskGraph.
+    """
+    __slots__ = ('task_number', 'processing_data_sizes', 'transmission_data_sizes', 'depths',
+                 'pre_task_offsets', 'pre_task_indices', 'pre_task_data_sizes',
+                 'succ_task_offsets', 'succ_task_indices', 'succ_task_data_sizes',
+                 'pre_task_index', 'max_data_size', 'min_data_size', 'prioritize_sequence')
+
+    def __init__(self, processing_data_sizes, transmission_data_sizes, depths,
+                 edge_sources, edge_destinations, edge_data_sizes, prioritize_sequence=None):
+        self.task_number = len(processing_data_sizes)
+        # no copy when the input already has the dtype, e.g. the memory mapped cache arrays. The view
+        # keeps the read only flag set below off the caller's array.
+        self.processing_data_sizes = np.asarray(processing_data_sizes, dtype=np.float64).view()
+        self.transmission_data_sizes = np.asarray(transmission_data_sizes, dtype=np.float64).view()
+        self.depths = np.asarray(depths, dtype=np.int32).view()
+
+        # a repeated edge keeps the data size of its last occurrence, same as the dependency matrix.
+        edge_sources = np.asarray(edge_sources, dtype=np.int64)[::-1]
+        edge_destinations = np.asarray(edge_destinations, dtype=np.int64)[::-1]
+        edge_data_sizes = np.asarray(edge_data_sizes, dtype=np.float64)[::-1]
+        _, edge_index = np.unique(edge_sources * self.task_number + edge_destinations, return_index=True)
+        edge_sources = edge_sources[edge_index]
+        edge_destinations = edge_destinations[edge_index]
+        edge_data_sizes = edge_data_sizes[edge_index]
+
+        # edges are now sorted by source then destination, which is the successor order.
+        self.succ_task_offsets = self._offsets(edge_sources)
+        self.succ_task_indices = edge_destinations.astype(np.int32)
+        self.succ_task_data_sizes = edge_data_sizes
+
+        pre_order = np.lexsort((edge_sources, edge_destinations))
+        self.pre_task_offsets = self._offsets(edge_destinations)
+        self.pre_task_indices = edge_sources[pre_order].astype(np.int32)
+        self.pre_task_data_sizes = edge_data_sizes[pre_order]
+
+        # predecessor ids of each task padded with -1, at least one column wide.
+        pre_task_numbers = np.diff(self.pre_task_offsets)
+        self.pre_task_index = np.full((self.task_number, max(pre_task_numbers.max(initial=0), 1)), -1, dtype=np.int32)
+        for i in range(self.task_number):
+            self.pre_task_index[i, :pre_task_numbers[i]] = self.pre_tasks(i)
+
+        # get max data size and min data size, used to feature scaling.
+        data_sizes = np.concatenate([self.processing_data_sizes, edge_data_sizes])
+        self.max_data_size = np.max(data_sizes[data_sizes > 0.01])
+        self.min_data_size = np.min(data_sizes[data_sizes > 0.01])
+
+        for array in (self.processing_data_sizes, self.transmission_data_sizes, self.depths,
+                      self.pre_task_offsets, self.pre_task_indices, self.pre_task_data_sizes,
+                      self.succ_task_offsets, self.succ_task_indices, self.succ_task_data_sizes, self.pre_task_index):
+            array.setflags(write=False)
+
+        self.prioritize_sequence = prioritize_sequence
+
+    def _offsets(self, task_ids):
+        return np.concatenate([[0], np.cumsum(np.bincount(task_ids, minlength=self.task_number))]).astype(np.int32)
+
+    def pre_tasks(self, i):
+        return self.pre_task_indices[self.pre_task_offsets[i]:self.pre_task_offsets[i + 1]]
+
+    def succ_tasks(self, i):
+        return self.succ_task_indices[self.succ_task_offsets[i]:self.succ_task_offsets[i + 1]]
+
+    def prioritize_tasks(self, resource_cluster, cost_table=None):
+        # cost_table is an OffloadingCostTable of this graph on resource_cluster, used instead of recomputing the costs.
+        if cost_table is None:
+            t_locally = self.processing_data_sizes / resource_cluster.mobile_process_capable
+            t_mec = resource_cluster.up_transmission_cost(self.processing_data_sizes) + \
+                    self.processing_data_sizes / resource_cluster.mec_process_capble + \
+                    resource_cluster.dl_transmission_cost(self.transmission_data_sizes)
+        else:
+            t_locally = cost_table.local_cost
+            t_mec = cost_table.up_cost + cost_table.mec_cost + cost_table.dl_cost
+        w = np.minimum(t_locally, t_mec)
+
+        # successors are always deeper than their predecessors, rank the deepest tasks first.
+        rank = w.copy()
+        for i in np.argsort(-self.depths, kind='stable'):
+            succ_tasks = self.succ_tasks(i)
+            if len(succ_tasks) != 0:
+                rank[i] = w[i] + rank[succ_tasks].max()
+
+        sort = np.argsort(rank)[::-1]
+        self.prioritize_sequence = sort
+        return sort
+
+    def dependency_index_sequence(self, width=6):
+        """ The first `width` predecessors with a smaller id and successors with a larger id of each task,
+        padded with -1, as encoded in the point sequences.
+        """
+        pre_task_index_set = np.full((self.task_number, width), -1.0)
+        succs_task_index_set = np.full((self.task_number, width), -1.0)
+
+        for i in range(self.task_number):
+            start, end = self.pre_task_offsets[i], self.pre_task_offsets[i + 1]
+            pre_tasks = self.pre_task_indices[start:end]
+            pre_tasks = pre_tasks[(pre_tasks < i) & (self.pre_task_data_sizes[start:end] > 0.1)][:width]
+            pre_task_index_set[i, :len(pre_tasks)] = pre_tasks
+
+            start, end = self.succ_task_offsets[i], self.succ_task_offsets[i + 1]
+            succ_tasks = self.succ_task_indices[start:end]
+            succ_tasks = succ_tasks[(succ_tasks > i) & (self.succ_task_data_sizes[start:end] > 0.1)][:width]
+            succs_task_index_set[i, :len(succ_tasks)] = succ_tasks
+
+        return pre_task_index_set, succs_task_index_set
+
+    def norm_feature(self, data_size):
+        return (data_size - self.min_data_size) / (self.max_data_size - self.min_data_size)
+
+    def encode_point_sequence(self, encode_dependencies=True):
+        point_sequence = np.stack([self.norm_feature(self.processing_data_sizes),
+                                   self.norm_feature(self.transmission_data_sizes)], axis=1)
+        if encode_dependencies:
+            point_sequence = np.concatenate([point_sequence] + list(self.dependency_index_sequence()), axis=1)
+
+        return point_sequence
+
+    def encode_point_sequence_with_ranking(self, sorted_task, encode_dependencies=True):
+        return self.encode_point_sequence(encode_dependencies=encode_dependencies)[np.asarray(sorted_task)]
+
+    def encode_point_sequence_with_cost(self, resource_cluster, encode_dependencies=True, cost_table=None):
+        if cost_table is None:
+            costs = [self.processing_data_sizes / resource_cluster.mobile_process_capable,
+                     resource_cluster.up_transmission_cost(self.processing_data_sizes),
+                     self.processing_data_sizes / resource_cluster.mec_process_capble,
+                     resource_cluster.dl_transmission_cost(self.transmission_data_sizes)]
+        else:
+            costs = [cost_table.local_cost, cost_table.up_cost, cost_table.mec_cost, cost_table.dl_cost]
+        point_sequence = np.stack([np.arange(self.task_number, dtype=np.float64)] + costs, axis=1)
+        if encode_dependencies:
+            point_sequence = np.concatenate([point_sequence] + list(self.dependency_index_sequence()), axis=1)
+
+        return point_sequence
+
+    def encode_point_sequence_with_ranking_and_cost(self, sorted_task, resource_cluster, encode_dependencies=True,
+                                                    cost_table=None):
+        point_sequence = self.encode_point_sequence_with_cost(resource_cluster, encode_dependencies=encode_dependencies,
+                                                              cost_table=cost_table)
+        return point_sequence[np.asarray(sorted_task)]
+
+
 class OffloadingTaskGraph(object):
     def __init__(self, file_name, is_matrix=False):
         self._parse_from_dot(file_name, is_matrix)
@@ -140,6 +362,22 @@ class OffloadingTaskGraph(object):
         self.max_data_size = np.max(self.dependency[self.dependency > 0.01])
         self.min_data_size = np.min(self.dependency[self.dependency > 0.01])
 
+        # array form of the graph, the simulators and the encoders run on it.
+        dependencies = np.array(dependencies, dtype=np.int64).reshape(-1, 3)
+        self.graph_view = OffloadingTaskGraphView([task.processing_data_size for task in self.task_list],
+                                                  [task.transmission_data_size for task in self.task_list],
+                                                  [task.depth for task in self.task_list],
+                                                  dependencies[:, 0], dependencies[:, 1], dependencies[:, 2])
+        self.processing_data_sizes = self.graph_view.processing_data_sizes
+        self.transmission_data_sizes = self.graph_view.transmission_data_sizes
+        self.pre_task_index = self.graph_view.pre_task_index
+
+    def pre_tasks(self, i):
+        return self.graph_view.pre_tasks(i)
+
+    def succ_tasks(self, i):
+        return self.graph_view.succ_tasks(i)
+
     def add_task_list(self, task_list):
         self.task_list = task_list
 
@@ -167,102 +405,19 @@ class OffloadingTaskGraph(object):
 
     # TODO: change the encode point sequence to cost time
     def encode_point_sequence(self, encode_dependencies=True):
-        point_sequence = []
-        for i in range(self.task_number):
-            norm_processing_data_size = self.norm_feature(self.task_list[i].processing_data_size)
-            norm_transmission_data_size = self.norm_feature(self.task_list[i].transmission_data_size)
-            norm_data_size_list = [norm_processing_data_size, norm_transmission_data_size]
-            # heft_score = [self.task_list[i].heft_score]
-
-            pre_task_index_set = []
-            succs_task_index_set = []
-
-            for pre_task_index in range(0, i):
-                if self.dependency[pre_task_index][i] > 0.1:
-                    pre_task_index_set.append(pre_task_index)
-
-            while (len(pre_task_index_set) < 6):
-                pre_task_index_set.append(-1.0)
-
-            for succs_task_index in range(i + 1, self.task_number):
-                if self.dependency[i][succs_task_index] > 0.1:
-                    succs_task_index_set.append(succs_task_index)
-
-            while (len(succs_task_index_set) < 6):
-                succs_task_index_set.append(-1.0)
-
-            succs_task_index_set = succs_task_index_set[0:6]
-            pre_task_index_set = pre_task_index_set[0:6]
-
-            if encode_dependencies:
-                point_vector = norm_data_size_list + pre_task_index_set + succs_task_index_set
-            else:
-                point_vector = norm_data_size_list
-
-            point_sequence.append(point_vector)
-
-        return point_sequence
+        return self.graph_view.encode_point_sequence(encode_dependencies=encode_dependencies).tolist()
 
     def encode_point_sequence_with_ranking(self, sorted_task, encode_dependencies=True):
-        point_sequence = self.encode_point_sequence(encode_dependencies=encode_dependencies)
-
-        prioritize_point_sequence = []
-        for task_id in sorted_task:
-            prioritize_point_sequence.append(point_sequence[task_id])
-
-        return prioritize_point_sequence
+        return self.graph_view.encode_point_sequence_with_ranking(sorted_task,
+                                                                  encode_dependencies=encode_dependencies).tolist()
 
     def encode_point_sequence_with_cost(self, resource_cluster, encode_dependencies=True):
-        point_sequence = []
-        for i in range(self.task_number):
-            task = self.task_list[i]
-            local_process_cost = task.processing_data_size / resource_cluster.mobile_process_capable
-            up_link_cost = resource_cluster.up_transmission_cost(task.processing_data_size)
-            mec_process_cost = task.processing_data_size / resource_cluster.mec_process_capble
-            down_link_cost = resource_cluster.dl_transmission_cost(task.transmission_data_size)
-
-            task_embeding_vector = [i, local_process_cost, up_link_cost,
-                                    mec_process_cost, down_link_cost]
-
-            pre_task_index_set = []
-            succs_task_index_set = []
-
-            for pre_task_index in range(0, i):
-                if self.dependency[pre_task_index][i] > 0.1:
-                    pre_task_index_set.append(pre_task_index)
-
-            while (len(pre_task_index_set) < 6):
-                pre_task_index_set.append(-1.0)
-
-            for succs_task_index in range(i + 1, self.task_number):
-                if self.dependency[i][succs_task_index] > 0.1:
-                    succs_task_index_set.append(succs_task_index)
-
-            while (len(succs_task_index_set) < 6):
-                succs_task_index_set.append(-1.0)
-
-            succs_task_index_set = succs_task_index_set[0:6]
-            pre_task_index_set = pre_task_index_set[0:6]
-
-            if encode_dependencies:
-                point_vector = task_embeding_vector + pre_task_index_set + succs_task_index_set
-            else:
-                point_vector = task_embeding_vector
-
-            point_sequence.append(point_vector)
-
-        return point_sequence
-
+        return self.graph_view.encode_point_sequence_with_cost(resource_cluster,
+                                                               encode_dependencies=encode_dependencies).tolist()
 
     def encode_point_sequence_with_ranking_and_cost(self, sorted_task, resource_cluster, encode_dependencies=True):
-        point_sequence = self.encode_point_sequence_with_cost(resource_cluster, encode_dependencies=encode_dependencies)
-
-        prioritize_point_sequence = []
-        for task_id in sorted_task:
-            prioritize_point_sequence.append(point_sequence[task_id])
-
-        return prioritize_point_sequence
-
+        return self.graph_view.encode_point_sequence_with_ranking_and_cost(
+            sorted_task, resource_cluster, encode_dependencies=encode_dependencies).tolist()
 
     def encode_edge_sequence(self):
         edge_array = []
@@ -295,31 +450,7 @@ class OffloadingTaskGraph(object):
         print(self.edge_set)
 
     def prioritize_tasks(self, resource_cluster):
-        w = [0] * self.task_number
-        for i, task in enumerate(self.task_list):
-            t_locally = task.processing_data_size / resource_cluster.mobile_process_capable
-            t_mec = resource_cluster.up_transmission_cost(task.processing_data_size) + \
-                    task.processing_data_size / resource_cluster.mec_process_capble + \
-                    resource_cluster.dl_transmission_cost(task.transmission_data_size)
-
-            w[i] = min(t_locally, t_mec)
-
-        rank_dict = [-1] * self.task_number
-        def rank(task_index):
-            if rank_dict[task_index] != -1:
-                return rank_dict[task_index]
-
-            if len(self.succ_task_sets[task_index]) == 0:
-                rank_dict[task_index] = w[task_index]
-                return rank_dict[task_index]
-            else:
-                rank_dict[task_index] = w[task_index] + max(rank(j) for j in self.succ_task_sets[task_index])
-                return rank_dict[task_index]
-
-        for i in range(self.task_number):
-            rank(i)
-
-        sort = np.argsort(rank_dict)[::-1]
+        sort = self.graph_view.prioritize_tasks(resource_cluster)
         self.prioritize_sequence = sort
         return sort
 
@@ -2,6 +2,8 @@ import tensorflow as tf
 import numpy as np
 import itertools
 import functools
+import json
+import os
 import time
 
 from mpi4py import MPI
@@ -19,28 +21,19 @@ from rltaskoffloading.environment.offloading_env import OffloadingEnvironment
 from rltaskoffloading.environment.offloading_env import Resources
 
 from rltaskoffloading.common.misc_util import zipsame
-from rltaskoffloading.offloading_ddqn.seq2seq_replay_buffer import SeqReplayBuffer
+from rltaskoffloading.offloading_ddqn.seq2seq_replay_buffer import SeqReplayBuffer, PrioritizedSeqReplayBuffer
 
 def calculate_qoe(latency_batch, energy_batch, env):
-    all_local_time, all_local_energy = env.get_all_locally_execute_time_batch()
-    all_local_time = np.squeeze(all_local_time)
-    all_local_energy = np.squeeze(all_local_energy)
-    latency_batch = np.squeeze(latency_batch)
-    energy_batch = np.squeeze(energy_batch)
-    qoe_batch = []
-
-    for latency, energy, single_all_local_latency, single_all_local_energy in zip(latency_batch, energy_batch, all_local_time, all_local_energy):
-        qoe = env.lambda_t * ((latency - single_all_local_latency) / single_all_local_latency) + \
-              env.lambda_e * ((energy - single_all_local_energy) / single_all_local_energy)
-
-        qoe = -qoe
-        qoe_batch.append(qoe)
-
-    return qoe_batch
+    # the all local baseline of every graph is cached by the environment.
+    return env.calculate_qoe(latency_batch, energy_batch)
 
 # LSTM + DuelQnets + Double Deep Q-learning
 class LSTMDDQN(object):
-    def __init__(self, hparams, ob_dim, gamma, max_grad_norm):
+    def __init__(self, hparams, ob_dim, gamma, max_grad_norm, deferred_target=False):
+        """ With deferred_target the double DQN target is computed in the training step from the sampled
+        sequences, by the online and the target q net in one session run. The rollouts then only run the
+        online q net and the replay buffers store no target q values, which also never get stale.
+        """
         # placeholder for qnet
         self.ob_input = tf.placeholder(dtype=tf.float32, shape=[None, None, ob_dim])
 
@@ -53,6 +46,10 @@ class LSTMDDQN(object):
         # sequential reward
         self.r = tf.placeholder(tf.float32, [None, None])
         self.lr = tf.placeholder(tf.float32, [])
+        # importance sampling weight of every sequence, for prioritized replay.
+        self.importance_weights = tf.placeholder(tf.float32, [None])
+        # 0 in the padded steps of the sequences shorter than the batch.
+        self.masks = tf.placeholder(tf.float32, [None, None])
 
         self.q_net = LSTMDuelQnet("qnet", hparams, reuse=True,
                             encoder_inputs=self.ob_input, actions=self.action
@@ -68,10 +65,25 @@ class LSTMDDQN(object):
         # define loss function here:
         # target q-network evaluation, this q value is estimiated by double deep q learning
 
+        self.deferred_target = deferred_target
+        if deferred_target:
+            # get Q(S_{t+1}, argmax_{a}Q(S_{t+1}, a; \theta_t), \theta_t^-), the target q net reads the
+            # sampled sequences from target_ob_input.
+            greedy_actions_one_hot = tf.one_hot(self.q_net.greedy_actions, hparams.n_features, dtype=tf.float32)
+            target_q = tf.reduce_sum(self.target_q_net.q_logits * greedy_actions_one_hot, axis=-1)
+            next_masks = tf.concat([self.masks[:, 1:], tf.zeros_like(self.masks[:, :1])], axis=1)
+            target_next_q = tf.concat([target_q[:, 1:], tf.zeros_like(target_q[:, :1])], axis=1) * next_masks
+        else:
+            target_next_q = self.target_next_q
+
         # define the double the loss function of double dqn
-        q_selected_target = self.r + gamma * tf.stop_gradient(self.target_next_q)
+        q_selected_target = self.r + gamma * tf.stop_gradient(target_next_q)
         td_error = self.q_net.q - q_selected_target
-        self.q_loss = tf.reduce_mean(U.huber_loss(td_error))
+        self.q_loss = tf.reduce_sum(tf.expand_dims(self.importance_weights, -1) * U.huber_loss(td_error) * self.masks) / \
+                      tf.reduce_sum(self.masks)
+        # the priority of a sequence in prioritized replay.
+        self.sequence_td_error = tf.reduce_sum(tf.abs(td_error) * self.masks, axis=-1) / \
+                                 tf.reduce_sum(self.masks, axis=-1)
 
         params = self.q_net.get_trainable_variables()
         trainer = MpiAdamOptimizer(MPI.COMM_WORLD, learning_rate=self.lr, epsilon=1e-5)
@@ -90,15 +102,27 @@ class LSTMDDQN(object):
         self.step = self.q_net.step
 
     def train(self, sess, learning_rate, obs, rewards, actions,
-              target_next_q_values):
+              target_next_q_values, importance_weights=None, masks=None):
+        """ One training step, returns the loss and the mean absolute TD error of every sequence. """
+        if importance_weights is None:
+            importance_weights = np.ones(len(obs), dtype=np.float32)
+        if masks is None:
+            masks = np.ones(np.shape(actions), dtype=np.float32)
 
         td_map = {self.lr: learning_rate,
                   self.ob_input: obs,
                   self.r: rewards,
                   self.action: actions,
-                  self.target_next_q: target_next_q_values}
+                  self.importance_weights: importance_weights,
+                  self.masks: masks}
+        # the deferred target needs no target_next_q_values.
+        if self.deferred_target:
+            td_map[self.target_ob_input] = obs
+        else:
+            td_map[self.target_next_q] = target_next_q_values
 
-        return sess.run([self.q_loss, self._train], td_map)
+        q_loss, sequence_td_error, _ = sess.run([self.q_loss, self.sequence_td_error, self._train], td_map)
+        return q_loss, sequence_td_error
 
     def save(self, model_path):
         sess = tf.get_default_session()
@@ -136,12 +160,18 @@ class Runner(object):
                 greedy_decoder_input =  np.column_stack(
                     (np.ones(greedy_actions.shape[0], dtype=np.int32) * self.env.start_symbol, sample_actions[:, 0:-1]))
 
-                target_next_q = self.model.target_q_net.get_qvalues(encoder_input_batch=encoder_batch,
-                                                                    actions=greedy_actions)
+                if self.model.deferred_target:
+                    target_next_q = None
+                else:
+                    target_next_q = self.model.target_q_net.get_qvalues(encoder_input_batch=encoder_batch,
+                                                                        actions=greedy_actions)
 
-                # get Q(S_{t+1}, argmax_{a}Q(S_{t+1}, a; \theta_t), \theta_t^-).
-                target_next_q = np.column_stack(
-                    (target_next_q[:, 1:], np.zeros(greedy_actions.shape[0], dtype=np.int32)))
+                    # get Q(S_{t+1}, argmax_{a}Q(S_{t+1}, a; \theta_t), \theta_t^-).
+                    target_next_q = np.column_stack(
+                        (target_next_q[:, 1:], np.zeros(greedy_actions.shape[0], dtype=np.int32)))
+                    # there is no next step after the last task of a graph shorter than the batch either.
+                    target_next_q *= OffloadingEnvironment.sequence_mask(np.asarray(decoder_lengths) - 1,
+                                                                         target_next_q.shape[1])
 
                 rewards = self.env.step(task_graph_batch=task_graph_batch, action_sequence_batch=sample_actions,
                                         max_running_time_batch=max_running_time,
@@ -193,14 +223,48 @@ def ddqn_learning(env,
                   batch_size=500,
                   log_interval=1,
                   update_numbers=10,
-                  load_path=None):
+                  load_path=None,
+                  prioritized_replay=False,
+                  prioritized_replay_alpha=0.6,
+                  prioritized_replay_beta0=0.4,
+                  shared_replay=False,
+                  bucket_mixing=1.0,
+                  replay_path=None):
+    """ With shared_replay the graph batches of all the task numbers go into one replay buffer of
+    reply_buffer_size sequences instead of reply_buffer_num buffers, and every update step trains
+    on one padded and masked batch of batch_size sequences. bucket_mixing is the share of each batch
+    drawn across the task numbers, the rest is drawn from a single task number, see
+    SeqReplayBuffer.random_sample, with prioritized_replay as well.
+
+    With replay_path the replay buffers are memory mapped in that directory and checkpointed with the
+    model, which is saved there as model.ckpt. A training started again with the same replay_path resumes from the last checkpoint with
+    its replay buffers, without a new warm up.
+    """
     sess = tf.get_default_session()
-
-    replay_buffers = []
-    for _ in range(reply_buffer_num):
-        replay_buffers.append(SeqReplayBuffer(size=reply_buffer_size))
-
-    runner = Runner(model=ddqn_model, env=env, nepisode=nsample_episode, replay_buffers=replay_buffers)
+    # a resumable training keeps its model next to the replay buffers it was trained on.
+    if replay_path is None:
+        model_path = "./checkpoint/ddqn_offloading_model.ckpt"
+    else:
+        model_path = os.path.join(replay_path, "model.ckpt")
+
+    def make_replay_buffer(index, max_length=None):
+        storage_path = None if replay_path is None else os.path.join(replay_path, str(index))
+        if prioritized_replay:
+            return PrioritizedSeqReplayBuffer(size=reply_buffer_size, alpha=prioritized_replay_alpha,
+                                              max_length=max_length, storage_path=storage_path)
+        return SeqReplayBuffer(size=reply_buffer_size, max_length=max_length, storage_path=storage_path)
+
+    if shared_replay:
+        max_length = max(np.shape(encoder_batch)[1] for encoder_batch in env.encoder_batchs)
+        replay_buffers = [make_replay_buffer(0, max_length)]
+        runner_replay_buffers = replay_buffers * len(env.encoder_batchs)
+    else:
+        replay_buffers = [make_replay_buffer(i) for i in range(reply_buffer_num)]
+        runner_replay_buffers = replay_buffers
+    # the importance sampling correction is annealed to full correction at the end of the training.
+    beta_schedule = LinearSchedule(schedule_timesteps=nupdates, final_p=1.0, initial_p=prioritized_replay_beta0)
+
+    runner = Runner(model=ddqn_model, env=env, nepisode=nsample_episode, replay_buffers=runner_replay_buffers)
 
     eval_runners = []
     if eval_envs is not None:
@@ -208,11 +272,21 @@ def ddqn_learning(env,
             eval_runners.append(Runner(model=ddqn_model, env=eval_env, nepisode=1, replay_buffers=None))
 
     exploration = LinearSchedule(schedule_timesteps=nupdates//2, final_p=final_epsilon, initial_p=1.0)
-    # warm up period
-    for _ in range(warmup_episode):
-        runner.run(epsilon_threshold=1.0)
 
-    for update in range(1, nupdates+1):
+    progress_path = None if replay_path is None else os.path.join(replay_path, "progress.json")
+    if progress_path is not None and os.path.exists(progress_path):
+        with open(progress_path) as progress_file:
+            start_update = json.load(progress_file)["update"] + 1
+        ddqn_model.load(model_path)
+        print("Resume from update {} with {} replayed sequences".format(
+            start_update, sum(replay_buffer.size() for replay_buffer in replay_buffers)))
+    else:
+        start_update = 1
+        # warm up period
+        for _ in range(warmup_episode):
+            runner.run(epsilon_threshold=1.0)
+
+    for update in range(start_update, nupdates+1):
         tstart = time.time()
 
         # sample trajectories from the envrionment
@@ -225,13 +299,26 @@ def ddqn_learning(env,
             for _ in range(update_numbers):
                 batch_losses = []
                 for replay_buffer in replay_buffers:
-                    ob_seq, ac_seq, dec_input_seq, decoder_full_length, greedy_ac_seq, \
-                    greedy_dec_input_seq, rew_seq, target_next_q = replay_buffer.random_sample(batch_size)
-
-                    q_loss, _ = ddqn_model.train(sess, learning_rate=lr, obs=ob_seq,
+                    if prioritized_replay:
+                        ob_seq, ac_seq, dec_input_seq, decoder_full_length, greedy_ac_seq, \
+                        greedy_dec_input_seq, rew_seq, target_next_q, masks, weights, idxes = \
+                            replay_buffer.sample(batch_size, beta=beta_schedule.value(update),
+                                                 bucket_mixing=bucket_mixing)
+                    else:
+                        ob_seq, ac_seq, dec_input_seq, decoder_full_length, greedy_ac_seq, \
+                        greedy_dec_input_seq, rew_seq, target_next_q, masks = \
+                            replay_buffer.random_sample(batch_size, bucket_mixing=bucket_mixing)
+                        weights = None
+
+                    q_loss, td_errors = ddqn_model.train(sess, learning_rate=lr, obs=ob_seq,
                                   rewards=rew_seq,
                                   target_next_q_values=target_next_q,
-                                  actions=ac_seq)
+                                  actions=ac_seq,
+                                  importance_weights=weights,
+                                  masks=masks)
+
+                    if prioritized_replay:
+                        replay_buffer.update_priorities(idxes, td_errors)
 
                     batch_losses.append(q_loss)
 
@@ -246,7 +333,19 @@ def ddqn_learning(env,
 
         if update % eval_freq == 0:
             # add the
-            ddqn_model.save("./checkpoint/ddqn_offloading_model.ckpt")
+            if replay_path is None:
+                ddqn_model.save(model_path)
+            else:
+                # the model is swapped in whole, the last one stays valid until the progress is written.
+                ddqn_model.save(model_path + ".tmp")
+                os.replace(model_path + ".tmp", model_path)
+                for replay_buffer in replay_buffers:
+                    replay_buffer.checkpoint()
+                # the progress commits the checkpoint of the model and the replay buffers.
+                os.makedirs(replay_path, exist_ok=True)
+                with open(progress_path + ".tmp", "w") as progress_file:
+                    json.dump(dict(update=update), progress_file)
+                os.replace(progress_path + ".tmp", progress_path)
             running_cost = []
             energy_consumption = []
             running_qoe = []
@@ -283,7 +382,8 @@ def DDQNTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DDQNTO-all-grap
            end_token=5, is_bidencoder=True,
            train_graph_file_paths=["../offloading_data/offload_random10/random.10."],
            test_graph_file_paths=["../offloading_data/offload_random10_test/random.10."],
-           batch_size=500, graph_number=500):
+           batch_size=500, graph_number=500, prioritized_replay=False, shared_replay=False, bucket_mixing=1.0,
+           deferred_target=False, replay_path=None):
 
     logger.configure(logpath, ['stdout', 'json', 'csv'])
 
@@ -329,7 +429,8 @@ def DDQNTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DDQNTO-all-grap
         eval_envs.append(eval_env)
     print("Finishing initialization of environment")
 
-    model = LSTMDDQN(hparams=hparams, ob_dim=env.input_dim, gamma=0.99, max_grad_norm=1.0)
+    model = LSTMDDQN(hparams=hparams, ob_dim=env.input_dim, gamma=0.99, max_grad_norm=1.0,
+                     deferred_target=deferred_target)
 
     with tf.Session() as sess:
         sess.run(tf.global_variables_initializer())
@@ -348,7 +449,11 @@ def DDQNTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DDQNTO-all-grap
                       lr=5e-4,
                       batch_size=500,
                       update_numbers=10,
-                      load_path=None
+                      load_path=None,
+                      prioritized_replay=prioritized_replay,
+                      shared_replay=shared_replay,
+                      bucket_mixing=bucket_mixing,
+                      replay_path=replay_path
                       )
 
 def DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
@@ -360,7 +465,8 @@ def DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
            train_graph_file_paths=["../offloading_data/offload_random10/random.10."],
            test_graph_file_paths=["../offloading_data/offload_random10_test/random.10."],
            batch_size=500, graph_number=500,
-           bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0]):
+           bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0], prioritized_replay=False, shared_replay=False,
+           bucket_mixing=1.0, deferred_target=False, replay_path=None):
 
     logger.configure(logpath, ['stdout', 'json', 'csv'])
 
@@ -384,7 +490,7 @@ def DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
         is_bidencoder=is_bidencoder
     )
 
-    def test_case(bandwidth=5.0, log_path='./log', lambda_t=1.0, lambda_e=0.0, nupdates=2000):
+    def test_case(bandwidth=5.0, log_path='./log', lambda_t=1.0, lambda_e=0.0, nupdates=2000, replay_path=None):
         logger.configure(log_path, ['stdout', 'json', 'csv'])
         resource_cluster = Resources(mec_process_capable=(10.0 * 1024 * 1024),
                                      mobile_process_capable=(1.0 * 1024 * 1024), bandwith_up=bandwidth,
@@ -416,7 +522,8 @@ def DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
             inter_op_parallelism_threads=4)
 
         with tf.Session(config=session_conf) as sess:
-            model = LSTMDDQN(hparams=hparams, ob_dim=env.input_dim, gamma=0.99, max_grad_norm=1.0)
+            model = LSTMDDQN(hparams=hparams, ob_dim=env.input_dim, gamma=0.99, max_grad_norm=1.0,
+                             deferred_target=deferred_target)
             sess.run(tf.global_variables_initializer())
             ddqn_learning(env=env,
                           eval_envs=eval_envs,
@@ -433,14 +540,19 @@ def DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
                           lr=5e-4,
                           batch_size=500,
                           update_numbers=10,
-                          load_path=None
+                          load_path=None,
+                          prioritized_replay=prioritized_replay,
+                          shared_replay=shared_replay,
+                          bucket_mixing=bucket_mixing,
+                          replay_path=replay_path
                           )
             sess.close()
 
         tf.reset_default_graph()
 
     for bandwidth in bandwidths:
-        test_case(bandwidth=bandwidth, lambda_t=lambda_t, lambda_e=lambda_e, log_path=logpath + '-' + str(bandwidth) +'Mbps')
+        test_case(bandwidth=bandwidth, lambda_t=lambda_t, lambda_e=lambda_e, log_path=logpath + '-' + str(bandwidth) +'Mbps',
+                  replay_path=None if replay_path is None else replay_path + '-' + str(bandwidth) + 'Mbps')
 
 
 if __name__ == "__main__":
@@ -1,67 +1,271 @@
+import json
+import os
+
 import numpy as np
-import random
+
+from rltaskoffloading.common.segment_tree import SumSegmentTree
 
 
 class SeqReplayBuffer(object):
-    def __init__(self, size):
+    FIELD_NAMES = ("observation", "action", "decoder_input", "decoder_full_length",
+                   "greedy_action", "greedy_decoder_input", "reward", "target_next_q")
+    # the field of the sequence lengths, all the other fields have a time axis.
+    LENGTH_FIELD = 3
+
+    def __init__(self, size, max_length=None, storage_path=None):
         """ Create the replay buffer to store the sequence data
 
+        The sequences are stored in a ring of preallocated arrays, one per field, allocated with the
+        shapes and the dtypes of the first batch. A batch is written with a slice assignment, wrapping
+        around at the end, and sampling copies only the sampled rows.
+
+        Without max_length all the sequences have the length of the first batch, as the graph batches
+        of one task number. With max_length the buffer is shared by the graphs of all the task numbers,
+        every sequence is padded to max_length and the samples are cut to their longest sequence.
+
+        A field given as None, e.g. the target q values of a deferred target, is not stored and is
+        sampled as None.
+
+        With storage_path the fields are memory mapped .npy files in that directory, so the buffer
+        may be larger than the memory and is paged in by the operating system. checkpoint() records
+        the state of the ring there, and a buffer created later on the same storage_path resumes from
+        the last checkpoint with the sequences stored so far.
         """
-        self._observation_sequence = []
-        self._action_sequence = []
-        self._decoder_input_sequence = []
-        self._decoder_full_length = []
-        self._greedy_action_sequence = []
-        self._greedy_decoder_input_sequence = []
-        self._reward_sequence = []
-        self._target_next_q = []
+        self._storage = None
 
         self._maxsize = size
+        self._max_length = max_length
+        self._storage_path = storage_path
         self._next_idx = 0
+        self._size = 0
+
+        if storage_path is not None and os.path.exists(self._state_path()):
+            with open(self._state_path()) as state_file:
+                self._resume(json.load(state_file))
+
+    def _field_path(self, name):
+        return os.path.join(self._storage_path, name + ".npy")
+
+    def _state_path(self):
+        return os.path.join(self._storage_path, "replay_buffer.json")
+
+    def _allocate(self, batch):
+        if self._storage_path is None:
+            self._storage = [None if field is None else np.zeros((self._maxsize,) + field.shape[1:], dtype=field.dtype)
+                             for field in batch]
+            return
+
+        os.makedirs(self._storage_path, exist_ok=True)
+        self._storage = [None if field is None else
+                         np.lib.format.open_memmap(self._field_path(name), mode="w+", dtype=field.dtype,
+                                                   shape=(self._maxsize,) + field.shape[1:])
+                         for name, field in zip(self.FIELD_NAMES, batch)]
+
+    def _state(self):
+        return dict(size=int(self._maxsize), max_length=None if self._max_length is None else int(self._max_length),
+                    next_idx=int(self._next_idx), stored_size=int(self._size),
+                    fields=[name for name, array in zip(self.FIELD_NAMES, self._storage) if array is not None])
+
+    def _resume(self, state):
+        if state["size"] != self._maxsize or state["max_length"] != self._max_length:
+            raise ValueError("the replay buffer in {} has size {} and max_length {}".format(
+                self._storage_path, state["size"], state["max_length"]))
+
+        self._storage = [np.load(self._field_path(name), mmap_mode="r+") if name in state["fields"] else None
+                         for name in self.FIELD_NAMES]
+        self._next_idx = state["next_idx"]
+        self._size = state["stored_size"]
+
+    def _write_checkpoint(self):
+        """ Everything but the state of the ring, which commits the checkpoint. """
+        for array in self._storage:
+            if array is not None:
+                array.flush()
+
+    def checkpoint(self):
+        """ Flush the sequences to storage_path and record the state of the ring.
+
+        The rows written after the last checkpoint are on disk as well, but a resumed buffer only
+        counts the sequences of the last checkpoint, so they are overwritten first.
+        """
+        assert self._storage_path is not None, "only a buffer with a storage_path can be checkpointed"
+        if self._storage is None:
+            return
+
+        self._write_checkpoint()
+        temporary_path = self._state_path() + ".tmp"
+        with open(temporary_path, "w") as state_file:
+            json.dump(self._state(), state_file)
+        os.replace(temporary_path, self._state_path())
+
+    def _pad(self, batch):
+        padded_batch = []
+        for i, field in enumerate(batch):
+            if field is not None and i != self.LENGTH_FIELD and field.shape[1] < self._max_length:
+                padding = [(0, 0)] * field.ndim
+                padding[1] = (0, self._max_length - field.shape[1])
+                field = np.pad(field, padding, mode='constant')
+            padded_batch.append(field)
+        return padded_batch
 
     def add_batch(self, batch_ob_seq, batch_act_seq, batch_dec_seq, batch_dec_length,
                   batch_greedy_act_seq, batch_greedy_dec_seq, batch_rew_seq, batch_target_next_q
                   ):
-        for ob_seq, act_seq, dec_seq, dec_length, greedy_act_seq, greedy_dec_seq, rew_seq, target_next_q in zip(batch_ob_seq, batch_act_seq, batch_dec_seq, batch_dec_length,
-                  batch_greedy_act_seq, batch_greedy_dec_seq, batch_rew_seq, batch_target_next_q):
-            self.add(ob_seq, act_seq, dec_seq, dec_length,  greedy_act_seq, greedy_dec_seq, rew_seq, target_next_q)
+        """ Add a batch of sequences, returns the indices of the rows they are stored in. """
+        batch = [None if field is None else np.asarray(field)
+                 for field in (batch_ob_seq, batch_act_seq, batch_dec_seq, batch_dec_length,
+                               batch_greedy_act_seq, batch_greedy_dec_seq, batch_rew_seq, batch_target_next_q)]
+        if self._max_length is not None:
+            batch = self._pad(batch)
+        if self._storage is None:
+            self._allocate(batch)
+        for field, array in zip(batch, self._storage):
+            if (field is None) != (array is None):
+                raise ValueError("the fields given as None differ from the ones of the first batch")
+            if field is not None and field.shape[1:] != array.shape[1:]:
+                raise ValueError("sequences of shape {} do not fit the replay buffer of shape {}".format(
+                    field.shape[1:], array.shape[1:]))
+
+        batch_size = len(batch[0])
+        # of a batch larger than the buffer only the last sequences would survive.
+        if batch_size > self._maxsize:
+            self._next_idx = (self._next_idx + batch_size - self._maxsize) % self._maxsize
+            self._size = self._maxsize
+            batch = [None if field is None else field[-self._maxsize:] for field in batch]
+            batch_size = self._maxsize
+
+        idxes = (self._next_idx + np.arange(batch_size)) % self._maxsize
+        first = min(batch_size, self._maxsize - self._next_idx)
+        for field, array in zip(batch, self._storage):
+            if field is not None:
+                array[self._next_idx:self._next_idx + first] = field[:first]
+                array[:batch_size - first] = field[first:]
+
+        self._next_idx = (self._next_idx + batch_size) % self._maxsize
+        self._size = min(self._size + batch_size, self._maxsize)
+        return idxes
 
     def add(self, ob_seq, act_seq, dec_seq, dec_length, greedy_act_seq, greedy_dec_seq, rew_seq, target_next_q):
-        if self._next_idx >= len(self._observation_sequence):
-            self._observation_sequence.append(ob_seq)
-            self._action_sequence.append(act_seq)
-            self._decoder_input_sequence.append(dec_seq)
-            self._decoder_full_length.append(dec_length)
-            self._greedy_action_sequence.append(greedy_act_seq)
-            self._greedy_decoder_input_sequence.append(greedy_dec_seq)
-            self._reward_sequence.append(rew_seq)
-            self._target_next_q.append(target_next_q)
-        else:
-            self._observation_sequence[self._next_idx] = ob_seq
-            self._action_sequence[self._next_idx] = act_seq
-            self._decoder_input_sequence[self._next_idx] = dec_seq
-            self._decoder_full_length[self._next_idx] = dec_length
-            self._greedy_action_sequence[self._next_idx] = greedy_act_seq
-            self._greedy_decoder_input_sequence[self._next_idx] = greedy_dec_seq
-            self._reward_sequence[self._next_idx] = rew_seq
-            self._target_next_q[self._next_idx] = target_next_q
-
-        self._next_idx = (self._next_idx + 1) % self._maxsize
+        return self.add_batch(*[None if field is None else [field] for field in (ob_seq, act_seq, dec_seq, dec_length,
+                                               greedy_act_seq, greedy_dec_seq, rew_seq, target_next_q)])
 
     def size(self):
-        return len(self._observation_sequence)
-
-    def random_sample(self, batch_size):
-        idxes = [random.randint(0, len(self._observation_sequence) - 1) for _ in range(batch_size)]
-
-        return np.array(self._observation_sequence)[idxes], \
-               np.array(self._action_sequence)[idxes], \
-               np.array(self._decoder_input_sequence)[idxes], \
-               np.array(self._decoder_full_length)[idxes], \
-               np.array(self._greedy_action_sequence)[idxes], \
-               np.array(self._greedy_decoder_input_sequence)[idxes], \
-               np.array(self._reward_sequence)[idxes], \
-               np.array(self._target_next_q)[idxes]
+        return self._size
+
+    def _gather(self, idxes):
+        """ The fields of the sequences idxes cut to the longest of them, followed by their masks. """
+        lengths = self._storage[self.LENGTH_FIELD][idxes]
+        max_length = np.max(lengths)
+
+        fields = [None if array is None else array[idxes] if i == self.LENGTH_FIELD else array[idxes, :max_length]
+                  for i, array in enumerate(self._storage)]
+        masks = (np.arange(max_length) < lengths[:, None]).astype(np.float32)
+        return tuple(fields) + (masks,)
+
+    def random_sample(self, batch_size, bucket_mixing=1.0):
+        """ Sample batch_size sequences, returns their fields and their masks, 0 in the padded steps.
+
+        With bucket_mixing < 1 a share 1 - bucket_mixing of the batch is drawn from the sequences of
+        one length only, picked in proportion to the number of its sequences, and the rest from all
+        the sequences. A smaller mixing pads less, 0 gives batches of a single length.
+        """
+        idxes = np.random.randint(0, self._size, size=batch_size)
+
+        bucket_number = int(round((1.0 - bucket_mixing) * batch_size))
+        if bucket_number > 0:
+            lengths = self._storage[self.LENGTH_FIELD][:self._size]
+            bucket = np.flatnonzero(lengths == lengths[idxes[0]])
+            idxes[:bucket_number] = bucket[np.random.randint(0, len(bucket), size=bucket_number)]
+
+        return self._gather(idxes)
+
+
+class PrioritizedSeqReplayBuffer(SeqReplayBuffer):
+    def __init__(self, size, alpha, max_length=None, storage_path=None, eps=1e-6):
+        """ Create the prioritized replay buffer to store the sequence data
+
+        A sequence is sampled with probability proportional to its priority ** alpha, its priority
+        is the mean absolute TD error of its steps when it was last trained on. New sequences get
+        the largest priority so far, to be trained on at least once. alpha = 0 is uniform sampling.
+        See SeqReplayBuffer for max_length and storage_path, the priorities are checkpointed with the
+        sequences.
+        """
+        assert alpha >= 0
+        self._alpha = alpha
+        self._eps = eps
+        self._it_sum = SumSegmentTree(size)
+        self._max_priority = 1.0
+        # the priorities have to exist before a checkpoint is resumed.
+        super(PrioritizedSeqReplayBuffer, self).__init__(size, max_length=max_length, storage_path=storage_path)
+
+    def _state(self):
+        state = super(PrioritizedSeqReplayBuffer, self)._state()
+        state["max_priority"] = self._max_priority
+        return state
+
+    def _resume(self, state):
+        super(PrioritizedSeqReplayBuffer, self)._resume(state)
+        self._it_sum[np.arange(self._maxsize)] = np.load(os.path.join(self._storage_path, "priorities.npy"))
+        self._max_priority = state["max_priority"]
+
+    def _write_checkpoint(self):
+        super(PrioritizedSeqReplayBuffer, self)._write_checkpoint()
+        priorities_path = os.path.join(self._storage_path, "priorities.npy")
+        with open(priorities_path + ".tmp", "wb") as priorities_file:
+            np.save(priorities_file, self._it_sum[np.arange(self._maxsize)])
+        os.replace(priorities_path + ".tmp", priorities_path)
+
+    def add_batch(self, *args, **kwargs):
+        idxes = super(PrioritizedSeqReplayBuffer, self).add_batch(*args, **kwargs)
+        self._it_sum[idxes] = self._max_priority ** self._alpha
+        return idxes
+
+    def _sample_proportional(self, batch_size):
+        # one prefix sum from each of batch_size equal segments of the total priority.
+        prefixsum = (np.arange(batch_size) + np.random.random(size=batch_size)) * (self._it_sum.sum() / batch_size)
+        idxes = self._it_sum.find_prefixsum_idx(prefixsum)
+        return np.minimum(idxes, self._size - 1)
+
+    def _sample_bucket(self, bucket_number):
+        # the length is that of a prioritized draw and the sequences are drawn by priority within it,
+        # so every sequence is still sampled with probability priority / total priority.
+        lengths = self._storage[self.LENGTH_FIELD][:self._size]
+        first = self._sample_proportional(1)
+        bucket = np.flatnonzero(lengths == lengths[first[0]])
+        bucket_prefixsum = np.cumsum(self._it_sum[bucket])
+        positions = np.searchsorted(bucket_prefixsum, np.random.random(size=bucket_number) * bucket_prefixsum[-1],
+                                    side='right')
+        return bucket[np.minimum(positions, len(bucket) - 1)]
+
+    def sample(self, batch_size, beta, bucket_mixing=1.0):
+        """ Sample a batch of sequences with their importance sampling weights.
+
+        The weights (p_i * size) ** -beta correct the bias of the prioritized sampling, beta = 1
+        corrects it fully. They are scaled by the largest weight of the batch, so they only scale
+        the loss down. bucket_mixing is as in random_sample, the sequences of the single length are
+        drawn by priority as well.
+
+        Returns the fields and the masks of random_sample followed by the weights and the indices of the sampled
+        sequences, to pass back to update_priorities.
+        """
+        assert beta > 0
+        idxes = self._sample_proportional(batch_size)
+
+        bucket_number = int(round((1.0 - bucket_mixing) * batch_size))
+        if bucket_number > 0:
+            idxes[np.random.choice(batch_size, bucket_number, replace=False)] = self._sample_bucket(bucket_number)
+
+        p_sample = self._it_sum[idxes] / self._it_sum.sum()
+        weights = (p_sample * self._size) ** (-beta)
+        weights = (weights / weights.max()).astype(np.float32)
+
+        return self._gather(idxes) + (weights, idxes)
+
+    def update_priorities(self, idxes, priorities):
+        """ Set the priorities of the sequences idxes, e.g. to their mean absolute TD errors. """
+        priorities = np.asarray(priorities, dtype=np.float64) + self._eps
+        self._it_sum[idxes] = priorities ** self._alpha
+        self._max_priority = max(self._max_priority, priorities.max())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import multiprocessing
+import queue
+
+import numpy as np
+
+"""
+Evaluation of the offloading policy on a set of evaluation environments.
+
+All the graph batches of all the environments are packed into one batch padded to the longest
+graph, so every evaluation is a single sampling and a single greedy decoder call. The plans are
+cut back to the length of each graph and simulated batch by batch.
+"""
+
+
+def pad_encoder_batchs(encoder_batchs, encoder_lengths):
+    """ Stack batch major encoder batches of different sequence lengths, padded with zeros.
+
+    Returns the padded batch (graphs, max_length, input_dim) and the real length of every graph.
+    """
+    max_length = max(encoder_batch.shape[1] for encoder_batch in encoder_batchs)
+    graph_number = sum(encoder_batch.shape[0] for encoder_batch in encoder_batchs)
+    input_dim = encoder_batchs[0].shape[2]
+
+    encoder_input = np.zeros((graph_number, max_length, input_dim), dtype=np.float32)
+    lengths = np.empty(graph_number, dtype=np.int32)
+    start = 0
+    for encoder_batch, encoder_length in zip(encoder_batchs, encoder_lengths):
+        end = start + encoder_batch.shape[0]
+        encoder_input[start:end, :encoder_batch.shape[1]] = encoder_batch
+        lengths[start:end] = encoder_length
+        start = end
+
+    return encoder_input, lengths
+
+
+class Evaluator(object):
+    def __init__(self, eval_envs):
+        self.eval_envs = eval_envs
+
+        # (env index, graph batch, first row, last row, sequence length) of every packed graph batch.
+        self.batch_slices = []
+        encoder_batchs = []
+        encoder_lengths = []
+        start = 0
+        for env_index, env in enumerate(eval_envs):
+            for task_graph_batch, encoder_batch, encoder_length in zip(env.task_graphs, env.encoder_batchs,
+                                                                       env.encoder_lengths):
+                end = start + len(task_graph_batch)
+                self.batch_slices.append((env_index, task_graph_batch, start, end, encoder_batch.shape[1]))
+                encoder_batchs.append(encoder_batch)
+                encoder_lengths.append(encoder_length)
+                start = end
+
+        self.encoder_input, self.lengths = pad_encoder_batchs(encoder_batchs, encoder_lengths)
+
+    def simulate(self, actions):
+        """ Mean latency, energy consumption and QoE of the plans on every evaluation environment. """
+        latency = [[] for _ in self.eval_envs]
+        energy = [[] for _ in self.eval_envs]
+        qoe = [[] for _ in self.eval_envs]
+
+        for env_index, task_graph_batch, start, end, length in self.batch_slices:
+            env = self.eval_envs[env_index]
+            latency_batch, energy_batch, qoe_batch = env.get_qoe_batch(actions[start:end, :length], task_graph_batch)
+
+            latency[env_index].append(latency_batch)
+            energy[env_index].append(energy_batch)
+            qoe[env_index].append(qoe_batch)
+
+        return [(np.mean(np.concatenate(env_latency)), np.mean(np.concatenate(env_energy)),
+                 np.mean(np.concatenate(env_qoe))) for env_latency, env_energy, env_qoe in zip(latency, energy, qoe)]
+
+    def evaluate(self, model):
+        """ (latency, energy, qoe) of every evaluation environment for the sampled and the greedy plans. """
+        # both decoders start from the same encoder outputs.
+        encoded = model.encode(encoder_input_batch=self.encoder_input, encoder_lengths=self.lengths)
+        actions, _, _ = model.step(encoder_input_batch=self.encoder_input,
+                                   decoder_full_length=self.lengths,
+                                   encoder_lengths=self.lengths,
+                                   encoded=encoded)
+        sample_results = self.simulate(np.asarray(actions))
+
+        actions = model.greedy_predict(encoder_input_batch=self.encoder_input,
+                                       decoder_full_length=self.lengths,
+                                       encoder_lengths=self.lengths,
+                                       encoded=encoded)
+        greedy_results = self.simulate(np.asarray(actions))
+
+        return sample_results, greedy_results
+
+
+def _background_eval_worker(make_model, eval_envs, request_queue, result_queue):
+    import tensorflow as tf
+
+    with tf.Session():
+        model = make_model()
+        evaluator = Evaluator(eval_envs)
+        while True:
+            request = request_queue.get()
+            if request is None:
+                break
+            update, checkpoint_path = request
+            model.load(checkpoint_path)
+            result_queue.put((update, evaluator.evaluate(model)))
+
+
+class BackgroundEvaluator(object):
+    def __init__(self, make_model, eval_envs, checkpoint_path="./checkpoint/eval_model.ckpt"):
+        """ Evaluator running in its own process with its own copy of the model.
+
+        make_model has to be picklable and build the model in the default graph of the process.
+        The training loop saves a snapshot and goes on while the snapshot is evaluated, a new
+        evaluation is only started once the previous one finished, so the snapshot is never
+        overwritten while it is read.
+        """
+        self.checkpoint_path = checkpoint_path
+        self.busy = False
+        self.last_result = None
+
+        context = multiprocessing.get_context("spawn")
+        self.request_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.process = context.Process(target=_background_eval_worker,
+                                       args=(make_model, eval_envs, self.request_queue, self.result_queue),
+                                       daemon=True)
+        self.process.start()
+
+    def poll(self):
+        """ The (update, results) of the latest finished evaluation, None if there is none yet. """
+        try:
+            self.last_result = self.result_queue.get_nowait()
+            self.busy = False
+        except queue.Empty:
+            pass
+        return self.last_result
+
+    def submit(self, model, update):
+        """ Evaluate the current parameters of the model unless an evaluation is still running. """
+        self.poll()
+        if self.busy:
+            return False
+
+        model.save(self.checkpoint_path)
+        self.request_queue.put((update, self.checkpoint_path))
+        self.busy = True
+        return True
+
+    def close(self):
+        self.request_queue.put(None)
+        self.process.join()
@@ -0,0 +1,188 @@
+import argparse
+import json
+
+import numpy as np
+import tensorflow as tf
+
+from rltaskoffloading.common.misc_util import str2bool
+from rltaskoffloading.common.tf_util import load_variables
+from rltaskoffloading.environment.offloading_env import Resources, OffloadingCostTable, OffloadingEnvironment
+from rltaskoffloading.environment.offloading_task_graph import OffloadingTaskGraph
+from rltaskoffloading.environment.offloading_batch_simulator import simulate_task_graph_batch
+from rltaskoffloading.offloading_ppo.seq2seq_policy import Seq2seqPolicy
+
+"""
+Export of the greedy decoder of a trained offloading policy for serving.
+
+The exported policy is a single frozen GraphDef holding only the greedy plan and what it depends
+on, with the variables folded into constants. The settings to encode and simulate the task graphs
+the way the policy was trained are written next to it as json. OffloadingPolicyPredictor loads
+both and turns .gv task graphs into offloading plans without building the S2SModel.
+"""
+
+INPUT_NODE = "encoder_inputs"
+LENGTH_NODE = "encoder_lengths"
+OUTPUT_NODE = "greedy_plan"
+
+
+def export_greedy_policy(hparams, env, checkpoint_path, export_path, scope="pi"):
+    """ Freeze the greedy decoder of the policy saved in checkpoint_path into export_path.
+
+    Only the policy of scope is built. The training, sampling and beam search decoders are pruned
+    from the frozen graph, as the greedy plan does not depend on them. The encoding and the
+    simulation settings of env go to export_path + ".json".
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        encoder_inputs = tf.placeholder(tf.float32, [None, None, env.input_dim], name=INPUT_NODE)
+        encoder_lengths = tf.placeholder(tf.int32, [None], name=LENGTH_NODE)
+        policy = Seq2seqPolicy(scope, hparams, reuse=False, encoder_inputs=encoder_inputs,
+                               encoder_lengths=encoder_lengths,
+                               decoder_inputs=tf.placeholder(tf.int32, [None, None]),
+                               decoder_full_length=encoder_lengths,
+                               decoder_targets=tf.placeholder(tf.int32, [None, None]))
+        tf.identity(policy.greedy_decoder_prediction, name=OUTPUT_NODE)
+
+        with tf.Session(graph=graph) as sess:
+            sess.run(tf.global_variables_initializer())
+            load_variables(checkpoint_path, variables=policy.get_trainable_variables(), sess=sess)
+            graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), [OUTPUT_NODE])
+
+    with tf.gfile.GFile(export_path, "wb") as graph_file:
+        graph_file.write(graph_def.SerializeToString())
+
+    config = dict(input_dim=int(env.input_dim),
+                  time_major=bool(hparams.time_major),
+                  encode_dependencies=bool(env.encode_dependencies),
+                  resource_cluster=dict(mec_process_capable=env.resource_cluster.mec_process_capble,
+                                        mobile_process_capable=env.resource_cluster.mobile_process_capable,
+                                        bandwith_up=env.resource_cluster.bandwith_up,
+                                        bandwith_dl=env.resource_cluster.bandwith_dl),
+                  energy=dict(rho=env.rho, f_l=env.f_l, zeta=env.zeta, ptx=env.ptx, prx=env.prx))
+    with open(export_path + ".json", "w") as config_file:
+        json.dump(config, config_file, indent=2)
+
+    print("exported {} nodes to {}".format(len(graph_def.node), export_path))
+
+
+class OffloadingPolicyPredictor(object):
+    def __init__(self, export_path, warmup=True):
+        """ Greedy offloading plans of an exported policy, see export_greedy_policy.
+
+        With warmup one small batch is decoded up front, so the first request does not pay for the
+        graph optimizations of the session.
+        """
+        with open(export_path + ".json") as config_file:
+            self.config = json.load(config_file)
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(export_path, "rb") as graph_file:
+            graph_def.ParseFromString(graph_file.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.sess = tf.Session(graph=self.graph)
+
+        self.encoder_inputs = self.graph.get_tensor_by_name(INPUT_NODE + ":0")
+        self.encoder_lengths = self.graph.get_tensor_by_name(LENGTH_NODE + ":0")
+        self.greedy_plan = self.graph.get_tensor_by_name(OUTPUT_NODE + ":0")
+
+        self.time_major = self.config["time_major"]
+        self.encode_dependencies = self.config["encode_dependencies"]
+        self.resource_cluster = Resources(**self.config["resource_cluster"])
+        self.energy = self.config["energy"]
+
+        if warmup:
+            self.decode(np.zeros((1, 1, self.config["input_dim"]), dtype=np.float32), np.ones(1, dtype=np.int32))
+
+    def encode_task_graphs(self, task_graphs):
+        """ The padded encoder batch, the task numbers and the cost tables of OffloadingTaskGraphView. """
+        cost_tables = [OffloadingCostTable(task_graph, self.resource_cluster, **self.energy)
+                       for task_graph in task_graphs]
+
+        lengths = np.array([task_graph.task_number for task_graph in task_graphs], dtype=np.int32)
+        encoder_batch = np.zeros((len(task_graphs), np.max(lengths), self.config["input_dim"]), dtype=np.float32)
+        for row, task_graph, cost_table in zip(encoder_batch, task_graphs, cost_tables):
+            scheduling_sequence = task_graph.prioritize_tasks(self.resource_cluster, cost_table=cost_table)
+            row[:task_graph.task_number] = task_graph.encode_point_sequence_with_ranking_and_cost(
+                scheduling_sequence, self.resource_cluster, encode_dependencies=self.encode_dependencies,
+                cost_table=cost_table)
+
+        return encoder_batch, lengths, cost_tables
+
+    def decode(self, encoder_batch, lengths):
+        """ The greedy actions of a padded batch major encoder batch, (batch, max_length). """
+        if self.time_major:
+            encoder_batch = np.swapaxes(encoder_batch, 0, 1)
+        plans = self.sess.run(self.greedy_plan, feed_dict={self.encoder_inputs: encoder_batch,
+                                                           self.encoder_lengths: lengths})
+        if self.time_major:
+            plans = np.swapaxes(plans, 0, 1)
+        return plans
+
+    def predict_task_graphs(self, task_graphs):
+        """ The plans of OffloadingTaskGraphView with their simulated latency and energy consumption.
+
+        A plan is the list of (task id, action) in scheduling order, 0 is local and 1 is MEC.
+        """
+        encoder_batch, lengths, cost_tables = self.encode_task_graphs(task_graphs)
+        actions = self.decode(encoder_batch, lengths)
+        _, _, latency, energy = simulate_task_graph_batch(actions, task_graphs, cost_tables)
+
+        plans = [list(zip(task_graph.prioritize_sequence.tolist(), action[:task_graph.task_number].tolist()))
+                 for task_graph, action in zip(task_graphs, actions)]
+        return plans, latency, energy
+
+    def predict(self, graph_file_paths):
+        """ The plans, latency and energy consumption of the task graphs of .gv files. """
+        return self.predict_task_graphs([OffloadingTaskGraph(graph_file_path).graph_view
+                                         for graph_file_path in graph_file_paths])
+
+    def close(self):
+        self.sess.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", type=str, default="./checkpoint/model.ckpt")
+    parser.add_argument("--export_path", type=str, default="./checkpoint/greedy_policy.pb")
+    # a dataset of the training, to encode the graphs like in training.
+    parser.add_argument("--graph_file_path", type=str,
+                        default="./rltaskoffloading/offloading_data/offload_random15/random.15.")
+    parser.add_argument("--bandwidth", type=float, default=7.0)
+    parser.add_argument("--dependency", type=str2bool, default=True)
+    parser.add_argument("--num_units", type=int, default=256)
+    parser.add_argument("--num_layers", type=int, default=2)
+    parser.add_argument("--unit_type", type=str, default="layer_norm_lstm")
+    args = parser.parse_args()
+
+    # the hparams of DRLTO_number and DRLTO_trans.
+    hparams = tf.contrib.training.HParams(
+        unit_type=args.unit_type,
+        num_units=args.num_units,
+        learning_rate=0.00005,
+        supervised_learning_rate=0.00005,
+        n_features=2,
+        time_major=False,
+        is_attention=True,
+        forget_bias=1.0,
+        dropout=0,
+        num_gpus=1,
+        num_layers=args.num_layers,
+        num_residual_layers=0,
+        is_greedy=False,
+        inference_model="sample",
+        start_token=0,
+        end_token=5,
+        is_bidencoder=True
+    )
+
+    resource_cluster = Resources(mec_process_capable=(10.0 * 1024 * 1024),
+                                 mobile_process_capable=(1.0 * 1024 * 1024),
+                                 bandwith_up=args.bandwidth, bandwith_dl=args.bandwidth)
+    env = OffloadingEnvironment(resource_cluster=resource_cluster, batch_size=1, graph_number=1,
+                                graph_file_paths=[args.graph_file_path], time_major=False,
+                                encode_dependencies=args.dependency)
+
+    export_greedy_policy(hparams, env, args.checkpoint, args.export_path)
@@ -18,11 +18,15 @@ class LSTMPolicy(object):
                  hparams,
                  reuse,
                  encoder_inputs,
+                 encoder_lengths=None,
                  ):
 
         self.encoder_hidden_unit = hparams.num_units
 
         self.encoder_inputs = encoder_inputs
+        # the real lengths of padded batches of graphs with different task numbers, None if every
+        # sequence of the batch has the full length.
+        self.encoder_lengths = encoder_lengths
         self.num_layers = hparams.num_layers
         self.num_residual_layers = hparams.num_residual_layers
 
@@ -77,13 +81,18 @@ class LSTMPolicy(object):
             # define the greedy action
             self.greedy_actions = tf.argmax(self.out_put_logits, axis=-1, output_type=tf.int32)
 
-    def step(self, obs):
+    def _feed_dict(self, obs, encoder_lengths):
+        feed_dict = {self.encoder_inputs: obs}
+        if self.encoder_lengths is not None:
+            feed_dict[self.encoder_lengths] = encoder_lengths if encoder_lengths is not None \
+                else [np.shape(obs)[0 if self.time_major else 1]] * np.shape(obs)[1 if self.time_major else 0]
+        return feed_dict
+
+    def step(self, obs, encoder_lengths=None):
         sess = tf.get_default_session()
         sample_actions, sample_vf, sample_neglogp = sess.run(
             [self.sample_actions, self.vf, self.sample_neglogp],
-             feed_dict={
-                self.encoder_inputs : obs
-             }
+             feed_dict=self._feed_dict(obs, encoder_lengths)
         )
 
         sample_actions = np.array(sample_actions)
@@ -92,11 +101,9 @@ class LSTMPolicy(object):
 
         return sample_actions, sample_vf, sample_neglogp
 
-    def greedy_predict(self, obs):
+    def greedy_predict(self, obs, encoder_lengths=None):
         sess = tf.get_default_session()
-        greedy_actions = sess.run(self.greedy_actions, feed_dict={
-            self.encoder_inputs: obs
-        })
+        greedy_actions = sess.run(self.greedy_actions, feed_dict=self._feed_dict(obs, encoder_lengths))
 
         greedy_actions = np.array(greedy_actions)
 
@@ -161,8 +168,10 @@ class LSTMPolicy(object):
 
             # encoder_cell = tf.contrib.rnn.GRUCell(self.encoder_hidden_unit)
             # currently only consider the normal dynamic rnn
+            # the outputs of the padded steps after encoder_lengths are zeros.
             encoder_outputs, encoder_state = tf.nn.dynamic_rnn(
                 cell=encoder_cell,
+                sequence_length=self.encoder_lengths,
                 inputs=self.encoder_embeddings,
                 dtype=tf.float32,
                 time_major=self.time_major,
@@ -10,32 +10,24 @@ from rltaskoffloading.common.mpi_adam_optimizer import MpiAdamOptimizer
 from rltaskoffloading.common.tf_util import get_session, save_variables, load_variables, initialize
 import rltaskoffloading.common.tf_util as U
 from rltaskoffloading.common.mpi_util import sync_from_root
+from rltaskoffloading.common.mpi_moment import mpi_mean
 from rltaskoffloading.common.console_util import fmt_row
 from rltaskoffloading.offloading_ppo.seq2seq_policy import Seq2seqPolicy
 from rltaskoffloading import logger
 
 from rltaskoffloading.environment.offloading_env import OffloadingEnvironment
 from rltaskoffloading.environment.offloading_env import Resources
+from rltaskoffloading.environment.offloading_batch_sampler import LengthBucketedBatchSampler
 
-from rltaskoffloading.common.dataset import Dataset
 from rltaskoffloading.common.misc_util import zipsame
+from rltaskoffloading.common.advantage_util import gae_advantages, value_targets
+from rltaskoffloading.offloading_ppo.rollout_buffer import RolloutBuffer
+from rltaskoffloading.offloading_ppo.rollout_workers import RolloutWorkers
+from rltaskoffloading.offloading_ppo.evaluator import Evaluator, BackgroundEvaluator
 
 def calculate_qoe(latency_batch, energy_batch, env):
-    all_local_time, all_local_energy = env.get_all_locally_execute_time_batch()
-    all_local_time = np.squeeze(all_local_time)
-    all_local_energy = np.squeeze(all_local_energy)
-    latency_batch = np.squeeze(latency_batch)
-    energy_batch = np.squeeze(energy_batch)
-    qoe_batch = []
-
-    for latency, energy, single_all_local_latency, single_all_local_energy in zip(latency_batch, energy_batch, all_local_time, all_local_energy):
-        qoe = env.lambda_t * ((latency - single_all_local_latency) / single_all_local_latency) + \
-              env.lambda_e * ((energy - single_all_local_energy) / single_all_local_energy)
-
-        qoe = -qoe
-        qoe_batch.append(qoe)
-
-    return qoe_batch
+    # the all local baseline of every graph is cached by the environment.
+    return env.calculate_qoe(latency_batch, energy_batch)
 
 class S2SModel(object):
     def __init__(self, hparams, ob, ob_length, ent_coef, vf_coef, max_grad_norm):
@@ -74,10 +66,19 @@ class S2SModel(object):
                                                         for (oldv, newv) in
                                                         zipsame(act_model.get_variables(), train_model.get_variables())])
 
+        # the losses only average the real steps, not the padding after the last task of shorter graphs.
+        if hparams.time_major:
+            mask = tf.transpose(tf.sequence_mask(action_length, tf.shape(action)[0], dtype=tf.float32))
+        else:
+            mask = tf.sequence_mask(action_length, tf.shape(action)[1], dtype=tf.float32)
+
+        def masked_mean(x):
+            return tf.reduce_sum(x * mask) / tf.reduce_sum(mask)
+
         # neglogpac = train_model.neglogp()
         # Calculate the entropy
         # Entropy is used to improve exploration by limiting the premature convergence to suboptimal policy.
-        entropy = tf.reduce_mean(train_model.entropy())
+        entropy = masked_mean(train_model.entropy())
         # Calculate the loss
         # Total loss = Policy gradient loss - entropy * entropy coefficient + Value coefficient * value loss
 
@@ -91,7 +92,7 @@ class S2SModel(object):
         # Clipped value
         vf_losses2 = tf.square(vpredclipped - r)
 
-        vf_loss = .5 * tf.reduce_mean(tf.maximum(vf_losses1, vf_losses2))
+        vf_loss = .5 * masked_mean(tf.maximum(vf_losses1, vf_losses2))
 
         # Calculate ratio (pi current policy / pi old policy)
         #ratio = tf.exp(oldneglogpac - neglogpac)
@@ -103,11 +104,11 @@ class S2SModel(object):
         pg_losses2 = -adv * tf.clip_by_value(ratio, 1.0 - cliprange, 1.0 + cliprange)
 
         # Final pg loss
-        pg_loss = tf.reduce_mean(tf.maximum(pg_losses, pg_losses2))
+        pg_loss = masked_mean(tf.maximum(pg_losses, pg_losses2))
         #approxkl = .5 * tf.reduce_mean(tf.square(neglogpac - oldneglogpac))
         kloldnew = act_model.kl(train_model)
-        approxkl = tf.reduce_mean(kloldnew)
-        clipfrac = tf.reduce_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), cliprange)))
+        approxkl = masked_mean(kloldnew)
+        clipfrac = masked_mean(tf.to_float(tf.greater(tf.abs(ratio - 1.0), cliprange)))
 
         # total loss
         loss = pg_loss - entropy * ent_coef + vf_loss * vf_coef
@@ -139,8 +140,15 @@ class S2SModel(object):
             # the advantage function is calculated as A(s,a) = R + yV(s') - V(s)
             # the return = R + yV(s')
 
-            # Sequential Normalize the advantages
-            advs = (advs - np.mean(advs, axis=0)) / (np.std(advs, axis=0) + 1e-8)
+            # Sequential Normalize the advantages over the real steps
+            if self.time_major:
+                masks = np.arange(advs.shape[0])[:, np.newaxis] < np.asarray(decoder_full_length)[np.newaxis, :]
+            else:
+                masks = np.arange(advs.shape[1])[np.newaxis, :] < np.asarray(decoder_full_length)[:, np.newaxis]
+            counts = np.maximum(masks.sum(axis=0), 1)
+            advs_mean = np.sum(advs * masks, axis=0) / counts
+            advs_std = np.sqrt(np.sum(np.square(advs - advs_mean) * masks, axis=0) / counts)
+            advs = (advs - advs_mean) / (advs_std + 1e-8) * masks
 
             td_map = {train_model.encoder_inputs: obs, train_model.encoder_lengths:obs_length,
                       decoder_input:decoder_inputs, action: actions, action_length: decoder_full_length, adv:advs,
@@ -154,8 +162,12 @@ class S2SModel(object):
         self.train_model = train_model
         self.time_major = self.train_model.time_major
         self.act_model = act_model
+        self.encode = act_model.encode
         self.step = act_model.step
+        self.step_episodes = act_model.step_episodes
         self.greedy_predict = act_model.greedy_predict
+        self.sample_candidates = act_model.sample_candidates
+        self.beam_search_predict = act_model.beam_search_predict
 
         self.save = functools.partial(save_variables, sess=sess)
         self.load = functools.partial(load_variables, sess=sess)
@@ -168,81 +180,105 @@ class S2SModel(object):
 
 
 class Runner():
-    def __init__(self, env, model, nepisode, gamma, lam):
+    def __init__(self, env, model, nepisode, gamma, lam, rollout_workers=None, batch_sampler=None,
+                 tiled_decode=False):
         self.lam = lam
         self.gamma = gamma
         self.model = model
         self.nepisode = nepisode
         self.env = env
+        self.buffer = None
+        # a LengthBucketedBatchSampler of the graphs of env, to sample new batches every run.
+        self.batch_sampler = batch_sampler
+        # the encoder runs once per batch. The episodes of a batch are decoded one by one from its
+        # outputs, or all in one decoder call on nepisode tiled copies with tiled_decode.
+        self.tiled_decode = tiled_decode
+
+        # with more than one worker the rewards are computed in a process pool while the
+        # decoder samples the next episodes, the results are the same as without.
+        self.rollout_workers = None
+        if rollout_workers is not None and rollout_workers > 1:
+            self.rollout_workers = RolloutWorkers(env, rollout_workers)
 
     def run(self):
-        mb_obs, mb_rewards, mb_actions, mb_values, mb_dones, mb_neglogpacs = [], [], [], [], [], []
-        mb_tdlamret, mb_adv = [], []
-        mb_decoder_input = []
-        mb_decoder_length = []
-        mb_encoder_batch = []
-        mb_encoder_length = []
-        mb_task_graph = []
-
-
-        for task_graph_batch, encoder_batch, encoder_length, \
-            decoder_lengths,  max_running_time, min_running_time in zip(self.env.task_graphs,
-                                                                  self.env.encoder_batchs,
-                                                                  self.env.encoder_lengths,
-                                                                  self.env.decoder_full_lengths,
-                                                                  self.env.max_running_time_batchs,
-                                                                  self.env.min_running_time_batchs):
-            for _ in range(self.nepisode):
-                actions, values, neglogpacs = self.model.step(encoder_input_batch=encoder_batch,
-                                                              decoder_full_length=decoder_lengths,
-                                                              encoder_lengths=encoder_length)
-
-                mb_encoder_batch += encoder_batch.tolist()
-                mb_encoder_length += encoder_length.tolist()
+        if self.batch_sampler is not None:
+            self.batch_sampler.resample()
+            batchs = self.batch_sampler
+        else:
+            batchs = self.env
+
+        # the buffer is allocated on the first run and overwritten by every later one, unless the
+        # sampled batches have other shapes.
+        if self.buffer is None or not self.buffer.fits(batchs.encoder_batchs):
+            self.buffer = RolloutBuffer(batchs.encoder_batchs, self.nepisode)
+        pending_rewards = []
+
+        for segment_index, (task_graph_batch, encoder_batch, encoder_length, decoder_lengths, reward_mask,
+                            max_running_time, min_running_time) in enumerate(zip(batchs.task_graphs,
+                                                                                 batchs.encoder_batchs,
+                                                                                 batchs.encoder_lengths,
+                                                                                 batchs.decoder_full_lengths,
+                                                                                 batchs.reward_masks,
+                                                                                 batchs.max_running_time_batchs,
+                                                                                 batchs.min_running_time_batchs)):
+            if self.tiled_decode:
+                episodes = self.model.step_episodes(encoder_input_batch=encoder_batch,
+                                                    decoder_full_length=decoder_lengths,
+                                                    encoder_lengths=encoder_length,
+                                                    episode_number=self.nepisode)
+            else:
+                encoded = self.model.encode(encoder_input_batch=encoder_batch, encoder_lengths=encoder_length)
+
+            for episode_index in range(self.nepisode):
+                if self.tiled_decode:
+                    actions, values, neglogpacs = (episode[episode_index] for episode in episodes)
+                else:
+                    actions, values, neglogpacs = self.model.step(encoder_input_batch=encoder_batch,
+                                                                  decoder_full_length=decoder_lengths,
+                                                                  encoder_lengths=encoder_length,
+                                                                  encoded=encoded)
                 actions = np.array(actions)
                 values = np.array(values)
-                neglogpacs = np.array(neglogpacs)
-
-                decoder_input = np.column_stack(
-                    (np.ones(actions.shape[0], dtype=int) * self.env.start_symbol, actions[:, 0:-1]))
-                mb_decoder_input += decoder_input.tolist()
-                mb_decoder_length += decoder_lengths.tolist()
-                mb_actions += actions.tolist()
-                mb_values += values.tolist()
-                mb_neglogpacs += neglogpacs.tolist()
-
-                rewards = self.env.step(task_graph_batch=task_graph_batch, action_sequence_batch=actions,
-                                        max_running_time_batch=max_running_time, min_running_time_batch=min_running_time)
-
-                mb_rewards += rewards.tolist()
-                mb_task_graph += task_graph_batch
-
-                time_length = values.shape[1]
-                batch_size = values.shape[0]
-                vpred_batch = np.column_stack((values, np.zeros(batch_size, dtype=float)))
-                last_gae_lam = np.zeros(batch_size, dtype=float)
-                tdlamret = []
-                adv = []
 
-                for t in reversed(range(time_length)):
-                    delta = rewards[:, t] + self.gamma * vpred_batch[:, t + 1] - vpred_batch[:, t]
-                    gaelam = last_gae_lam = delta + self.gamma * self.lam * last_gae_lam
-                    adv.append(gaelam)
-                    tdlam = vpred_batch[:, t + 1] + gaelam
-                    tdlamret.append(tdlam)
-
-                tdlamret.reverse()
-                adv.reverse()
-
-                tdlamret = np.array(tdlamret).swapaxes(0, 1)
-                adv = np.array(adv).swapaxes(0, 1)
-
-                mb_tdlamret += tdlamret.tolist()
-                mb_adv += adv.tolist()
+                trajectory = self.buffer.episode(segment_index, episode_index)
+                trajectory['encoder_input'][:] = encoder_batch
+                trajectory['encoder_length'][:] = encoder_length
+                trajectory['decoder_input'][:, 0] = self.env.start_symbol
+                trajectory['decoder_input'][:, 1:] = actions[:, 0:-1]
+                trajectory['decoder_target'][:] = actions
+                trajectory['decoder_full_length'][:] = decoder_lengths
+                trajectory['values'][:] = values
+                trajectory['neglogpacs'][:] = neglogpacs
+                trajectory['masks'][:] = reward_mask
+
+                if self.rollout_workers is not None and self.batch_sampler is not None:
+                    rewards = self.rollout_workers.submit_graphs(batchs.graph_indices[segment_index], actions)
+                    pending_rewards.append((trajectory, rewards))
+                elif self.rollout_workers is not None:
+                    pending_rewards.append((trajectory, self.rollout_workers.submit(segment_index, actions)))
+                else:
+                    rewards = self.env.step(task_graph_batch=task_graph_batch, action_sequence_batch=actions,
+                                            max_running_time_batch=max_running_time,
+                                            min_running_time_batch=min_running_time)
+                    trajectory['rewards'][:] = rewards
+
+        for trajectory, rewards in pending_rewards:
+            trajectory['rewards'][:] = rewards.result()
+
+        # advantages of all the episodes of each batch at once, every episode ends at its last real step.
+        for segment in self.buffer.segments:
+            masks = segment['masks']
+            segment['advs'][:] = gae_advantages(segment['rewards'], segment['values'], self.gamma, self.lam,
+                                                masks=masks)
+            segment['returns'][:] = value_targets(segment['advs'], segment['values'], masks=masks)
 
         # return the trajectories
-        return mb_encoder_batch, mb_encoder_length, mb_decoder_input, \
-               mb_actions, mb_decoder_length, mb_values, mb_rewards, mb_neglogpacs, mb_tdlamret, mb_adv
+        return self.buffer
+
+    def close(self):
+        if self.rollout_workers is not None:
+            self.rollout_workers.close()
+            self.rollout_workers = None
 
     def sample_eval(self):
         running_cost = []
@@ -296,24 +332,47 @@ def constfn(val):
         return val
     return f
 
+def build_model(hparams_values, input_dim, ent_coef, vf_coef, max_grad_norm):
+    # module level, so a background evaluator process can build the same model.
+    hparams = tf.contrib.training.HParams(**hparams_values)
+    ob = tf.placeholder(dtype=tf.float32, shape=[None, None, input_dim])
+    ob_length = tf.placeholder(dtype=tf.int32, shape=[None])
+
+    return S2SModel(hparams=hparams, ob=ob, ob_length=ob_length, ent_coef=ent_coef, vf_coef=vf_coef,
+                    max_grad_norm=max_grad_norm)
+
 # the main part of ppo learning algorithm
 def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent_coef=0.01, lr=1e-4,
           vf_coef=0.5, max_grad_norm=0.5, gamma=0.99, lam=0.95, optbatchnumber=500,
-          log_interval=1, noptepochs=4, cliprange=0.2, load_path=None):
-    ob = tf.placeholder(dtype=tf.float32, shape=[None, None, env.input_dim])
-    ob_length = tf.placeholder(dtype=tf.int32, shape=[None])
-
-    make_model = lambda: S2SModel(hparams=hparams, ob=ob, ob_length=ob_length, ent_coef=ent_coef, vf_coef=vf_coef, max_grad_norm=max_grad_norm)
+          log_interval=1, noptepochs=4, cliprange=0.2, load_path=None, rollout_workers=None,
+          eval_interval=1, background_eval=False, batch_sampler=None, tiled_decode=False):
+    make_model = functools.partial(build_model, hparams.values(), env.input_dim, ent_coef, vf_coef, max_grad_norm)
 
     model = make_model()
     if load_path is not None:
         model.load(load_path)
-    runner = Runner(env=env, model = model, nepisode=nsample_episode, gamma=gamma, lam=lam)
-
-    eval_runners = []
-    if eval_envs is not None:
-        for eval_env in eval_envs:
-            eval_runners.append(Runner(env=eval_env, model=model, nepisode=1, gamma=gamma, lam=lam))
+    # with several MPI ranks every rank samples its own shard of the graphs (see the shard_index
+    # of OffloadingEnvironment) and the gradients are averaged by the MpiAdamOptimizer. All ranks
+    # split their batches into the minibatch number of the full batch, so they train in lockstep.
+    rank = MPI.COMM_WORLD.Get_rank()
+    nranks = MPI.COMM_WORLD.Get_size()
+    if batch_sampler is not None and nranks > 1:
+        # the number of sampled batches differs between the ranks, they would not train in lockstep.
+        raise ValueError("The length bucketed batch sampler only supports a single MPI rank")
+
+    runner = Runner(env=env, model = model, nepisode=nsample_episode, gamma=gamma, lam=lam,
+                    rollout_workers=rollout_workers, batch_sampler=batch_sampler, tiled_decode=tiled_decode)
+    minibatch_number = max(1, (env.batch_size * nsample_episode) // optbatchnumber)
+
+    # the evaluation environments are evaluated every eval_interval updates with one padded decoder
+    # call per mode, either in the training loop or against a snapshot in a background process.
+    evaluator = None
+    if eval_envs:
+        if background_eval:
+            evaluator = BackgroundEvaluator(make_model, eval_envs)
+        else:
+            evaluator = Evaluator(eval_envs)
+    eval_result = None
 
     tfirststart = time.time()
 
@@ -323,32 +382,28 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
         lrnow = lr
         cliprangenow = cliprange
 
-        mb_encoder_batch, mb_encoder_length, mb_decoder_input, mb_actions, mb_decoder_length, \
-        mb_values, mb_rewards, mb_neglogpacs, mb_tdlamret, mb_adv = runner.run()
+        rollout_buffer = runner.run()
 
         sample_time_cost = time.time()
         print("sample time cost: ", (sample_time_cost - tstart))
-        print(np.array(mb_encoder_batch).shape)
-
-        data_set = Dataset(dict(encoder_input=mb_encoder_batch,
-                                encoder_length=mb_encoder_length,
-                                decoder_input=mb_decoder_input,
-                                decoder_target=mb_actions,
-                                decoder_full_length=mb_decoder_length,
-                                returns=mb_tdlamret,
-                                advs =mb_adv,
-                                values=mb_values,
-                                neglogpacs=mb_neglogpacs),
-                                deterministic=True, shuffle=False)
+        print(rollout_buffer.shapes())
 
-        mean_reward = np.mean(np.sum(mb_rewards, axis=-1))
+        if nranks > 1:
+            mean_reward, _ = mpi_mean(rollout_buffer.episode_rewards())
+        else:
+            mean_reward = rollout_buffer.mean_episode_reward()
 
         mblossvals = []
 
         # optimal policy update steps
         logger.log(fmt_row(13, model.loss_names))
         for _ in range(noptepochs):
-            for batch in data_set.iterate_once(optbatchnumber):
+            if nranks > 1:
+                minibatchs = rollout_buffer.iterate_splits(minibatch_number)
+            else:
+                minibatchs = rollout_buffer.iterate_once(optbatchnumber)
+
+            for batch in minibatchs:
                 encoder_input = batch["encoder_input"]
                 returns_batch = batch["returns"]
                 advs_batch = batch["advs"]
@@ -358,13 +413,13 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
                 neglogpacs_batch = batch["neglogpacs"]
 
                 if model.time_major == True:
-                    encoder_input = np.array(encoder_input).swapaxes(0,1)
-                    returns_batch = np.array(returns_batch).swapaxes(0,1)
-                    advs_batch = np.array(advs_batch).swapaxes(0,1)
-                    decoder_input = np.array(decoder_input).swapaxes(0,1)
-                    decoder_target = np.array(decoder_target).swapaxes(0,1)
-                    values_batch = np.array(values_batch).swapaxes(0,1)
-                    neglogpacs_batch = np.array(neglogpacs_batch).swapaxes(0,1)
+                    encoder_input = encoder_input.swapaxes(0,1)
+                    returns_batch = returns_batch.swapaxes(0,1)
+                    advs_batch = advs_batch.swapaxes(0,1)
+                    decoder_input = decoder_input.swapaxes(0,1)
+                    decoder_target = decoder_target.swapaxes(0,1)
+                    values_batch = values_batch.swapaxes(0,1)
+                    neglogpacs_batch = neglogpacs_batch.swapaxes(0,1)
 
                 batch_loss = model.train(
                                 learning_reate=lrnow,
@@ -389,39 +444,22 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
         assign_params_time_cost = time.time()
         print("Sychronous parameters cost: ", (assign_params_time_cost - update_time_cost))
 
-        running_cost = []
-        energy_consumption = []
-        running_qoe = []
-
-        greedy_running_cost = []
-        greedy_energy_consumption = []
-        greedy_qoe_batch = []
-        for eval_runner in eval_runners:
-            Tc, Ec, qoe = eval_runner.sample_eval()
-            greedy_Tc, greedy_Ec, greedy_qoe = eval_runner.greedy_eval()
-
-            Tc = np.mean(Tc)
-            Ec = np.mean(Ec)
-            qoe = np.mean(qoe)
-
-            greedy_Tc = np.mean(greedy_Tc)
-            greedy_Ec = np.mean(greedy_Ec)
-            greedy_qoe = np.mean(greedy_qoe)
-
-            running_cost.append(Tc)
-            energy_consumption.append(Ec)
-            running_qoe.append(qoe)
-
-            greedy_running_cost.append(greedy_Tc)
-            greedy_energy_consumption.append(greedy_Ec)
-            greedy_qoe_batch.append(greedy_qoe)
+        if evaluator is not None:
+            if update % eval_interval == 0 or update == 1:
+                if background_eval:
+                    evaluator.submit(model, update)
+                else:
+                    eval_result = (update, evaluator.evaluate(model))
+            if background_eval:
+                eval_result = evaluator.poll()
 
         lossvals = np.mean(mblossvals, axis=0)
         # End timer
         tnow = time.time()
 
         mean_reward_track.append(mean_reward)
-        if update % log_interval == 0 or update == 1:
+        # the evaluation, the logs and the checkpoints are only on rank 0.
+        if rank == 0 and (update % log_interval == 0 or update == 1):
             # save model
             model.save("./checkpoint/model.ckpt")
             print("model saved!")
@@ -432,13 +470,16 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
             logger.logkv('time_elapsed', tnow - tfirststart)
             logger.logkv('time_one_episode', tnow - tstart)
 
+            # the latest evaluation, it can be from an earlier update.
+            if eval_result is not None:
+                eval_update, (sample_results, greedy_results) = eval_result
+                logger.logkv('eval time_step', eval_update)
+            else:
+                sample_results, greedy_results = [], []
+
             j = 0
-            for eval_env, run_time, energy, running_mean_qoe, greedy_run_time, greedy_energy, greedy_mean_qoe in zip(eval_envs, running_cost,
-                                                                                 energy_consumption,
-                                                                                 running_qoe,
-                                                                                 greedy_running_cost,
-                                                                                 greedy_energy_consumption,
-                                                                                 greedy_qoe_batch):
+            for eval_env, (run_time, energy, running_mean_qoe), (greedy_run_time, greedy_energy, greedy_mean_qoe) \
+                    in zip(eval_envs, sample_results, greedy_results):
                 logger.logkv(str(j)+'th run time cost ', run_time)
                 logger.logkv(str(j)+'th energy cost ', energy)
                 logger.logkv(str(j)+'th qoe ', running_mean_qoe)
@@ -453,6 +494,7 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
                 j += 1
 
             logger.logkv('mean reward', mean_reward)
+            logger.logkv('padding efficiency', rollout_buffer.padding_efficiency())
 
             for (lossval, lossname) in zip(lossvals, model.loss_names):
                 logger.logkv(lossname, lossval)
@@ -460,6 +502,9 @@ def learn(hparams, env, eval_envs = None, nupdates=1000, nsample_episode=30, ent
             if MPI.COMM_WORLD.Get_rank() == 0:
                 logger.dumpkvs()
 
+    runner.close()
+    if background_eval and evaluator is not None:
+        evaluator.close()
     return mean_reward_track
 
 
@@ -471,8 +516,12 @@ def DRLTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DRTO-all-graph-L
            end_token=5, is_bidencoder=True,
            train_graph_file_paths=["../offloading_data/offload_random10/random.10."],
            test_graph_file_paths=["../offloading_data/offload_random10_test/random.10."],
-           batch_size=500, graph_number=500):
-    logger.configure(logpath, ['stdout', 'json', 'csv'])
+           batch_size=500, graph_number=500, rollout_workers=None, mix_graph_sizes=False, token_budget=None,
+           eval_interval=1, background_eval=False):
+    # launched with mpirun every rank trains on its own shard of the graphs, see learn.
+    rank = MPI.COMM_WORLD.Get_rank()
+    nranks = MPI.COMM_WORLD.Get_size()
+    logger.configure(logpath, ['stdout', 'json', 'csv'] if rank == 0 else [])
 
     hparams = tf.contrib.training.HParams(
         unit_type=unit_type,
@@ -503,10 +552,17 @@ def DRLTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DRTO-all-graph-L
                                 time_major=False,
                                 lambda_t=lambda_t,
                                 lambda_e=lambda_e,
-                                encode_dependencies = encode_dependencies)
+                                encode_dependencies = encode_dependencies,
+                                shard_index=rank, shard_number=nranks,
+                                mix_graph_sizes=mix_graph_sizes)
+
+    # with a token_budget the batches are resampled every update by length buckets of task numbers.
+    batch_sampler = None
+    if token_budget is not None:
+        batch_sampler = LengthBucketedBatchSampler(env, token_budget)
 
     eval_envs = []
-    for path in test_graph_file_paths:
+    for path in test_graph_file_paths if rank == 0 else []:
         eval_env = OffloadingEnvironment(resource_cluster=resource_cluster, batch_size=100, graph_number=100,
                                          graph_file_paths=[path],
                                          time_major=False,
@@ -521,7 +577,9 @@ def DRLTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/DRTO-all-graph-L
     with tf.Session() as sess:
         sess.run(tf.global_variables_initializer())
         learn(hparams= hparams, env=env, eval_envs=eval_envs, nsample_episode=10, nupdates=3000,
-              max_grad_norm=1.0, noptepochs=4, gamma=0.99, lr=5e-4, optbatchnumber=500)
+              max_grad_norm=1.0, noptepochs=4, gamma=0.99, lr=5e-4, optbatchnumber=500,
+              rollout_workers=rollout_workers, batch_sampler=batch_sampler,
+              eval_interval=eval_interval, background_eval=background_eval)
 
 def DRLTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
            unit_type="layer_norm_lstm", num_units=256, learning_rate=0.00005, supervised_learning_rate=0.00005,
@@ -532,7 +590,7 @@ def DRLTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
            train_graph_file_paths=["../offloading_data/offload_random10/random.10."],
            test_graph_file_paths=["../offloading_data/offload_random10_test/random.10."],
            batch_size=500, graph_number=500,
-           bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0]):
+           bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0], rollout_workers=None, eval_interval=1, background_eval=False):
     hparams = tf.contrib.training.HParams(
         unit_type=unit_type,
         num_units=num_units,
@@ -553,8 +611,12 @@ def DRLTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
         is_bidencoder=is_bidencoder
     )
 
+    # launched with mpirun every rank trains on its own shard of the graphs, see learn.
+    rank = MPI.COMM_WORLD.Get_rank()
+    nranks = MPI.COMM_WORLD.Get_size()
+
     def test_case(bandwidth=5.0, log_path='./log/zhan-transrate-5Mbps', lambda_t = 1.0, lambda_e = 1.0):
-        logger.configure(log_path, ['stdout', 'json', 'csv'])
+        logger.configure(log_path, ['stdout', 'json', 'csv'] if rank == 0 else [])
         resource_cluster = Resources(mec_process_capable=(10.0 * 1024 * 1024),
                                      mobile_process_capable=(1.0 * 1024 * 1024), bandwith_up=bandwidth, bandwith_dl=bandwidth)
 
@@ -562,22 +624,26 @@ def DRLTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath="./log/all-graph-LO",
                                     graph_file_paths=train_graph_file_paths,
                                     time_major=False,
                                     lambda_t=lambda_t, lambda_e=lambda_e,
-                                    encode_dependencies=encode_dependencies)
+                                    encode_dependencies=encode_dependencies,
+                                    shard_index=rank, shard_number=nranks)
 
         eval_envs = []
-        eval_env_1 = OffloadingEnvironment(resource_cluster = resource_cluster, batch_size=100, graph_number=100,
-                                    graph_file_paths=test_graph_file_paths,
-                                    time_major=False,
-                                    lambda_t=lambda_t, lambda_e=lambda_e,
-                                    encode_dependencies=encode_dependencies)
-        eval_env_1.calculate_heft_cost()
-        eval_envs.append(eval_env_1)
+        if rank == 0:
+            eval_env_1 = OffloadingEnvironment(resource_cluster = resource_cluster, batch_size=100, graph_number=100,
+                                        graph_file_paths=test_graph_file_paths,
+                                        time_major=False,
+                                        lambda_t=lambda_t, lambda_e=lambda_e,
+                                        encode_dependencies=encode_dependencies)
+            eval_env_1.calculate_heft_cost()
+            eval_envs.append(eval_env_1)
         print("Finishing initialization of environment")
 
         with tf.Session() as sess:
             sess.run(tf.global_variables_initializer())
             learn(hparams=hparams, env=env, eval_envs=eval_envs, nsample_episode=10, nupdates=3000,
-                  max_grad_norm=1.0, noptepochs=4, gamma=0.99, lr=5e-4, optbatchnumber=500)
+                  max_grad_norm=1.0, noptepochs=4, gamma=0.99, lr=5e-4, optbatchnumber=500,
+                  rollout_workers=rollout_workers,
+                  eval_interval=eval_interval, background_eval=background_eval)
             sess.close()
         tf.reset_default_graph()
 
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import io
+import json
+import time
+
+import numpy as np
+
+from rltaskoffloading.environment.offloading_task_graph import OffloadingTaskGraph
+from rltaskoffloading.offloading_ppo.export_policy import OffloadingPolicyPredictor
+
+"""
+Online offloading decisions of an exported policy, see export_policy.py.
+
+Mobile clients send the dot source of a task graph and get back its plan with the predicted latency
+and energy consumption. The requests which arrive within batch_window of the first waiting one are
+answered together by a single padded decoder call, a longer window gives larger batches and more
+throughput on CPU at the price of the waiting time of every request. The p50 and p99 latency of the
+requests, from their arrival to their answer, show where the trade off is.
+
+The protocol is one json object per line over TCP, {"graph": "<dot source>"} is answered by
+{"plan": [[task id, action], ...], "latency": ..., "energy": ...}, or by {"error": "..."}.
+"""
+
+
+class OffloadingDecisionServer(object):
+    def __init__(self, predictor, batch_window=0.002, max_batch_size=256):
+        """ Micro batched plans of an OffloadingPolicyPredictor on the current event loop.
+
+        The predictor runs in the default executor of the loop, so the requests arriving meanwhile
+        are queued and form the next batch.
+        """
+        self.predictor = predictor
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self.queue = None
+        self.batch_task = None
+        self.latencies = []
+        self.batch_sizes = []
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.batch_task = asyncio.ensure_future(self._batch_loop())
+
+    async def stop(self):
+        self.batch_task.cancel()
+        try:
+            await self.batch_task
+        except asyncio.CancelledError:
+            pass
+
+    async def decide(self, task_graph):
+        """ The plan, latency and energy consumption of an OffloadingTaskGraphView, see predict_task_graphs. """
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((task_graph, future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_event_loop()
+        requests = [await self.queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(requests) < self.max_batch_size:
+            if not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return requests
+
+    async def _batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            requests = await self._next_batch()
+            task_graphs = [task_graph for task_graph, _, _ in requests]
+            try:
+                plans, latency, energy = await loop.run_in_executor(None, self.predictor.predict_task_graphs,
+                                                                    task_graphs)
+            except Exception as error:
+                for _, future, _ in requests:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            answer_time = time.perf_counter()
+            for (_, future, arrival_time), plan, plan_latency, plan_energy in zip(requests, plans, latency, energy):
+                # the client may have given up on the request meanwhile.
+                if not future.done():
+                    future.set_result((plan, float(plan_latency), float(plan_energy)))
+                self.latencies.append(answer_time - arrival_time)
+            self.batch_sizes.append(len(requests))
+
+    def report(self, reset=True):
+        """ The number of requests, their p50 and p99 latency in ms and the mean batch size since the last reset. """
+        if not self.latencies:
+            return dict(requests=0, p50=0.0, p99=0.0, mean_batch_size=0.0)
+
+        latencies = np.array(self.latencies) * 1000.0
+        result = dict(requests=len(latencies),
+                      p50=float(np.percentile(latencies, 50)),
+                      p99=float(np.percentile(latencies, 99)),
+                      mean_batch_size=float(np.mean(self.batch_sizes)))
+        if reset:
+            self.latencies = []
+            self.batch_sizes = []
+        return result
+
+    async def handle_client(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line.decode())
+                task_graph = OffloadingTaskGraph(io.StringIO(request["graph"])).graph_view
+                plan, latency, energy = await self.decide(task_graph)
+                response = dict(plan=plan, latency=latency, energy=energy)
+            except Exception as error:
+                response = dict(error=repr(error))
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+
+async def log_reports(server, interval):
+    while True:
+        await asyncio.sleep(interval)
+        result = server.report()
+        if result["requests"]:
+            print("requests: {requests}, p50: {p50:.2f} ms, p99: {p99:.2f} ms, "
+                  "mean batch size: {mean_batch_size:.1f}".format(**result))
+
+
+async def benchmark(server, task_graphs, request_number, concurrency):
+    """ Send request_number requests of task_graphs from concurrency clients at once, returns the report. """
+    next_request = iter(range(request_number))
+
+    async def client():
+        for i in next_request:
+            await server.decide(task_graphs[i % len(task_graphs)])
+
+    server.report(reset=True)
+    start_time = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    result = server.report()
+    result["throughput"] = request_number / (time.perf_counter() - start_time)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export_path", type=str, default="./checkpoint/greedy_policy.pb")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch_window", type=float, default=0.002, help="seconds")
+    parser.add_argument("--max_batch_size", type=int, default=256)
+    parser.add_argument("--report_interval", type=float, default=10.0, help="seconds")
+    # with a dataset the server is benchmarked in process instead of serving.
+    parser.add_argument("--benchmark_graph_path", type=str, default=None)
+    parser.add_argument("--benchmark_graph_number", type=int, default=100)
+    parser.add_argument("--benchmark_requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    predictor = OffloadingPolicyPredictor(args.export_path)
+    server = OffloadingDecisionServer(predictor, batch_window=args.batch_window,
+                                      max_batch_size=args.max_batch_size)
+    loop = asyncio.get_event_loop()
+    server.start()
+
+    if args.benchmark_graph_path is not None:
+        task_graphs = [OffloadingTaskGraph(args.benchmark_graph_path + str(i) + ".gv").graph_view
+                       for i in range(args.benchmark_graph_number)]
+        result = loop.run_until_complete(benchmark(server, task_graphs, args.benchmark_requests, args.concurrency))
+        print("batch window: {:.1f} ms, requests: {requests}, p50: {p50:.2f} ms, p99: {p99:.2f} ms, "
+              "mean batch size: {mean_batch_size:.1f}, throughput: {throughput:.1f} requests/s".format(
+                args.batch_window * 1000.0, **result))
+    else:
+        tcp_server = loop.run_until_complete(asyncio.start_server(server.handle_client, args.host, args.port))
+        print("serving {} on {}:{}".format(args.export_path, args.host, args.port))
+        loop.create_task(log_reports(server, args.report_interval))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        tcp_server.close()
+        loop.run_until_complete(tcp_server.wait_closed())
+
+    loop.run_until_complete(server.stop())
+    predictor.close()
@@ -0,0 +1,42 @@
+import numpy as np
+
+"""
+Inference modes searching for better offloading plans than a single greedy decode.
+
+Both return the plans of a batch of graphs with their latency, energy consumption and QoE, as
+simulated by the environment. The plans of padded batches are longer than the smaller graphs, the
+actions after the last task of a graph are ignored by the simulation.
+"""
+
+
+def best_sampled_plans(model, env, task_graph_batch, encoder_batch, encoder_lengths, candidate_number):
+    """ Sample candidate_number plans of every graph and keep the one with the best QoE.
+
+    The candidates of all the graphs are decoded in one call on the tiled encoder outputs and
+    simulated in one batch.
+    """
+    candidates = model.sample_candidates(encoder_input_batch=encoder_batch,
+                                         encoder_lengths=encoder_lengths,
+                                         decoder_full_length=encoder_lengths,
+                                         candidate_number=candidate_number)
+    batch_size, _, max_length = candidates.shape
+
+    # the candidates of a graph are consecutive rows, as in the tiled decoder batch.
+    candidate_graphs = [task_graph for task_graph in task_graph_batch for _ in range(candidate_number)]
+    latency, energy, qoe = env.get_qoe_batch(candidates.reshape((-1, max_length)), candidate_graphs)
+
+    best = np.argmax(qoe.reshape((batch_size, candidate_number)), axis=1)
+    rows = np.arange(batch_size)
+    best_rows = rows * candidate_number + best
+
+    return candidates[rows, best], latency[best_rows], energy[best_rows], qoe[best_rows]
+
+
+def beam_search_plans(model, env, task_graph_batch, encoder_batch, encoder_lengths):
+    """ The best plan of the beam search of the policy for every graph, see Seq2seqPolicy.beam_width. """
+    plans = np.asarray(model.beam_search_predict(encoder_input_batch=encoder_batch,
+                                                 encoder_lengths=encoder_lengths,
+                                                 decoder_full_length=encoder_lengths))
+    latency, energy, qoe = env.get_qoe_batch(plans, task_graph_batch)
+
+    return plans, latency, energy, qoe
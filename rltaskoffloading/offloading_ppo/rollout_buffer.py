@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class RolloutBuffer(object):
+    def __init__(self, encoder_batchs, nepisode):
+        """ Preallocated trajectories of one PPO update.
+
+        Every encoder batch of the environment gets its own segment of nepisode * batch_size
+        trajectories, so batches of graphs with different task numbers still have fixed shape arrays.
+        The Runner writes each sampled episode into its rows of the segment and the minibatches are
+        views of the segments, nothing is copied between sampling and training. In batches of graphs
+        with different task numbers the masks are 0 in the padded steps after the last task.
+        """
+        self.nepisode = nepisode
+        self.segments = []
+
+        for encoder_batch in encoder_batchs:
+            batch_size, sequence_length, input_dim = np.shape(encoder_batch)
+            size = nepisode * batch_size
+            self.segments.append(dict(
+                encoder_input=np.zeros((size, sequence_length, input_dim), dtype=np.float32),
+                encoder_length=np.zeros(size, dtype=np.int32),
+                decoder_input=np.zeros((size, sequence_length), dtype=np.int32),
+                decoder_target=np.zeros((size, sequence_length), dtype=np.int32),
+                decoder_full_length=np.zeros(size, dtype=np.int32),
+                values=np.zeros((size, sequence_length), dtype=np.float32),
+                neglogpacs=np.zeros((size, sequence_length), dtype=np.float32),
+                rewards=np.zeros((size, sequence_length), dtype=np.float32),
+                masks=np.zeros((size, sequence_length), dtype=np.float32),
+                returns=np.zeros((size, sequence_length), dtype=np.float32),
+                advs=np.zeros((size, sequence_length), dtype=np.float32)))
+
+    def fits(self, encoder_batchs):
+        """ Whether the segments have the shapes of nepisode episodes of encoder_batchs. """
+        return self.shapes() == [(self.nepisode * np.shape(encoder_batch)[0],) + np.shape(encoder_batch)[1:]
+                                 for encoder_batch in encoder_batchs]
+
+    def episode(self, segment_index, episode_index):
+        """ Views of the rows of one sampled episode of a segment, to be written in place. """
+        segment = self.segments[segment_index]
+        batch_size = len(segment['encoder_length']) // self.nepisode
+        rows = slice(episode_index * batch_size, (episode_index + 1) * batch_size)
+
+        return {key: array[rows] for key, array in segment.items()}
+
+    def iterate_once(self, batch_size):
+        """ Minibatches of about batch_size trajectories in sampling order, as views of the buffer.
+
+        A minibatch never spans two segments, as the segments differ in sequence length. Every segment
+        is split into round(size / batch_size) contiguous minibatches of (nearly) equal size, at least
+        one, so every trajectory is trained on once, also in the small segments of the length bucketed
+        batches. A segment of a multiple of batch_size trajectories is split as by Dataset.iterate_once.
+        """
+        for segment in self.segments:
+            size = len(segment['encoder_length'])
+            minibatch_number = max(1, int(round(size / float(batch_size))))
+            bounds = [size * i // minibatch_number for i in range(minibatch_number + 1)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                yield {key: array[start:end] for key, array in segment.items()}
+
+    def iterate_splits(self, minibatch_number):
+        """ Every segment split into minibatch_number contiguous minibatches of (nearly) equal size,
+        as views of the buffer.
+
+        With one shard of the graphs per MPI rank the segments differ in size between ranks, but all
+        the ranks run the same number of training steps, as the allreduce of the gradients needs.
+        """
+        for segment in self.segments:
+            size = len(segment['encoder_length'])
+            bounds = [size * i // minibatch_number for i in range(minibatch_number + 1)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                yield {key: array[start:end] for key, array in segment.items()}
+
+    def episode_rewards(self):
+        return np.concatenate([segment['rewards'].sum(axis=-1, dtype=np.float64) for segment in self.segments])
+
+    def mean_episode_reward(self):
+        return np.mean(self.episode_rewards())
+
+    def padding_efficiency(self):
+        """ The fraction of the decoder steps of the trajectories which are not padding. """
+        return sum(segment['masks'].sum(dtype=np.float64) for segment in self.segments) / \
+               sum(segment['masks'].size for segment in self.segments)
+
+    def shapes(self):
+        return [segment['encoder_input'].shape for segment in self.segments]
@@ -0,0 +1,53 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+Process pool computing the rewards of sampled episodes while the decoder samples the next ones.
+
+Every worker holds its own copy of the environment, sent once when the pool starts. The workers
+are spawned rather than forked, so they do not inherit the TensorFlow session and only import the
+environment modules.
+"""
+
+_rollout_env = None
+_rollout_graphs = None
+
+
+def _init_rollout_worker(env):
+    global _rollout_env, _rollout_graphs
+    _rollout_env = env
+    # the graphs in the flat order of env.task_graphs, see LengthBucketedBatchSampler.graph_indices.
+    _rollout_graphs = [task_graph for task_graph_batch in env.task_graphs for task_graph in task_graph_batch]
+
+
+def _step_rewards(batch_index, action_sequence_batch):
+    env = _rollout_env
+    return env.step(action_sequence_batch=action_sequence_batch,
+                    task_graph_batch=env.task_graphs[batch_index],
+                    max_running_time_batch=env.max_running_time_batchs[batch_index],
+                    min_running_time_batch=env.min_running_time_batchs[batch_index])
+
+
+def _step_graph_rewards(graph_indices, action_sequence_batch):
+    env = _rollout_env
+    task_graph_batch = [_rollout_graphs[graph_index] for graph_index in graph_indices]
+    return env.step(action_sequence_batch=action_sequence_batch, task_graph_batch=task_graph_batch,
+                    max_running_time_batch=None, min_running_time_batch=None)
+
+
+class RolloutWorkers(object):
+    def __init__(self, env, workers):
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_rollout_worker, initargs=(env,))
+
+    def submit(self, batch_index, action_sequence_batch):
+        """ Future of the rewards of the episodes on the batch_index-th graph batch of the environment. """
+        return self.executor.submit(_step_rewards, batch_index, action_sequence_batch)
+
+    def submit_graphs(self, graph_indices, action_sequence_batch):
+        """ Future of the rewards of the episodes on the graphs at graph_indices of the flat graph list. """
+        return self.executor.submit(_step_graph_rewards, graph_indices, action_sequence_batch)
+
+    def close(self):
+        self.executor.shutdown()
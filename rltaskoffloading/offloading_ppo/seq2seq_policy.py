@@ -9,6 +9,21 @@ from tensorflow.python.framework import ops
 from tensorflow.python.framework import dtypes
 
 from tensorflow.python.ops.distributions import categorical
+from tensorflow.python.util import nest
+
+
+def tile_batch(t, multiplier, batch_axis=0):
+    """ Repeat every entry along the batch axis of t multiplier times in a row.
+
+    Like tf.contrib.seq2seq.tile_batch, but the multiplier can be a scalar tensor.
+    """
+    t = ops.convert_to_tensor(t)
+    shape = tf.shape(t)
+    tiling = [1] * (t.shape.ndims + 1)
+    tiling[batch_axis + 1] = multiplier
+    tiled = tf.tile(tf.expand_dims(t, batch_axis + 1), tiling)
+    return tf.reshape(tiled, tf.concat([shape[:batch_axis], [shape[batch_axis] * multiplier],
+                                        shape[batch_axis + 1:]], axis=0))
 
 class FixedSequenceLearningSampleEmbedingHelper(tf.contrib.seq2seq.SampleEmbeddingHelper):
     def __init__(self, sequence_length, embedding, start_tokens, end_token, softmax_temperature=None, seed=None):
@@ -166,6 +181,30 @@ class Seq2seqPolicy(object):
 
             self.greedy_decoder_prediction = self.greedy_decoder_outputs.sample_id
 
+            # candidate_number sampled plans of every graph in one decoder call, on the encoder
+            # outputs tiled candidate_number times. The candidates of a graph are consecutive rows.
+            self.candidate_number = tf.placeholder_with_default(1, shape=[], name="candidate_number")
+            self.candidate_decoder_outputs, _ = self.create_decoder(hparams, self.encoder_outputs,
+                                                                    self.encoder_state, model="sample",
+                                                                    multiplier=self.candidate_number)
+            self.candidate_decoder_prediction = self.candidate_decoder_outputs.sample_id
+            self.candidate_decoder_logits = self.candidate_decoder_outputs.rnn_output
+            self.candidate_pi = tf.nn.softmax(self.candidate_decoder_logits)
+            self.candidate_q = tf.layers.dense(self.candidate_decoder_logits, self.n_features,
+                                               activation=None, reuse=tf.AUTO_REUSE, name="qvalue_layer")
+            self.candidate_vf = tf.reduce_sum(self.candidate_pi * self.candidate_q, axis=-1)
+            self.candidate_neglogp = tf.nn.softmax_cross_entropy_with_logits_v2(
+                labels=tf.one_hot(self.candidate_decoder_prediction, self.n_features, dtype=tf.float32),
+                logits=self.candidate_decoder_logits)
+
+            # beam search decoder, only built with a beam_width in the hparams.
+            self.beam_width = hparams.values().get("beam_width", 0)
+            if self.beam_width > 0:
+                self.beam_decoder_outputs, _ = self.create_decoder(hparams, self.encoder_outputs,
+                                                                   self.encoder_state, model="beam")
+                # the beams are sorted by their scores, the first one is the best.
+                self.beam_decoder_prediction = self.beam_decoder_outputs.predicted_ids[..., 0]
+
     def predict_training(self, sess, encoder_input_batch, decoder_input, decoder_full_length):
         return sess.run([self.decoder_prediction, self.pi],
                         feed_dict={
@@ -181,19 +220,41 @@ class Seq2seqPolicy(object):
                             self.decoder_full_length: decoder_full_length
                         })
 
-    def step(self, encoder_input_batch, decoder_full_length, encoder_lengths):
-        sess = tf.get_default_session()
+    def encode(self, encoder_input_batch, encoder_lengths):
+        """ The encoder outputs and state of a batch of graphs.
 
+        They can be passed as encoded to the decoding methods below, to decode the same batch
+        several times without running the encoder again.
+        """
+        sess = tf.get_default_session()
         if self.time_major == True:
             encoder_input_batch = np.swapaxes(encoder_input_batch, 0, 1)
 
+        return sess.run((self.encoder_outputs, self.encoder_state), feed_dict={
+                            self.encoder_inputs: encoder_input_batch,
+                            self.encoder_lengths: encoder_lengths
+                        })
+
+    def _decode_feed_dict(self, encoder_input_batch, encoder_lengths, decoder_full_length, encoded=None):
+        feed_dict = {self.encoder_lengths: encoder_lengths, self.decoder_full_length: decoder_full_length}
+        if encoded is None:
+            if self.time_major == True:
+                encoder_input_batch = np.swapaxes(encoder_input_batch, 0, 1)
+            feed_dict[self.encoder_inputs] = encoder_input_batch
+        else:
+            # the decoders start from the fed encoder outputs and state, the encoder is not run.
+            encoder_outputs, encoder_state = encoded
+            feed_dict[self.encoder_outputs] = encoder_outputs
+            for state_tensor, state in zip(nest.flatten(self.encoder_state), nest.flatten(encoder_state)):
+                feed_dict[state_tensor] = state
+        return feed_dict
+
+    def step(self, encoder_input_batch, decoder_full_length, encoder_lengths, encoded=None):
+        sess = tf.get_default_session()
+
         sample_decoder_prediction, sample_vf, sample_neglogp = sess.run(
             [self.sample_decoder_prediction, self.sample_vf, self.sample_neglogp],
-            feed_dict={
-                self.encoder_inputs: encoder_input_batch,
-                self.encoder_lengths: encoder_lengths,
-                self.decoder_full_length: decoder_full_length
-            })
+            feed_dict=self._decode_feed_dict(encoder_input_batch, encoder_lengths, decoder_full_length, encoded))
 
         if self.time_major == True:
             sample_decoder_prediction = np.array(sample_decoder_prediction).swapaxes(0,1)
@@ -202,22 +263,69 @@ class Seq2seqPolicy(object):
 
         return sample_decoder_prediction, sample_vf, sample_neglogp
 
-    def greedy_predict(self, encoder_input_batch, encoder_lengths, decoder_full_length):
+    def step_episodes(self, encoder_input_batch, decoder_full_length, encoder_lengths, episode_number,
+                      encoded=None):
+        """ episode_number sampled episodes of every graph in one tiled decoder call.
+
+        Returns the actions, values and neglogps as (episode_number, batch, max_length) arrays.
+        """
         sess = tf.get_default_session()
-        if self.time_major == True:
-            encoder_input_batch = np.swapaxes(encoder_input_batch, 0, 1)
+        feed_dict = self._decode_feed_dict(encoder_input_batch, encoder_lengths, decoder_full_length, encoded)
+        feed_dict[self.candidate_number] = episode_number
+
+        results = sess.run([self.candidate_decoder_prediction, self.candidate_vf, self.candidate_neglogp],
+                           feed_dict=feed_dict)
 
-        greedy_prediction = sess.run(self.greedy_decoder_prediction, feed_dict={
-                                        self.encoder_inputs: encoder_input_batch,
-                                        self.encoder_lengths: encoder_lengths,
-                                        self.decoder_full_length: decoder_full_length
-                                    })
+        episodes = []
+        for result in results:
+            result = np.array(result)
+            if self.time_major == True:
+                result = result.swapaxes(0, 1)
+            # the episodes of a graph are consecutive rows of the tiled batch.
+            result = result.reshape((len(decoder_full_length), episode_number, -1)).swapaxes(0, 1)
+            episodes.append(result)
+
+        return tuple(episodes)
+
+    def greedy_predict(self, encoder_input_batch, encoder_lengths, decoder_full_length, encoded=None):
+        sess = tf.get_default_session()
+
+        greedy_prediction = sess.run(self.greedy_decoder_prediction,
+                                     feed_dict=self._decode_feed_dict(encoder_input_batch, encoder_lengths,
+                                                                      decoder_full_length, encoded))
 
         if self.time_major == True:
             greedy_prediction = np.array(greedy_prediction).swapaxes(0,1)
 
         return greedy_prediction
 
+    def sample_candidates(self, encoder_input_batch, encoder_lengths, decoder_full_length, candidate_number,
+                          encoded=None):
+        """ candidate_number sampled plans of every graph, (batch, candidate_number, max_length). """
+        sess = tf.get_default_session()
+        feed_dict = self._decode_feed_dict(encoder_input_batch, encoder_lengths, decoder_full_length, encoded)
+        feed_dict[self.candidate_number] = candidate_number
+
+        candidate_prediction = np.array(sess.run(self.candidate_decoder_prediction, feed_dict=feed_dict))
+        if self.time_major == True:
+            candidate_prediction = candidate_prediction.swapaxes(0, 1)
+
+        return candidate_prediction.reshape((len(decoder_full_length), candidate_number, -1))
+
+    def beam_search_predict(self, encoder_input_batch, encoder_lengths, decoder_full_length, encoded=None):
+        if self.beam_width <= 0:
+            raise ValueError("The policy has no beam search decoder, set beam_width in the hparams")
+
+        sess = tf.get_default_session()
+        beam_prediction = sess.run(self.beam_decoder_prediction,
+                                   feed_dict=self._decode_feed_dict(encoder_input_batch, encoder_lengths,
+                                                                    decoder_full_length, encoded))
+
+        if self.time_major == True:
+            beam_prediction = np.array(beam_prediction).swapaxes(0, 1)
+
+        return beam_prediction
+
     def kl(self, other):
         a0 = self.decoder_logits - tf.reduce_max(self.decoder_logits, axis=-1, keepdims=True)
         a1 = other.decoder_logits - tf.reduce_max(other.decoder_logits, axis=-1, keepdims=True)
@@ -310,6 +418,7 @@ class Seq2seqPolicy(object):
                 forward_cell,
                 backward_cell,
                 inputs=self.encoder_embeddings,
+                sequence_length=self.encoder_lengths,
                 time_major=self.time_major,
                 swap_memory=True,
                 dtype=tf.float32)
@@ -328,33 +437,53 @@ class Seq2seqPolicy(object):
 
             return encoder_outputs, encoder_state
 
-    def create_decoder(self, hparams, encoder_outputs, encoder_state, model):
+    def create_decoder(self, hparams, encoder_outputs, encoder_state, model, multiplier=None):
+        # with a multiplier every graph of the batch is decoded multiplier times.
+        encoder_lengths = self.encoder_lengths
+        decoder_full_length = self.decoder_full_length
+        if multiplier is not None:
+            encoder_outputs = tile_batch(encoder_outputs, multiplier, batch_axis=1 if self.time_major else 0)
+            encoder_state = nest.map_structure(lambda state: tile_batch(state, multiplier), encoder_state)
+            encoder_lengths = tile_batch(encoder_lengths, multiplier)
+            decoder_full_length = tile_batch(decoder_full_length, multiplier)
+
+        # the beam search decoder keeps the beam_width hypotheses of every graph in the batch of its cell.
+        batch_size = tf.size(decoder_full_length)
+        if model == "beam":
+            encoder_outputs = tile_batch(encoder_outputs, self.beam_width, batch_axis=1 if self.time_major else 0)
+            encoder_state = nest.map_structure(lambda state: tile_batch(state, self.beam_width), encoder_state)
+            encoder_lengths = tile_batch(encoder_lengths, self.beam_width)
+            batch_size = batch_size * self.beam_width
+
         with tf.variable_scope("decoder", reuse=tf.AUTO_REUSE) as decoder_scope:
             if model == "greedy":
                 helper = tf.contrib.seq2seq.GreedyEmbeddingHelper(
                     self.embeddings,
                     # Batchsize * Start_token
-                    start_tokens=tf.fill([tf.size(self.decoder_full_length)], self.start_token),
+                    start_tokens=tf.fill([tf.size(decoder_full_length)], self.start_token),
                     end_token=self.end_token
                 )
 
             elif model == "sample":
                 helper = FixedSequenceLearningSampleEmbedingHelper(
-                    sequence_length=self.decoder_full_length,
+                    sequence_length=decoder_full_length,
                     embedding=self.embeddings,
-                    start_tokens=tf.fill([tf.size(self.decoder_full_length)], self.start_token),
+                    start_tokens=tf.fill([tf.size(decoder_full_length)], self.start_token),
                     end_token=self.end_token
                 )
 
+            elif model == "beam":
+                helper = None
+
             elif model == "train":
                 helper = tf.contrib.seq2seq.TrainingHelper(
                     self.decoder_embeddings,
-                    self.decoder_full_length,
+                    decoder_full_length,
                     time_major=self.time_major)
             else:
                 helper = tf.contrib.seq2seq.TrainingHelper(
                     self.decoder_embeddings,
-                    self.decoder_full_length,
+                    decoder_full_length,
                     time_major=self.time_major)
 
             if self.is_attention:
@@ -370,15 +499,17 @@ class Seq2seqPolicy(object):
 
                 print("decoder hidden unit: ",self.decoder_hidden_unit)
                 print("attention states: ", attention_states.shape)
+                # padded steps of shorter graphs in the batch are not attended.
                 attention_mechanism = tf.contrib.seq2seq.LuongAttention(
-                    self.decoder_hidden_unit, attention_states)
+                    self.decoder_hidden_unit, attention_states,
+                    memory_sequence_length=encoder_lengths)
 
                 decoder_cell = tf.contrib.seq2seq.AttentionWrapper(
                     decoder_cell, attention_mechanism,
                     attention_layer_size=self.decoder_hidden_unit)
 
                 decoder_initial_state = (
-                    decoder_cell.zero_state(tf.size(self.decoder_full_length),
+                    decoder_cell.zero_state(batch_size,
                                             dtype=tf.float32).clone(
                         cell_state=encoder_state))
                 print("decoder_initial_state is:", decoder_initial_state)
@@ -390,15 +521,25 @@ class Seq2seqPolicy(object):
 
                 decoder_initial_state = encoder_state
 
-            decoder = tf.contrib.seq2seq.BasicDecoder(
-                cell=decoder_cell,
-                helper=helper,
-                initial_state=decoder_initial_state,
-                output_layer=self.output_layer)
+            if model == "beam":
+                decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+                    cell=decoder_cell,
+                    embedding=self.embeddings,
+                    start_tokens=tf.fill([tf.size(decoder_full_length)], self.start_token),
+                    end_token=self.end_token,
+                    initial_state=decoder_initial_state,
+                    beam_width=self.beam_width,
+                    output_layer=self.output_layer)
+            else:
+                decoder = tf.contrib.seq2seq.BasicDecoder(
+                    cell=decoder_cell,
+                    helper=helper,
+                    initial_state=decoder_initial_state,
+                    output_layer=self.output_layer)
 
             outputs, last_state, _ = tf.contrib.seq2seq.dynamic_decode(decoder,
                                                                        output_time_major=self.time_major,
-                                                                       maximum_iterations=self.decoder_full_length[0])
+                                                                       maximum_iterations=tf.reduce_max(self.decoder_full_length))
         return outputs, last_state
 
     def get_variables(self):
@@ -0,0 +1,47 @@
+import numpy as np
+
+from rltaskoffloading.common.advantage_util import gae_advantages, value_targets
+
+
+def baseline_advantages_and_returns(rewards, values, gamma, lam):
+    """ The per step loop of the original PPO runner. """
+    batch_size, time_length = values.shape
+    vpred_batch = np.column_stack((values, np.zeros(batch_size, dtype=float)))
+    last_gae_lam = np.zeros(batch_size, dtype=float)
+    advs = np.zeros_like(values)
+    returns = np.zeros_like(values)
+    for t in reversed(range(time_length)):
+        delta = rewards[:, t] + gamma * vpred_batch[:, t + 1] - vpred_batch[:, t]
+        advs[:, t] = last_gae_lam = delta + gamma * lam * last_gae_lam
+        returns[:, t] = vpred_batch[:, t + 1] + advs[:, t]
+    return advs, returns
+
+
+def test_value_targets_match_runner_loop():
+    rng = np.random.RandomState(0)
+    rewards = rng.rand(8, 12)
+    values = rng.rand(8, 12)
+
+    advs, returns = baseline_advantages_and_returns(rewards, values, gamma=0.99, lam=0.95)
+    advantages = gae_advantages(rewards, values, gamma=0.99, lam=0.95)
+
+    assert np.allclose(advantages, advs)
+    assert np.allclose(value_targets(advantages, values), returns)
+
+
+def test_masked_value_targets_match_unpadded_episodes():
+    rng = np.random.RandomState(1)
+    lengths = np.array([3, 7, 12])
+    rewards = rng.rand(3, 12)
+    values = rng.rand(3, 12)
+    masks = (np.arange(12) < lengths[:, np.newaxis]).astype(np.float32)
+
+    advantages = gae_advantages(rewards * masks, values, gamma=0.99, lam=0.95, masks=masks)
+    returns = value_targets(advantages, values, masks=masks)
+
+    for i, length in enumerate(lengths):
+        advs, episode_returns = baseline_advantages_and_returns(rewards[i:i + 1, :length], values[i:i + 1, :length],
+                                                                gamma=0.99, lam=0.95)
+        assert np.allclose(advantages[i, :length], advs[0])
+        assert np.allclose(returns[i, :length], episode_returns[0])
+        assert not returns[i, length:].any()
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from rltaskoffloading.environment.offloading_env import OffloadingEnvironment, Resources
+from rltaskoffloading.environment.offloading_batch_simulator import simulate_task_graph_batch
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'rltaskoffloading', 'offloading_data')
+
+
+def make_env(task_numbers, graph_number=4):
+    resource_cluster = Resources(mec_process_capable=(10.0 * 1024 * 1024),
+                                 mobile_process_capable=(1.0 * 1024 * 1024), bandwith_up=7.0, bandwith_dl=7.0)
+    graph_file_paths = [os.path.join(DATA_PATH, 'offload_random{}_test'.format(task_number),
+                                     'random.{}.'.format(task_number)) for task_number in task_numbers]
+    return OffloadingEnvironment(resource_cluster=resource_cluster, batch_size=graph_number,
+                                 graph_number=graph_number, graph_file_paths=graph_file_paths, time_major=False)
+
+
+def check_batch(env, task_graph_batch, rng):
+    task_number = max(task_graph.task_number for task_graph in task_graph_batch)
+    action_batch = rng.randint(0, 2, size=(len(task_graph_batch), task_number))
+    cost_tables = [env.get_cost_table(task_graph) for task_graph in task_graph_batch]
+
+    latency, energy, finish_time, total_energy = simulate_task_graph_batch(action_batch, task_graph_batch, cost_tables)
+
+    for i, task_graph in enumerate(task_graph_batch):
+        n = task_graph.task_number
+        plan = list(zip(task_graph.prioritize_sequence, action_batch[i, :n]))
+        step_latency, step_energy, step_finish_time, step_total_energy = \
+            env.get_scheduling_cost_step_by_step(plan, task_graph)
+
+        assert np.allclose(latency[i, :n], step_latency)
+        assert np.allclose(energy[i, :n], step_energy)
+        assert np.isclose(finish_time[i], step_finish_time)
+        assert np.isclose(total_energy[i], step_total_energy)
+        # the padded steps of the smaller graphs cost nothing.
+        assert not latency[i, n:].any()
+        assert not energy[i, n:].any()
+
+
+def test_batch_simulator_matches_step_by_step():
+    rng = np.random.RandomState(0)
+    env = make_env([10])
+    for _ in range(5):
+        check_batch(env, env.task_graphs[0], rng)
+
+
+def test_batch_simulator_matches_step_by_step_on_mixed_sizes():
+    rng = np.random.RandomState(1)
+    env = make_env([10, 15, 20])
+    task_graph_batch = [task_graph for task_graph_batch in env.task_graphs for task_graph in task_graph_batch]
+    for _ in range(5):
+        rng.shuffle(task_graph_batch)
+        check_batch(env, task_graph_batch, rng)
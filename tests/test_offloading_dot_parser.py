@@ -0,0 +1,57 @@
+import glob
+import io
+import os
+
+import numpy as np
+import pytest
+
+from rltaskoffloading.environment.offloading_task_graph import OffloadingDotParser
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'rltaskoffloading', 'offloading_data')
+
+
+class PydotplusDotParser(OffloadingDotParser):
+    """ The parser with the line parser switched off, so every file goes through pydotplus. """
+
+    def _parse_daggen_lines(self, lines):
+        return False
+
+
+def assert_same_graph(parser, expected):
+    assert [task.id_name for task in parser.task_list] == [task.id_name for task in expected.task_list]
+    assert [task.processing_data_size for task in parser.task_list] == \
+           [task.processing_data_size for task in expected.task_list]
+    assert [task.transmission_data_size for task in parser.task_list] == \
+           [task.transmission_data_size for task in expected.task_list]
+    assert [task.depth for task in parser.task_list] == [task.depth for task in expected.task_list]
+    assert parser.dependencies == expected.dependencies
+    assert parser.pre_task_for_ids == expected.pre_task_for_ids
+    assert parser.succ_task_for_ids == expected.succ_task_for_ids
+    assert np.array_equal(parser.dependency_matrix, expected.dependency_matrix)
+
+
+@pytest.mark.parametrize("task_number", [10, 25, 50])
+def test_line_parser_matches_pydotplus(task_number):
+    graph_files = sorted(glob.glob(os.path.join(DATA_PATH, 'offload_random{}'.format(task_number), '*.gv')))[:5]
+    assert graph_files
+    for graph_file in graph_files:
+        parser = OffloadingDotParser(graph_file, is_matrix=False)
+        # the daggen files never fall back to pydotplus.
+        assert not hasattr(parser, 'dot_ob')
+        assert_same_graph(parser, PydotplusDotParser(graph_file, is_matrix=False))
+
+
+def test_other_dot_falls_back_to_pydotplus():
+    # two statements on one line and unquoted attributes are not daggen lines.
+    dot_data = 'digraph G {\n1 [size=10, expect_size=5]; 2 [size="20", expect_size="8"]\n' \
+               '1 -> 2 [size=3]\n}\n'
+    parser = OffloadingDotParser(io.StringIO(dot_data), is_matrix=False)
+    assert hasattr(parser, 'dot_ob')
+    assert_same_graph(parser, PydotplusDotParser(io.StringIO(dot_data), is_matrix=False))
+    assert parser.dependencies == [[0, 1, 3]]
+
+
+def test_not_a_dot_graph():
+    with pytest.raises(ValueError):
+        OffloadingDotParser(io.StringIO('not a graph'), is_matrix=False)
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pytest
+
+from rltaskoffloading.environment.offloading_env import OffloadingEnvironment, Resources
+from rltaskoffloading.environment.offloading_optimal_solver import OptimalPlanSolver, QoEObjective, \
+    makespan_objective, energy_objective
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'rltaskoffloading', 'offloading_data')
+
+
+def make_env(task_number, graph_number=3):
+    resource_cluster = Resources(mec_process_capable=(10.0 * 1024 * 1024),
+                                 mobile_process_capable=(1.0 * 1024 * 1024), bandwith_up=7.0, bandwith_dl=7.0)
+    graph_file_path = os.path.join(DATA_PATH, 'offload_random{}_test'.format(task_number),
+                                   'random.{}.'.format(task_number))
+    return OffloadingEnvironment(resource_cluster=resource_cluster, batch_size=graph_number,
+                                 graph_number=graph_number, graph_file_paths=[graph_file_path],
+                                 time_major=False, lambda_t=0.5, lambda_e=0.5)
+
+
+@pytest.mark.parametrize("task_number", [10, 15])
+def test_branch_and_bound_matches_exhaustion(task_number):
+    env = make_env(task_number)
+    for task_graph in env.task_graphs[0]:
+        all_local_time, all_local_energy = env.get_all_local_cost_for_one_graph(task_graph)
+        qoe_objective = QoEObjective(0.5, 0.5, all_local_time, all_local_energy)
+        objectives = [(makespan_objective, (1.0, 0.0)), (energy_objective, (0.0, 1.0)),
+                      (qoe_objective, qoe_objective.weights)]
+
+        plan_solver = OptimalPlanSolver(task_graph, env.get_cost_table(task_graph))
+        exhausted = plan_solver.exhaust([objective for objective, weights in objectives])
+        for (objective, weights), (_, value, _, _) in zip(objectives, exhausted):
+            for bound_weights in (None, weights):
+                plan, bound_value, makespan, energy = plan_solver.branch_and_bound(objective, bound_weights)
+                assert np.isclose(bound_value, value)
+                assert np.isclose(objective(makespan, energy), bound_value)
+                assert len(plan) == task_number
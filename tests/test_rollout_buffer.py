@@ -0,0 +1,53 @@
+import types
+
+import numpy as np
+
+from rltaskoffloading.environment.offloading_batch_sampler import LengthBucketedBatchSampler
+from rltaskoffloading.offloading_ppo.rollout_buffer import RolloutBuffer
+
+
+def make_env(task_numbers, graph_number, input_dim=3):
+    """ The attributes of an OffloadingEnvironment the sampler reads, graph_number graphs per task number. """
+    env = types.SimpleNamespace(task_graphs=[], encoder_batchs=[], encoder_lengths=[],
+                                max_running_time_batchs=[], min_running_time_batchs=[])
+    for task_number in task_numbers:
+        env.task_graphs.append([object() for _ in range(graph_number)])
+        env.encoder_batchs.append(np.ones((graph_number, task_number, input_dim), dtype=np.float32))
+        env.encoder_lengths.append(np.full(graph_number, task_number))
+        env.max_running_time_batchs.append([1.0] * graph_number)
+        env.min_running_time_batchs.append([0.0] * graph_number)
+    return env
+
+
+def trained_rows(buffer, batch_size):
+    """ The row ids of every trajectory of the buffer in the minibatches of iterate_once. """
+    # tag every row of every segment with a unique id.
+    next_id = 0
+    for segment in buffer.segments:
+        size = len(segment['encoder_length'])
+        segment['values'][:] = np.arange(next_id, next_id + size)[:, np.newaxis]
+        next_id += size
+
+    rows = [batch['values'][:, 0] for batch in buffer.iterate_once(batch_size)]
+    return next_id, np.concatenate(rows).astype(np.int64)
+
+
+def test_iterate_once_trains_every_row_of_sampled_batches():
+    env = make_env(task_numbers=[15, 50], graph_number=500)
+    nepisode = 10
+    optbatchnumber = 500
+
+    for token_budget in [2000, 5000]:
+        sampler = LengthBucketedBatchSampler(env, token_budget=token_budget)
+        buffer = RolloutBuffer(sampler.encoder_batchs, nepisode)
+        # some segments are smaller than a minibatch or not a multiple of it.
+        assert any(size % optbatchnumber for size, _, _ in buffer.shapes())
+
+        row_number, rows = trained_rows(buffer, optbatchnumber)
+        assert np.array_equal(np.sort(rows), np.arange(row_number))
+
+
+def test_iterate_once_splits_full_segments_like_dataset():
+    buffer = RolloutBuffer([np.zeros((500, 10, 3))], nepisode=10)
+    sizes = [len(batch['encoder_length']) for batch in buffer.iterate_once(500)]
+    assert sizes == [500] * 10
@@ -0,0 +1,51 @@
+import numpy as np
+
+from rltaskoffloading.common.segment_tree import SumSegmentTree
+
+
+def test_find_prefixsum_idx_matches_searchsorted():
+    rng = np.random.RandomState(0)
+    for capacity in (1, 5, 64, 100):
+        priorities = rng.rand(capacity)
+        # empty leaves are never found.
+        priorities[rng.rand(capacity) < 0.3] = 0.0
+        priorities[-1] = max(priorities[-1], 0.1)
+
+        tree = SumSegmentTree(capacity)
+        tree[np.arange(capacity)] = priorities
+        assert np.isclose(tree.sum(), priorities.sum())
+
+        prefixsum = rng.rand(1000) * tree.sum()
+        expected = np.searchsorted(np.cumsum(priorities), prefixsum, side='right')
+        assert np.array_equal(tree.find_prefixsum_idx(prefixsum), expected)
+
+
+def test_find_prefixsum_idx_at_the_boundaries():
+    # integer priorities keep the prefix sums exact, a prefix sum on a boundary goes to the next leaf.
+    priorities = np.array([2.0, 0.0, 3.0, 1.0, 0.0, 4.0])
+    tree = SumSegmentTree(len(priorities))
+    tree[np.arange(len(priorities))] = priorities
+
+    prefixsum = np.arange(0.0, tree.sum())
+    expected = np.searchsorted(np.cumsum(priorities), prefixsum, side='right')
+    assert np.array_equal(tree.find_prefixsum_idx(prefixsum), expected)
+    assert list(tree.find_prefixsum_idx(prefixsum)) == [0, 0, 2, 2, 2, 3, 5, 5, 5, 5]
+
+
+def test_setitem_updates_the_sums():
+    rng = np.random.RandomState(1)
+    priorities = np.zeros(37)
+    tree = SumSegmentTree(37)
+    for _ in range(20):
+        idxes = rng.randint(0, 37, size=8)
+        values = rng.rand(8)
+        tree[idxes] = values
+        # of repeated indices the last value is kept.
+        for idx, value in zip(idxes, values):
+            priorities[idx] = value
+
+        assert np.allclose(tree[np.arange(37)], priorities)
+        assert np.isclose(tree.sum(), priorities.sum())
+        prefixsum = rng.rand(100) * tree.sum()
+        assert np.array_equal(tree.find_prefixsum_idx(prefixsum),
+                              np.searchsorted(np.cumsum(priorities), prefixsum, side='right'))
@@ -0,0 +1,86 @@
+import numpy as np
+
+from rltaskoffloading.offloading_ddqn.seq2seq_replay_buffer import SeqReplayBuffer
+
+
+def make_batch(first_id, batch_size, lengths, max_length=None):
+    """ A batch of sequences whose every step holds the id of its sequence, first_id, first_id + 1, ... """
+    lengths = np.asarray(lengths)
+    time_length = max_length or lengths.max()
+    ids = np.arange(first_id, first_id + batch_size, dtype=np.float64)
+    steps = np.repeat(ids[:, np.newaxis], time_length, axis=1)
+    return [steps[:, :, np.newaxis] * np.ones(3), steps.astype(np.int32), steps, lengths,
+            steps.astype(np.int32), steps, steps, steps]
+
+
+def stored_ids(replay_buffer):
+    return replay_buffer._storage[2][:replay_buffer.size(), 0]
+
+
+def test_ring_wraps_around():
+    replay_buffer = SeqReplayBuffer(size=10)
+    idxes = replay_buffer.add_batch(*make_batch(0, 4, [5] * 4))
+    assert list(idxes) == [0, 1, 2, 3]
+    replay_buffer.add_batch(*make_batch(4, 4, [5] * 4))
+    idxes = replay_buffer.add_batch(*make_batch(8, 4, [5] * 4))
+
+    # the last batch fills the two free rows and overwrites the two oldest sequences.
+    assert list(idxes) == [8, 9, 0, 1]
+    assert replay_buffer.size() == 10
+    assert list(stored_ids(replay_buffer)) == [10, 11, 2, 3, 4, 5, 6, 7, 8, 9]
+
+    # of a batch larger than the buffer only its last sequences are kept, in the order of the ring.
+    idxes = replay_buffer.add_batch(*make_batch(100, 13, [5] * 13))
+    assert len(idxes) == 10
+    assert replay_buffer.size() == 10
+    assert sorted(stored_ids(replay_buffer)) == list(range(103, 113))
+    assert stored_ids(replay_buffer)[(idxes[-1] + 1) % 10] == 103
+
+    replay_buffer.add(*[field[0] for field in make_batch(200, 1, [5])])
+    assert stored_ids(replay_buffer)[(idxes[-1] + 1) % 10] == 200
+
+
+def test_gather_cuts_to_the_longest_sequence_with_masks():
+    replay_buffer = SeqReplayBuffer(size=8, max_length=6)
+    replay_buffer.add_batch(*make_batch(0, 3, [2, 4, 3], max_length=4))
+    replay_buffer.add_batch(*make_batch(3, 2, [6, 1], max_length=6))
+
+    fields = replay_buffer._gather(np.array([0, 2, 1]))
+    observation, decoder_full_length, reward, masks = fields[0], fields[3], fields[6], fields[8]
+    assert list(decoder_full_length) == [2, 3, 4]
+    assert observation.shape == (3, 4, 3)
+    assert reward.shape == (3, 4)
+    assert np.array_equal(masks, [[1, 1, 0, 0], [1, 1, 1, 0], [1, 1, 1, 1]])
+    assert masks.dtype == np.float32
+    assert np.array_equal(reward[:, 0], [0, 2, 1])
+
+    # the shorter batch is padded with zeros up to max_length.
+    fields = replay_buffer._gather(np.array([3, 1, 4]))
+    reward, masks = fields[6], fields[8]
+    assert reward.shape == (3, 6)
+    assert np.array_equal(masks.sum(axis=1), [6, 4, 1])
+    assert np.array_equal(reward[1], [1, 1, 1, 1, 0, 0])
+
+
+def test_random_sample_bucket_mixing():
+    np.random.seed(0)
+    replay_buffer = SeqReplayBuffer(size=40, max_length=8)
+    for first_id, length in ((0, 3), (10, 5), (20, 8), (30, 6)):
+        replay_buffer.add_batch(*make_batch(first_id, 10, [length] * 10, max_length=length))
+
+    for _ in range(20):
+        fields = replay_buffer.random_sample(16, bucket_mixing=0.0)
+        decoder_full_length, masks = fields[3], fields[8]
+        assert len(set(decoder_full_length)) == 1
+        assert masks.all()
+
+
+def test_none_fields_are_sampled_as_none():
+    replay_buffer = SeqReplayBuffer(size=4)
+    batch = make_batch(0, 3, [5] * 3)
+    batch[7] = None
+    replay_buffer.add_batch(*batch)
+
+    fields = replay_buffer.random_sample(5)
+    assert fields[7] is None
+    assert fields[6].shape == (5, 5)
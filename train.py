@@ -35,43 +35,79 @@ def train(args):
             if args.goal == "LO":
                 DDQNTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath=logpath, encode_dependencies=args.dependency,
                               train_graph_file_paths = graph_paths_train_for_number,
-                              test_graph_file_paths= graph_paths_test_for_number)
+                              test_graph_file_paths= graph_paths_test_for_number,
+                              prioritized_replay=args.prioritized_replay,
+                              shared_replay=args.shared_replay,
+                              bucket_mixing=args.bucket_mixing,
+                              deferred_target=args.deferred_target,
+                              replay_path=args.replay_path)
             elif args.goal == "EE":
                 DDQNTO_number(lambda_t=0.5, lambda_e=0.5, logpath=logpath, encode_dependencies=args.dependency,
                               train_graph_file_paths=graph_paths_train_for_number,
-                              test_graph_file_paths=graph_paths_test_for_number)
+                              test_graph_file_paths=graph_paths_test_for_number,
+                              prioritized_replay=args.prioritized_replay,
+                              shared_replay=args.shared_replay,
+                              bucket_mixing=args.bucket_mixing,
+                              deferred_target=args.deferred_target,
+                              replay_path=args.replay_path)
         if args.scenario == "Trans":
             if args.goal == "LO":
                 DDQNTO_trans(lambda_t = 1.0, lambda_e = 0.0, logpath=logpath, encode_dependencies=args.dependency,
                              train_graph_file_paths=graph_paths_train_for_trans,
                              test_graph_file_paths=graph_paths_test_for_trans,
-                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0])
+                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],
+                             prioritized_replay=args.prioritized_replay,
+                             shared_replay=args.shared_replay,
+                             bucket_mixing=args.bucket_mixing,
+                             deferred_target=args.deferred_target,
+                             replay_path=args.replay_path)
             elif args.goal == "EE":
                 DDQNTO_trans(lambda_t=0.5, lambda_e=0.5, logpath=logpath, encode_dependencies=args.dependency,
                              train_graph_file_paths=graph_paths_train_for_trans,
                              test_graph_file_paths=graph_paths_test_for_trans,
-                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0])
+                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],
+                             prioritized_replay=args.prioritized_replay,
+                             shared_replay=args.shared_replay,
+                             bucket_mixing=args.bucket_mixing,
+                             deferred_target=args.deferred_target,
+                             replay_path=args.replay_path)
     elif args.algo == "DRLTO":
         if args.scenario == "Number":
             if args.goal == "LO":
                 DRLTO_number(lambda_t = 1.0, lambda_e = 0.0, logpath=logpath, encode_dependencies=args.dependency,
                               train_graph_file_paths = graph_paths_train_for_number,
-                              test_graph_file_paths= graph_paths_test_for_number)
+                              test_graph_file_paths= graph_paths_test_for_number,
+                              rollout_workers=args.rollout_workers,
+                              mix_graph_sizes=args.mix_graph_sizes,
+                              token_budget=args.token_budget,
+                              eval_interval=args.eval_interval,
+                              background_eval=args.background_eval)
             elif args.goal == "EE":
                 DRLTO_number(lambda_t=0.5, lambda_e=0.5, logpath=logpath, encode_dependencies=args.dependency,
                              train_graph_file_paths=graph_paths_train_for_number,
-                             test_graph_file_paths=graph_paths_test_for_number)
+                             test_graph_file_paths=graph_paths_test_for_number,
+                             rollout_workers=args.rollout_workers,
+                             mix_graph_sizes=args.mix_graph_sizes,
+                             token_budget=args.token_budget,
+                             eval_interval=args.eval_interval,
+                             background_eval=args.background_eval)
         if args.scenario == "Trans":
             if args.goal == "LO":
                 DRLTO_trans(lambda_t=1.0, lambda_e=0.0, logpath=logpath, encode_dependencies=args.dependency,
                              train_graph_file_paths=graph_paths_train_for_trans,
                              test_graph_file_paths=graph_paths_test_for_trans,
-                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0])
+                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],
+                             rollout_workers=args.rollout_workers,
+                             eval_interval=args.eval_interval,
+                             background_eval=args.background_eval)
             elif args.goal == "EE":
                 DRLTO_trans(lambda_t=0.5, lambda_e=0.5, logpath=logpath, encode_dependencies=args.dependency,
                              train_graph_file_paths=graph_paths_train_for_trans,
                              test_graph_file_paths=graph_paths_test_for_trans,
-                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0])
+                             bandwidths=[3.0, 7.0, 11.0, 15.0, 19.0],
+                             rollout_workers=args.rollout_workers,
+                             eval_interval=args.eval_interval,
+                             background_eval=args.background_eval)
     else:
         raise Exception("No defined algorithm")
 
@@ -83,6 +119,16 @@ if __name__ == "__main__":
     parser.add_argument("--goal", type=str, default="EE", choices=["EE", "LO"])
     parser.add_argument("--logpath", type=str, default="./log/Result")
     parser.add_argument("--dependency", type=bool, default=True)
+    parser.add_argument("--rollout_workers", type=int, default=1)
+    parser.add_argument("--mix_graph_sizes", action="store_true")
+    parser.add_argument("--token_budget", type=int, default=None)
+    parser.add_argument("--eval_interval", type=int, default=1)
+    parser.add_argument("--background_eval", action="store_true")
+    parser.add_argument("--prioritized_replay", action="store_true")
+    parser.add_argument("--shared_replay", action="store_true")
+    parser.add_argument("--bucket_mixing", type=float, default=1.0)
+    parser.add_argument("--deferred_target", action="store_true")
+    parser.add_argument("--replay_path", type=str, default=None)
     args = parser.parse_args()
 
     train(args)
\ No newline at end of file